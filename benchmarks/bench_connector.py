@@ -0,0 +1,105 @@
+"""Time from starting the connector until the tunnel is up, on the simulated desktop.
+
+Usage: python benchmarks/bench_connector.py [--update-baseline] [--tolerance 0.25] [--repeats 3] [--time-scale 1.0]
+
+Runs the whole login flow of vpn_kul.py headless against simulator.SimulatedBackend,
+which replays a login session from the corpus screenshots with realistic delays,
+and reports how long it took until Ivanti had the tunnel up and until the flow
+finished. The flow waits for the tunnel with a TCP probe on a local stand-in for a
+host behind the VPN, so it finishes after the tunnel came up. Exits with 1 when either p95 grew by more than the tolerance compared
+to connector_baseline.json. Every run starts from a fresh config, like a first run.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulator
+import vpn_kul
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "connector_baseline.json")
+
+def connect_once(time_scale):
+    """Seconds until the tunnel was up and until the flow finished for one simulated run"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            with open(vpn_kul.ENV_FILE, "w") as f:
+                f.write(f"USERNAME={simulator.DEFAULT_SESSION['username']}\n")
+            desktop = simulator.SimulatedBackend(time_scale=time_scale)
+            tunnel = simulator.TunnelStandIn(desktop)
+            vpn_kul.save_config({**vpn_kul.load_config(), "tunnel_probe": {"tcp": tunnel.target}})
+            with contextlib.redirect_stdout(io.StringIO()):
+                vpn_kul.main([], desktop)
+            finished = time.monotonic() - desktop.started_at
+            tunnel.close()
+        finally:
+            os.chdir(cwd)
+    connected = desktop.connected_after()
+    if connected is None:
+        raise RuntimeError("The simulated tunnel never came up")
+    return connected, finished
+
+def measure(repeats, time_scale):
+    runs = [connect_once(time_scale) for _ in range(repeats)]
+    report = {}
+    for name, values in zip(["connected", "finished"], zip(*runs)):
+        report[name] = {"p50_s": round(float(np.percentile(values, 50)), 3),
+                        "p95_s": round(float(np.percentile(values, 95)), 3)}
+    return report
+
+def regressions(report, baseline, tolerance):
+    problems = []
+    for name, result in report.items():
+        expected = baseline.get(name)
+        if expected and result["p95_s"] > expected["p95_s"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_s']:.2f} s > baseline {expected['p95_s']:.2f} s + {tolerance:.0%}")
+    return problems
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth, 0.25 is 25%%")
+    parser.add_argument("--repeats", type=int, default=3, help="simulated runs")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplies the delays of the simulated programs")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    report = measure(args.repeats, args.time_scale)
+    report["time_scale"] = args.time_scale
+
+    print(f"{args.repeats} simulated runs, delays x{args.time_scale:g}")
+    for name in ["connected", "finished"]:
+        print(f"{name:<10} p50 {report[name]['p50_s']:6.2f} s   p95 {report[name]['p95_s']:6.2f} s")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet, run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("time_scale") != args.time_scale:
+        print(f"Baseline was taken with delays x{baseline.get('time_scale')}, not comparing")
+        return 0
+    problems = regressions({name: report[name] for name in ["connected", "finished"]}, baseline, args.tolerance)
+    for problem in problems:
+        print("REGRESSION " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,105 @@
+"""Compare the connector's template matching strategies on recorded screenshots.
+
+Usage: python benchmarks/bench_matcher.py [screenshot.png | folder ...]
+
+Without arguments a synthetic 1920x1080 desktop with the Ivanti window pasted
+on it is used. The "locateOnScreen" strategy is the old confidence ladder on top
+of pyscreeze.locate, i.e. locateOnScreen minus the screen grab itself.
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_matcher
+import recognition
+import template_pack
+
+ASSETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets_connector")
+REPEATS = 5
+
+def synthetic_screenshot():
+    """Desktop-like frame with the Ivanti window on it, for when no recordings are given"""
+    rng = np.random.default_rng(0)
+    frame = np.full((1080, 1920, 3), 235, dtype=np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, 1800), rng.integers(0, 1000)
+        frame[y:y + rng.integers(10, 200), x:x + rng.integers(10, 300)] = rng.integers(0, 256, 3)
+    ivanti = np.asarray(Image.open(os.path.join(ASSETS_FOLDER, "A_zone.png")).convert("RGB"))
+    frame[240:240 + ivanti.shape[0], 1100:1100 + ivanti.shape[1]] = ivanti
+    return Image.fromarray(frame)
+
+def load_screenshots(paths):
+    """Yield (name, PIL image) for every PNG given directly or inside a given folder"""
+    if not paths:
+        yield "synthetic", synthetic_screenshot()
+        return
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.png"))) if os.path.isdir(path) else [path]
+        for file in files:
+            yield os.path.basename(file), Image.open(file).convert("RGB")
+
+def locate_ladder(screenshot, case):
+    """The pre-matcher code path: pyscreeze.locate per template and confidence level"""
+    import pyscreeze
+    names, confidences = case["ladder"]
+    for name in names:
+        for confidence in confidences:
+            try:
+                box = pyscreeze.locate(os.path.join(ASSETS_FOLDER, name), screenshot, confidence=confidence)
+            except pyscreeze.ImageNotFoundException:
+                continue
+            if box:
+                return name, int(box.left), int(box.top)
+    return None
+
+def matcher(pyramid):
+    def run(screenshot, case):
+        names, threshold = case["matcher"]
+        screen = np.asarray(screenshot.convert("L"))
+        templates = template_pack.load_templates(ASSETS_FOLDER, names)
+        masks = template_pack.load_masks(ASSETS_FOLDER, names)
+        match = image_matcher.find_best_match(templates, screen, threshold, pyramid=pyramid, masks=masks)
+        return (match.template, match.left, match.top) if match else None
+    return run
+
+STRATEGIES = {
+    "locateOnScreen": locate_ladder,
+    "full": matcher(1),
+    "pyramid/4": matcher(4),
+    "pyramid/8": matcher(8),
+}
+
+# Old ladder, and the matcher's templates and cutoff as the connector uses them
+CASES = {
+    "press_connect_button": {
+        "ladder": (["full_ivanti1.png", "full_ivanti2.png", "A_zone.png", "I_zone.png"], [0.99, 0.85, 0.7, 0.55]),
+        "matcher": (recognition.IVANTI_TEMPLATES, recognition.MATCH_THRESHOLDS["full_ivanti2.png"]),
+    },
+    "check_if_logged_in": {
+        "ladder": (recognition.LOGIN_TEMPLATES, [0.8]),
+        "matcher": (recognition.LOGIN_TEMPLATES, recognition.MATCH_THRESHOLDS["login_page_top1.png"]),
+    },
+}
+
+def main(paths):
+    print(f"{'screenshot':<24}{'case':<22}{'strategy':<16}{'median ms':>10}  result")
+    for screenshot_name, screenshot in load_screenshots(paths):
+        for case_name, case in CASES.items():
+            for strategy, run in STRATEGIES.items():
+                timings = []
+                for _ in range(REPEATS):
+                    start = time.perf_counter()
+                    result = run(screenshot, case)
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"{screenshot_name:<24}{case_name:<22}{strategy:<16}{statistics.median(timings):>10.1f}  {result}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,120 @@
+"""Latency and peak memory of the NumPy NCC engine against OpenCV's matchTemplate.
+
+Usage: python benchmarks/bench_ncc.py
+
+Each engine runs in its own process, so the peak resident memory of one does not
+hide the other. OpenCV is only needed for the comparison, not by the connector.
+On Windows the peak memory needs psutil, without it the column shows n/a.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_matcher
+import ncc
+import recognition
+import template_pack
+
+ASSETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets_connector")
+REPEATS = 5
+SCREENS = {"1920x1080": (1080, 1920), "3840x2160": (2160, 3840)}
+CASES = {
+    "ivanti": (recognition.IVANTI_TEMPLATES, True),
+    "login": (recognition.LOGIN_TEMPLATES, False),
+}
+
+def desktop(shape):
+    """Desktop-like frame with the Ivanti window on it"""
+    frame = np.full(shape, 235, dtype=np.uint8)
+    frame[100:400, 50:900] = np.random.default_rng(0).integers(0, 256, size=(300, 850))
+    ivanti = image_matcher.load_template(os.path.join(ASSETS_FOLDER, "A_zone.png"))
+    frame[240:240 + ivanti.shape[0], 1100:1100 + ivanti.shape[1]] = ivanti
+    return frame
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, None when it can not be read"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / 2**20
+
+def numpy_engine(screen, templates, masks):
+    correlator = ncc.Correlator(screen)
+    return [image_matcher.peak(correlator.ncc(template, masks[name])[0]) for name, template in templates.items()]
+
+def numpy_pyramid_engine(screen, templates, masks):
+    # What the connector runs: the NumPy engine behind the 1/4 coarse-to-fine search
+    return [(match.score, (match.left, match.top)) for match in image_matcher.score_templates(templates, screen, pyramid=4, masks=masks)]
+
+def opencv_engine(screen, templates, masks):
+    import cv2
+    scores = []
+    for name, template in templates.items():
+        if masks[name] is None:
+            result = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
+        else:
+            result = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED, mask=masks[name])
+        _, max_val, _, max_loc = cv2.minMaxLoc(np.nan_to_num(result, nan=-1.0, posinf=-1.0, neginf=-1.0))
+        scores.append((max_val, max_loc))
+    return scores
+
+ENGINES = {"numpy": numpy_engine, "numpy/4": numpy_pyramid_engine, "opencv": opencv_engine}
+
+def run_engine(engine, screen_name, case):
+    """Time one engine on one case, meant to run in a fresh process"""
+    names, masked = CASES[case]
+    screen = desktop(SCREENS[screen_name])
+    templates = template_pack.load_templates(ASSETS_FOLDER, names)
+    masks = template_pack.load_masks(ASSETS_FOLDER, names) if masked else dict.fromkeys(names)
+    baseline_rss = peak_rss_mb()
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        scores = ENGINES[engine](screen, templates, masks)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    peak_rss = peak_rss_mb()
+    return {
+        "median_ms": statistics.median(timings),
+        "peak_mb": None if peak_rss is None else peak_rss - baseline_rss,
+        "best": max(score for score, _ in scores),
+    }
+
+def main():
+    print(f"{'screen':<12}{'case':<10}{'engine':<10}{'median ms':>10}{'peak MB':>10}{'best':>8}")
+    for screen_name in SCREENS:
+        for case in CASES:
+            for engine in ENGINES:
+                output = subprocess.run([sys.executable, __file__, engine, screen_name, case],
+                                        capture_output=True, text=True)
+                if output.returncode:
+                    print(f"{screen_name:<12}{case:<10}{engine:<10}  failed: {output.stderr.strip().splitlines()[-1]}")
+                    continue
+                result = json.loads(output.stdout)
+                peak = "n/a" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+                print(f"{screen_name:<12}{case:<10}{engine:<10}{result['median_ms']:>10.1f}{peak:>10}{result['best']:>8.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        print(json.dumps(run_engine(*sys.argv[1:])))
+    else:
+        main()
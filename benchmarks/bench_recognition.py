@@ -0,0 +1,179 @@
+"""Accuracy, latency and memory of the connector's recognition over the screenshot corpus.
+
+Usage: python benchmarks/bench_recognition.py [--update-baseline] [--tolerance 0.5] [--repeats 5]
+
+Runs the logic of press_connect_button (find the Ivanti window) and
+check_if_logged_in (find the login page) on every screenshot in
+benchmarks/corpus, for each matcher strategy, offline and without a desktop.
+Reports accuracy, p50/p95 latency and peak traced memory, and exits with 1 when
+a strategy got less accurate than recognition_baseline.json or its p95 latency
+grew by more than the tolerance. Latency depends on the machine, so update the
+baseline on the machine the suite runs on, with --repeats 20: with fewer runs the
+p95 rests on a handful of timings and one slow run moves it.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import display_scale
+import image_matcher
+import recognition
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSETS_FOLDER = os.path.join(ROOT, "assets_connector")
+CORPUS_FOLDER = os.path.join(ROOT, "benchmarks", "corpus")
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "recognition_baseline.json")
+
+# Matcher settings per strategy, the connector's defaults for the rest
+STRATEGIES = {
+    "full": {"pyramid": 1},
+    "pyramid/4": {"pyramid": 4},
+    "pyramid/8": {"pyramid": 8},
+    "pyramid/4 + window rect": {"pyramid": 4, "window_rect": True},
+}
+# Overlap a found Ivanti window needs with the real one to count as correct
+MIN_OVERLAP = 0.8
+
+def load_corpus(folder=CORPUS_FOLDER):
+    """(manifest entry, grayscale screen) for every screenshot in the corpus"""
+    with open(os.path.join(folder, "manifest.json")) as f:
+        manifest = json.load(f)
+    for entry in manifest:
+        with Image.open(os.path.join(folder, entry["file"])) as image:
+            yield entry, np.asarray(image.convert("L"))
+
+def area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+def overlap(box, other):
+    """Intersection over union of two (left, top, right, bottom) boxes"""
+    width = min(box[2], other[2]) - max(box[0], other[0])
+    height = min(box[3], other[3]) - max(box[1], other[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (area(box) + area(other) - intersection)
+
+def press_connect_button(entry, settings):
+    """Whether the Ivanti window is found where it is, or not found when it is not there"""
+    scales = display_scale.scale_order(entry["display_scale"])
+    ivanti_rect = entry["ivanti"] if settings.get("window_rect") else None
+    match, _, _ = recognition.locate_ivanti_window(ASSETS_FOLDER, scales, ivanti_rect=ivanti_rect,
+                                                   pyramid=settings["pyramid"], workers=settings.get("workers", 4))
+    if not match or not match.found:
+        return entry["ivanti"] is None
+    found = (match.left, match.top, match.left + match.width, match.top + match.height)
+    return entry["ivanti"] is not None and overlap(found, entry["ivanti"]) >= MIN_OVERLAP
+
+def check_if_logged_in(entry, settings):
+    """Whether the login page is found exactly when it is shown"""
+    scale = display_scale.scale_order(entry["display_scale"])[0]
+    match = recognition.find_login_page(ASSETS_FOLDER, scale, pyramid=settings["pyramid"], workers=settings.get("workers", 4))
+    return bool(match) == entry["login"]
+
+TASKS = {"press_connect_button": press_connect_button, "check_if_logged_in": check_if_logged_in}
+
+def crop(screen, region):
+    if not region:
+        return screen
+    left, top, width, height = region
+    return screen[top:top + height, left:left + width]
+
+def percentile(values, percent):
+    return float(np.percentile(values, percent))
+
+def measure(corpus, repeats):
+    """Accuracy, latency percentiles and peak memory per strategy and task"""
+    report = {}
+    grab_screen = image_matcher.grab_screen
+    try:
+        for strategy, settings in STRATEGIES.items():
+            for task, run in TASKS.items():
+                timings, correct, peak = [], [], 0
+                failures = []
+                for entry, screen in corpus:
+                    image_matcher.grab_screen = lambda region=None: crop(screen, region)
+                    run(entry, settings)  # warm up the template pack
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        result = run(entry, settings)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    correct.append(result)
+                    if not result:
+                        failures.append(entry["file"])
+                    tracemalloc.start()
+                    run(entry, settings)
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                report.setdefault(strategy, {})[task] = {
+                    "accuracy": round(sum(correct) / len(correct), 4),
+                    "p50_ms": round(percentile(timings, 50), 1),
+                    "p95_ms": round(percentile(timings, 95), 1),
+                    "peak_mb": round(peak / 2**20, 1),
+                    "failures": failures,
+                }
+    finally:
+        image_matcher.grab_screen = grab_screen
+    return report
+
+def regressions(report, baseline, tolerance):
+    """Messages for every strategy and task that got less accurate or slower than the baseline"""
+    problems = []
+    for strategy, tasks in report.items():
+        for task, result in tasks.items():
+            expected = baseline.get(strategy, {}).get(task)
+            if not expected:
+                continue
+            if result["accuracy"] < expected["accuracy"]:
+                problems.append(f"{strategy} / {task}: accuracy {result['accuracy']:.0%} < baseline {expected['accuracy']:.0%} "
+                                f"(missed {', '.join(result['failures'])})")
+            if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+                problems.append(f"{strategy} / {task}: p95 {result['p95_ms']:.0f} ms > baseline {expected['p95_ms']:.0f} ms + {tolerance:.0%}")
+    return problems
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p95 latency growth, 0.5 is 50%%")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per screenshot")
+    parser.add_argument("--corpus", default=CORPUS_FOLDER)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    corpus = list(load_corpus(args.corpus))
+    report = measure(corpus, args.repeats)
+
+    print(f"{len(corpus)} screenshots, {args.repeats} runs each")
+    print(f"{'strategy':<26}{'task':<22}{'accuracy':>9}{'p50 ms':>9}{'p95 ms':>9}{'peak MB':>9}")
+    for strategy, tasks in report.items():
+        for task, result in tasks.items():
+            print(f"{strategy:<26}{task:<22}{result['accuracy']:>9.0%}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['peak_mb']:>9.1f}")
+
+    if args.update_baseline:
+        baseline = {strategy: {task: {key: value for key, value in result.items() if key != "failures"}
+                               for task, result in tasks.items()} for strategy, tasks in report.items()}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet, run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        problems = regressions(report, json.load(f), args.tolerance)
+    for problem in problems:
+        print("REGRESSION " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,147 @@
+"""Build the recognition corpus in benchmarks/corpus from the reference images.
+
+Usage: python benchmarks/make_corpus.py
+
+Every screenshot is a synthetic 1920x1080 desktop composited from the reference
+images in assets_connector, so the corpus can be rebuilt and checked in without
+anyone's real desktop on it. Their manifest entries say so with "source":
+"synthetic". That limits what the corpus shows: the 125% and 150% cases are the
+reference images upscaled (with LANCZOS, not the BILINEAR the template pack
+scales with, so the matcher does not just meet its own resampling), not Ivanti
+drawn at that scale, and the dark cases only darken the desktop around Ivanti,
+which has no dark theme. Real captures can be added to the folder next to them,
+with an entry in manifest.json saying where the Ivanti window is ("ivanti", its
+left, top, right, bottom or null), whether the login page is shown ("login") and
+"source": "capture".
+"""
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSETS_FOLDER = os.path.join(ROOT, "assets_connector")
+CORPUS_FOLDER = os.path.join(ROOT, "benchmarks", "corpus")
+SCREEN_SIZE = (1920, 1080)
+# A_zone.png is cropped 2 px right of and 3 px below full_ivanti2.png, which has the window's edge
+A_ZONE_OFFSET = (2, 3)
+
+THEMES = {
+    # background, window colors, taskbar
+    "light": ((226, 232, 240), [(255, 255, 255), (243, 243, 243), (200, 215, 235)], (238, 238, 238)),
+    "dark": ((28, 30, 36), [(45, 45, 48), (32, 32, 32), (60, 64, 72)], (20, 20, 20)),
+}
+
+def asset(name, scale=1.0):
+    image = Image.open(os.path.join(ASSETS_FOLDER, name)).convert("RGB")
+    if name == "A_zone.png":
+        image = aligned_a_zone(image)
+    if scale != 1.0:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.LANCZOS)
+    return image
+
+def aligned_a_zone(image):
+    """The A-Zone window cropped like full_ivanti2.png: pasted over it at A_ZONE_OFFSET, the two
+    only differ in the connections list"""
+    window = Image.open(os.path.join(ASSETS_FOLDER, "full_ivanti2.png")).convert("RGB")
+    window.paste(image, A_ZONE_OFFSET)
+    return window
+
+def desktop(theme, seed):
+    """Themed desktop with a taskbar and a few other windows and icons on it"""
+    background, window_colors, taskbar = THEMES[theme]
+    rng = np.random.default_rng(seed)
+    frame = np.empty((SCREEN_SIZE[1], SCREEN_SIZE[0], 3), dtype=np.uint8)
+    frame[:] = background
+    for _ in range(6):
+        x, y = int(rng.integers(0, 1500)), int(rng.integers(0, 700))
+        width, height = int(rng.integers(300, 900)), int(rng.integers(200, 600))
+        frame[y:y + height, x:x + width] = window_colors[int(rng.integers(len(window_colors)))]
+        frame[y:y + 32, x:x + width] = window_colors[-1]
+        # Lines of "text"
+        for line in range(y + 50, min(y + height, SCREEN_SIZE[1]) - 20, 24):
+            length = int(rng.integers(80, max(90, width - 40)))
+            frame[line:line + 8, x + 20:x + 20 + length] = 255 - np.array(background) // 2
+    for row in range(3):
+        for column in range(2):
+            x, y = 24 + column * 90, 24 + row * 100
+            frame[y:y + 56, x:x + 56] = rng.integers(0, 256, 3)
+    frame[-48:] = taskbar
+    return Image.fromarray(frame)
+
+def without_selection(image):
+    """The Ivanti window with no connection selected: the selected B-Zone row painted over
+    with the unselected A-Zone row"""
+    pixels = np.asarray(image).copy()
+    pixels[230:285, 16:458] = pixels[175:230, 16:458]
+    return Image.fromarray(pixels)
+
+def ivanti_case(name, theme, seed, window, position, scale=1.0, transform=None):
+    screen = desktop(theme, seed)
+    image = asset(window, scale)
+    if transform:
+        image = transform(image)
+    screen.paste(image, position)
+    left, top = position
+    return name, screen, {"display_scale": scale, "ivanti": [left, top, left + image.width, top + image.height], "login": False}
+
+def browser_page(theme, seed, login, scale=1.0):
+    """Full-screen browser with the KU Leuven VPN page, showing the login form or a logged-in page"""
+    screen = desktop(theme, seed)
+    page = np.empty((SCREEN_SIZE[1] - 48, SCREEN_SIZE[0], 3), dtype=np.uint8)
+    page[:] = 255
+    page[:round(80 * scale)] = (53, 54, 58) if theme == "dark" else (222, 225, 230)
+    page[round(80 * scale):round(150 * scale)] = (29, 141, 176)
+    screen.paste(Image.fromarray(page), (0, 0))
+    if login:
+        y = round(220 * scale)
+        for name in ["login_page_top1.png", "login_page_middle1.png"]:
+            piece = asset(name, scale)
+            screen.paste(piece, ((SCREEN_SIZE[0] - piece.width) // 2, y))
+            y += piece.height + round(40 * scale)
+        footer = asset("login_page_bottom2.png", scale)
+        screen.paste(footer, ((SCREEN_SIZE[0] - footer.width) // 2, SCREEN_SIZE[1] - 48 - footer.height - 20))
+    else:
+        # Logged in: the VPN portal page with lines of text where the form would be
+        rng = np.random.default_rng(seed)
+        pixels = np.asarray(screen).copy()
+        for line in range(round(220 * scale), 900, round(36 * scale)):
+            length = int(rng.integers(200, 900))
+            pixels[line:line + round(12 * scale), 420:420 + length] = (60, 60, 60)
+        screen = Image.fromarray(pixels)
+    return screen
+
+def cases():
+    yield ivanti_case("ivanti_b_zone_light", "light", 1, "full_ivanti2.png", (1100, 240))
+    yield ivanti_case("ivanti_a_zone_light", "light", 2, "A_zone.png", (300, 200))
+    yield ivanti_case("ivanti_i_zone_dark", "dark", 3, "I_zone.png", (820, 300))
+    yield ivanti_case("ivanti_no_zone_light", "light", 4, "full_ivanti2.png", (640, 180), transform=without_selection)
+    yield ivanti_case("ivanti_no_zone_dark", "dark", 5, "full_ivanti2.png", (1300, 420), transform=without_selection)
+    yield ivanti_case("ivanti_small_dark", "dark", 6, "full_ivanti1.png", (1400, 500))
+    yield ivanti_case("ivanti_b_zone_125_light", "light", 7, "full_ivanti2.png", (900, 150), scale=1.25)
+    yield ivanti_case("ivanti_a_zone_125_dark", "dark", 8, "A_zone.png", (200, 120), scale=1.25)
+    yield ivanti_case("ivanti_b_zone_150_dark", "dark", 9, "full_ivanti2.png", (1000, 90), scale=1.5)
+    yield ivanti_case("ivanti_i_zone_150_light", "light", 10, "I_zone.png", (120, 80), scale=1.5)
+    yield "desktop_light", desktop("light", 11), {"display_scale": 1.0, "ivanti": None, "login": False}
+    yield "desktop_dark", desktop("dark", 12), {"display_scale": 1.0, "ivanti": None, "login": False}
+    yield "login_page_light", browser_page("light", 13, login=True), {"display_scale": 1.0, "ivanti": None, "login": True}
+    yield "login_page_dark", browser_page("dark", 14, login=True), {"display_scale": 1.0, "ivanti": None, "login": True}
+    yield "login_page_125", browser_page("light", 15, login=True, scale=1.25), {"display_scale": 1.25, "ivanti": None, "login": True}
+    yield "logged_in_light", browser_page("light", 16, login=False), {"display_scale": 1.0, "ivanti": None, "login": False}
+    yield "logged_in_dark_150", browser_page("dark", 17, login=False, scale=1.5), {"display_scale": 1.5, "ivanti": None, "login": False}
+
+def main(folder=CORPUS_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    manifest = []
+    for name, screen, expected in cases():
+        screen.save(os.path.join(folder, name + ".png"), optimize=True)
+        manifest.append({"file": name + ".png", **expected, "source": "synthetic"})
+    with open(os.path.join(folder, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(manifest)} screenshots to {folder}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,27 @@
+import threading
+
+# Set when the user stops the run, every wait and input action of the steps checks it
+_cancelled = threading.Event()
+
+class Cancelled(KeyboardInterrupt):
+    """The run was stopped while a step was working, raised on that step's own thread. It is a
+    KeyboardInterrupt, so the step graph and the connector treat it like ESC on the main thread"""
+
+def cancel():
+    _cancelled.set()
+
+def reset():
+    _cancelled.clear()
+
+def cancelled():
+    return _cancelled.is_set()
+
+def check():
+    """Raise Cancelled once the run was stopped"""
+    if _cancelled.is_set():
+        raise Cancelled()
+
+def sleep(seconds):
+    """time.sleep that ends early and raises Cancelled when the run is stopped"""
+    if _cancelled.wait(max(0.0, seconds)):
+        raise Cancelled()
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import flight_recorder
+
+class Tracer:
+    """Collects timed spans as Chrome trace events, for chrome://tracing or ui.perfetto.dev"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.events = []
+        self.thread_names = {}
+        self.other_data = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category="connector", args=None):
+        """Time the body of the with block as a span. Yields the span's attributes (args), so the
+        body can add its results to them"""
+        args = {} if args is None else args
+        start = self.clock()
+        try:
+            yield args
+        finally:
+            end = self.clock()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+                self.thread_names[event["tid"]] = threading.current_thread().name
+
+    def annotate(self, key, value):
+        """Add a value about the whole run to the trace, the viewer lists it under metadata"""
+        with self._lock:
+            self.other_data[key] = value
+
+    def write(self, path):
+        """Write the spans so far to a trace JSON file"""
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+            other_data = dict(self.other_data)
+        # Name the threads, so the steps and the matcher workers are told apart in the viewer
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in thread_names.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": other_data}, f, default=str)
+        return path
+
+class NullTracer:
+    """Tracer that records nothing, used while tracing is off"""
+
+    @contextmanager
+    def span(self, name, category="connector", args=None):
+        yield {} if args is None else args
+
+    def annotate(self, key, value):
+        pass
+
+    def write(self, path):
+        return None
+
+_tracer = NullTracer()
+
+def enable(clock=time.perf_counter):
+    """Start recording spans for the rest of the process"""
+    global _tracer
+    _tracer = Tracer(clock)
+    return _tracer
+
+def disable():
+    global _tracer
+    _tracer = NullTracer()
+
+def enabled():
+    return isinstance(_tracer, Tracer)
+
+@contextmanager
+def span(name, category="connector", **args):
+    """Span on the active tracer, free when tracing is off. Its start and end always go to the
+    flight recorder"""
+    flight_recorder.record("start", name)
+    start = time.perf_counter()
+    error = None
+    try:
+        with _tracer.span(name, category, args) as attributes:
+            yield attributes
+    except BaseException as exception:
+        error = repr(exception)
+        raise
+    finally:
+        ended = {"seconds": round(time.perf_counter() - start, 4), **args}
+        if error:
+            ended["error"] = error
+        flight_recorder.record("end", name, **ended)
+
+def annotate(key, value):
+    """Add a value about the whole run to the active tracer, nothing when tracing is off"""
+    _tracer.annotate(key, value)
+
+def write(path):
+    """Write the active tracer's spans to path, nothing when tracing is off"""
+    return _tracer.write(path)
@@ -0,0 +1,59 @@
+import ctypes
+import functools
+from ctypes import wintypes
+
+# Credential Manager constants
+CRED_TYPE_GENERIC = 1
+
+class CREDENTIALW(ctypes.Structure):
+    _fields_ = [
+        ("Flags", wintypes.DWORD),
+        ("Type", wintypes.DWORD),
+        ("TargetName", wintypes.LPWSTR),
+        ("Comment", wintypes.LPWSTR),
+        ("LastWritten", wintypes.FILETIME),
+        ("CredentialBlobSize", wintypes.DWORD),
+        ("CredentialBlob", ctypes.POINTER(ctypes.c_ubyte)),
+        ("Persist", wintypes.DWORD),
+        ("AttributeCount", wintypes.DWORD),
+        ("Attributes", ctypes.c_void_p),
+        ("TargetAlias", wintypes.LPWSTR),
+        ("UserName", wintypes.LPWSTR),
+    ]
+
+PCREDENTIALW = ctypes.POINTER(CREDENTIALW)
+
+@functools.lru_cache(maxsize=None)
+def load_advapi32():
+    """advapi32 with the Credential Manager prototypes, set up once"""
+    advapi32 = ctypes.windll.advapi32
+    advapi32.CredEnumerateW.restype = wintypes.BOOL
+    advapi32.CredEnumerateW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD),
+                                        ctypes.POINTER(ctypes.POINTER(PCREDENTIALW))]
+    advapi32.CredFree.argtypes = [ctypes.c_void_p]
+    return advapi32
+
+def compound_name(username, service):
+    """Target keyring saves the password under when the service name is taken by another user"""
+    return f"{username}@{service}"
+
+def generic_credentials(target, advapi32=None):
+    """UserName of every generic credential named target, without reading any secret"""
+    advapi32 = advapi32 or load_advapi32()
+    count = wintypes.DWORD()
+    credentials = ctypes.POINTER(PCREDENTIALW)()
+    # The filter is a prefix, the exact name is checked below
+    if not advapi32.CredEnumerateW(target + "*", 0, ctypes.byref(count), ctypes.byref(credentials)):
+        return []  # Nothing saved under that name
+    try:
+        found = [credentials[i].contents for i in range(count.value)]
+        return [credential.UserName for credential in found
+                if credential.Type == CRED_TYPE_GENERIC and credential.TargetName == target]
+    finally:
+        advapi32.CredFree(credentials)
+
+def password_saved(service, username, advapi32=None):
+    """Whether keyring's Windows Credential Manager backend has a password for username, the way
+    keyring looks it up: under the service name, else under the compound name"""
+    return (username in generic_credentials(service, advapi32)
+            or bool(generic_credentials(compound_name(username, service), advapi32)))
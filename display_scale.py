@@ -0,0 +1,31 @@
+import ctypes
+
+# Windows display scale factors the template variants are prepared for
+COMMON_SCALES = [1.0, 1.25, 1.5, 1.75, 2.0]
+
+# Windows API constants
+LOGPIXELSX = 88
+DEFAULT_DPI = 96
+
+class Win32DisplayScale:
+    """Reads the scale factor of the primary display from user32/gdi32"""
+
+    def __init__(self):
+        self.user32 = ctypes.windll.user32
+        self.gdi32 = ctypes.windll.gdi32
+
+    def scale(self):
+        """Return the display scale, 1.0 for 100%"""
+        try:
+            dpi = self.user32.GetDpiForSystem()
+        except AttributeError:
+            # Older than Windows 10 1607
+            hdc = self.user32.GetDC(0)
+            dpi = self.gdi32.GetDeviceCaps(hdc, LOGPIXELSX)
+            self.user32.ReleaseDC(0, hdc)
+        return dpi / DEFAULT_DPI if dpi else 1.0
+
+def scale_order(display_scale, template_scale=1.0, scales=COMMON_SCALES):
+    """Order the template variant scales to try, closest to what the display needs first"""
+    wanted = display_scale / template_scale
+    return sorted(scales, key=lambda scale: abs(scale - wanted))
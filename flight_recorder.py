@@ -0,0 +1,40 @@
+import collections
+import json
+import threading
+import time
+
+# Events kept in memory, the oldest are dropped first
+CAPACITY = 4096
+LOG_FILE = "vpn_kul_failure.log"
+
+_origin = time.perf_counter()
+_wall_origin = time.time()
+# deque appends are atomic, so recording needs no lock
+_events = collections.deque(maxlen=CAPACITY)
+
+def record(kind, name="", **fields):
+    """Add an event to the ring buffer, only a tuple append so it is cheap enough to leave on"""
+    _events.append((time.perf_counter(), threading.current_thread().name, kind, name, fields))
+
+def events():
+    """Recorded events as (seconds since start, thread, kind, name, fields), oldest first"""
+    return [(moment - _origin, thread, kind, name, fields) for moment, thread, kind, name, fields in list(_events)]
+
+def clear():
+    _events.clear()
+
+def format_event(event):
+    seconds, thread, kind, name, fields = event
+    wall = time.strftime("%H:%M:%S", time.localtime(_wall_origin + seconds)) + f".{int((_wall_origin + seconds) % 1 * 1000):03d}"
+    parts = [wall, f"{seconds:9.3f}s", f"[{thread}]", kind, name, json.dumps(fields, default=str) if fields else ""]
+    return " ".join(part for part in parts if part)
+
+def dump(reason, path=LOG_FILE):
+    """Write every recorded event to the log file, replacing the previous one"""
+    recorded = events()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"VPN KUL connector stopped: {reason}\n")
+        f.write(f"{len(recorded)} events, oldest first\n")
+        for event in recorded:
+            f.write(format_event(event) + "\n")
+    return path
@@ -0,0 +1,319 @@
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image, ImageGrab
+
+import chrome_trace
+import ncc
+
+# Sidecar masks blank out the volatile parts of a template, like the selected zone highlight
+MASK_SUFFIX = ".mask.png"
+
+# Takes a screenshot of bbox (left, top, right, bottom), or of the whole screen for None.
+# None captures the real screen with ImageGrab
+_capture = None
+
+# Thread pool shared by every concurrent search, made on first use, see worker_pool
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+class Match(namedtuple("Match", ["left", "top", "width", "height", "score", "template", "threshold", "scale"], defaults=[0.0, 1.0])):
+    """Same fields as the pyscreeze Box returned by locateOnScreen, plus the peak score,
+    the template name, the cutoff the score was held to and the display scale of the variant"""
+    __slots__ = ()
+
+    @property
+    def found(self):
+        return self.score >= self.threshold
+
+def load_template(path):
+    """Load a template image from disk as a grayscale array"""
+    with Image.open(path) as image:
+        return np.asarray(image.convert("L"))
+
+def mask_path(path):
+    """Path of the sidecar mask of a template, full_ivanti2.png -> full_ivanti2.mask.png"""
+    return os.path.splitext(path)[0] + MASK_SUFFIX
+
+def load_mask(path):
+    """Load the mask of a template: its alpha channel when it has transparency, else the sidecar
+    mask (white is compared, black ignored). None when the whole template counts"""
+    with Image.open(path) as image:
+        if image.mode == "RGBA":
+            alpha = np.asarray(image.getchannel("A"))
+            if alpha.min() < 255:
+                return np.where(alpha > 0, 255, 0).astype(np.uint8)
+    if os.path.exists(mask_path(path)):
+        return np.where(load_template(mask_path(path)) > 127, 255, 0).astype(np.uint8)
+    return None
+
+def load_templates(folder, names):
+    """Load the given template files from folder, keeping their order"""
+    return {name: load_template(os.path.join(folder, name)) for name in names}
+
+def search_region(window_rect, margin=40, screen_size=None):
+    """Turn window bounds (left, top, right, bottom) into a (left, top, width, height) search region with a margin"""
+    left, top, right, bottom = window_rect
+    left, top = max(0, left - margin), max(0, top - margin)
+    right, bottom = right + margin, bottom + margin
+    if screen_size:
+        right, bottom = min(right, screen_size[0]), min(bottom, screen_size[1])
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+def set_capture(capture):
+    """Take screenshots with capture(bbox) from now on, like the platform backend's capture"""
+    global _capture
+    _capture = capture
+
+def grab_screen(region=None):
+    """Capture the screen (or only region) once and convert it to grayscale"""
+    capture = _capture or ImageGrab.grab
+    with chrome_trace.span("grab_screen", "matcher", region=region):
+        if region:
+            left, top, width, height = region
+            screenshot = capture(bbox=(left, top, left + width, top + height))
+        else:
+            screenshot = capture(bbox=None)
+        return np.asarray(screenshot.convert("L"))
+
+def peak(result):
+    """Highest value of a correlation map and its (x, y) position"""
+    y, x = np.unravel_index(np.argmax(result), result.shape)
+    return float(result[y, x]), (int(x), int(y))
+
+def fits(template, screen):
+    return template.shape[0] <= screen.shape[0] and template.shape[1] <= screen.shape[1]
+
+def score_batch(correlator, templates, mask=None):
+    """Peak score and top-left position of each template, same-size templates sharing one mask"""
+    if not fits(templates[0], correlator.screen):
+        return [(-1.0, (0, 0))] * len(templates)
+    return [peak(result) for result in correlator.ncc(np.stack(templates), mask)]
+
+def score_template(screen, template, mask=None):
+    """Return the peak normalized correlation of template over screen and its top-left position"""
+    if not fits(template, screen):
+        return -1.0, (0, 0)
+    return score_batch(ncc.Correlator(screen), [template], mask)[0]
+
+def downsample(image, factor):
+    """Shrink an image by an integer factor, averaging the pixels it merges"""
+    height, width = image.shape[0] // factor, image.shape[1] // factor
+    return image[:height * factor, :width * factor].reshape(height, factor, width, factor).mean(axis=(1, 3))
+
+def downsample_mask(mask, factor):
+    """Shrink a mask by an integer factor, keeping only blocks that are compared entirely"""
+    height, width = mask.shape[0] // factor, mask.shape[1] // factor
+    return mask[:height * factor, :width * factor].reshape(height, factor, width, factor).min(axis=(1, 3))
+
+def coarse_candidates(result, top_k, spacing):
+    """Pick the top_k peaks of a correlation map, at least spacing apart"""
+    result = result.copy()
+    candidates = []
+    for _ in range(top_k):
+        max_val, (x, y) = peak(result)
+        if max_val <= -1.0:
+            break
+        candidates.append((x, y))
+        result[max(0, y - spacing):y + spacing + 1, max(0, x - spacing):x + spacing + 1] = -1.0
+    return candidates
+
+def pyramid_score_batch(screen, templates, factor=4, top_k=3, mask=None, small_correlator=None, cancel=None):
+    """Coarse-to-fine version of score_batch
+
+    Correlates 1/factor downsampled templates over the downsampled screen, then refines
+    only the neighbourhoods of the top_k coarse peaks of each template at full resolution.
+    Refining stops early once the cancel event is set.
+    """
+    height, width = templates[0].shape[:2]
+    if factor <= 1 or min(height, width) // factor < 8:
+        return score_batch(ncc.Correlator(screen), templates, mask)
+    if small_correlator is None:
+        small_correlator = ncc.Correlator(downsample(screen, factor))
+    small_templates = [downsample(template, factor) for template in templates]
+    if not fits(small_templates[0], small_correlator.screen):
+        return score_batch(ncc.Correlator(screen), templates, mask)
+    small_mask = None if mask is None else downsample_mask(mask, factor)
+
+    results = small_correlator.ncc(np.stack(small_templates), small_mask)
+    spacing = max(1, min(small_templates[0].shape) // 2)
+    pad = 2 * factor
+
+    scores = []
+    for template, result in zip(templates, results):
+        best_score, best_loc = -1.0, (0, 0)
+        for x, y in coarse_candidates(result, top_k, spacing):
+            if cancel is not None and cancel.is_set():
+                break
+            left, top = max(0, x * factor - pad), max(0, y * factor - pad)
+            window = screen[top:top + height + 2 * pad, left:left + width + 2 * pad]
+            score, (dx, dy) = score_template(window, template, mask)
+            if score > best_score:
+                best_score, best_loc = score, (left + dx, top + dy)
+        scores.append((best_score, best_loc))
+    return scores
+
+def pyramid_score_template(screen, template, factor=4, top_k=3, mask=None):
+    """Coarse-to-fine version of score_template"""
+    return pyramid_score_batch(screen, [template], factor, top_k, mask)[0]
+
+def worker_pool(workers):
+    """The thread pool of the concurrent searches, only made again when workers changes, so
+    polling searches like the login page check do not start threads every time"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matcher")
+            _pool_workers = workers
+        return _pool
+
+def score_templates(templates, screen=None, region=None, thresholds=None, confidence=0.0, pyramid=1, masks=None, workers=1):
+    """Score every template once against one capture and return a Match per template
+
+    Each template is held to thresholds[name] when given, else confidence. Matches that pass
+    sort first, then by score, so the head is either the hit or the closest miss.
+    When region is given, screen (or the capture) only covers that region and the
+    returned coordinates are translated back to the full screen.
+    A pyramid factor above 1 switches to the coarse-to-fine search. masks maps template names
+    to masks of the pixels to compare.
+    With more than one worker the templates are scored concurrently on a shared thread pool and
+    the first template that passes cancels the rest, which are then left out of the result.
+    Every batch checks for that before it is scored; one already scoring at full resolution
+    finishes, only the pyramid refinement stops early.
+    """
+    if screen is None:
+        screen = grab_screen(region)
+    offset_x, offset_y = region[:2] if region else (0, 0)
+    thresholds = thresholds or {}
+    masks = masks or {}
+    if not templates:
+        return []
+
+    # The screen spectrum (or the downsampled one) is shared by every template
+    if pyramid > 1:
+        small_correlator = ncc.Correlator(downsample(screen, pyramid))
+    else:
+        correlator = ncc.Correlator(screen)
+
+    # Same-size templates with the same mask are correlated in one batch
+    batches = {}
+    for name, template in templates.items():
+        mask = masks.get(name)
+        batches.setdefault((template.shape, None if mask is None else id(mask)), []).append(name)
+
+    cancel = threading.Event()
+
+    def score_batch_matches(names):
+        if cancel.is_set():
+            return []
+        batch = [templates[name] for name in names]
+        mask = masks.get(names[0])
+        with chrome_trace.span("match", "matcher", templates=names, shape=list(batch[0].shape), masked=mask is not None,
+                               pyramid=pyramid, region=region) as attributes:
+            if pyramid > 1:
+                scores = pyramid_score_batch(screen, batch, pyramid, mask=mask, small_correlator=small_correlator, cancel=cancel)
+            else:
+                scores = score_batch(correlator, batch, mask)
+            batch_matches = []
+            for name, (score, (x, y)) in zip(names, scores):
+                height, width = templates[name].shape[:2]
+                threshold = thresholds.get(name, confidence)
+                batch_matches.append(Match(x + offset_x, y + offset_y, width, height, score, name, threshold))
+            attributes["results"] = [{"template": match.template, "score": round(match.score, 4), "threshold": match.threshold,
+                                      "found": match.found, "at": [match.left, match.top]} for match in batch_matches]
+        return batch_matches
+
+    matches = []
+    if workers > 1 and len(batches) > 1:
+        # numpy releases the GIL in the FFTs, so the batches really run side by side
+        pool = worker_pool(workers)
+        futures = [pool.submit(score_batch_matches, names) for names in batches.values()]
+        try:
+            for future in as_completed(futures):
+                matches.extend(future.result())
+                if any(match.found for match in matches):
+                    break
+        finally:
+            # Do not wait for batches still running, they stop at their next cancel check
+            cancel.set()
+            for future in futures:
+                future.cancel()
+    else:
+        # A single batch is scored right here, a pool would only add the hand-over
+        for names in batches.values():
+            matches.extend(score_batch_matches(names))
+
+    matches.sort(key=lambda match: (match.found, match.score), reverse=True)
+    return matches
+
+def find_best_match(templates, screen=None, confidence=0.0, region=None, thresholds=None, pyramid=1, masks=None, workers=1):
+    """Score every template against one capture and return the best passing Match, or None"""
+    matches = score_templates(templates, screen, region, thresholds, confidence, pyramid, masks, workers)
+    if matches and matches[0].found:
+        return matches[0]
+    return None
+
+def pixel_hash(pixels):
+    """Hash a block of grayscale pixels, including its shape"""
+    digest = hashlib.blake2b(str(pixels.shape).encode("ascii"), digest_size=16)
+    digest.update(np.ascontiguousarray(pixels).tobytes())
+    return digest.hexdigest()
+
+def remember_match(match, screen, region=None):
+    """Describe a match as a config record: bbox, template, score and a hash of the matched pixels"""
+    offset_x, offset_y = region[:2] if region else (0, 0)
+    x, y = match.left - offset_x, match.top - offset_y
+    return {
+        "bbox": [match.left, match.top, match.width, match.height],
+        "template": match.template,
+        "score": round(match.score, 4),
+        "scale": match.scale,
+        "pixel_hash": pixel_hash(screen[y:y + match.height, x:x + match.width]),
+    }
+
+def check_last_match(last_match, templates, confidence=0.0, margin=16, thresholds=None, masks=None):
+    """Check whether the screen still shows the remembered match
+
+    Captures only the remembered bbox plus margin. Returns (match, screen, region) when the
+    pixels hash the same and the remembered score still passes the threshold, or a local
+    re-match of the same template succeeds, else None.
+    templates must hold the variants for the remembered scale.
+    """
+    name = last_match.get("template")
+    template = templates.get(name)
+    if template is None:
+        return None
+
+    left, top, width, height = last_match["bbox"]
+    scale = last_match.get("scale", 1.0)
+    region = search_region((left, top, left + width, top + height), margin)
+    if not region:
+        return None
+
+    with chrome_trace.span("check_last_match", "matcher", template=name, bbox=last_match["bbox"], scale=scale) as attributes:
+        screen = grab_screen(region)
+
+        x, y = left - region[0], top - region[1]
+        if pixel_hash(screen[y:y + height, x:x + width]) == last_match.get("pixel_hash"):
+            threshold = (thresholds or {}).get(name, confidence)
+            # Same pixels score the same, so a remembered score below a raised threshold is a miss here too
+            if last_match["score"] < threshold:
+                attributes["result"] = "below threshold"
+                return None
+            attributes["result"] = "same pixels"
+            return Match(left, top, width, height, last_match["score"], name, threshold, scale), screen, region
+
+        match = find_best_match({name: template}, screen, confidence, region, thresholds, masks=masks)
+        attributes["result"] = "moved" if match else "gone"
+        if not match:
+            return None
+        return match._replace(scale=scale), screen, region
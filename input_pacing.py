@@ -0,0 +1,62 @@
+import threading
+
+import cancellation
+
+# Seconds to wait after each kind of input at speed_multiplier 1, each can be overridden with
+# "input_delays" in the config. The flow already waits for the windows it expects, these only
+# cover what it can not see, like the browser still closing a tab before the next ctrl+w
+DEFAULT_DELAYS = {
+    "move": 0.0,
+    "click": 0.05,
+    "press": 0.0,
+    "hotkey": 0.1,
+    "type": 0.0,
+}
+# Backend method -> kind of input
+ACTIONS = {
+    "move_to": "move",
+    "click": "click",
+    "press": "press",
+    "hotkey": "hotkey",
+    "write": "type",
+    "type_text": "type",
+}
+
+class PacedInput:
+    """Backend wrapper that waits an explicit delay after every input action
+
+    The delays come from a profile per kind of input and are divided by the speed multiplier,
+    like every other wait. Everything else is passed on to the backend as is. total and actions
+    add up the delays and input actions since the last configure(). Once the run is stopped,
+    input actions raise cancellation.Cancelled instead of clicking or typing.
+    """
+
+    def __init__(self, backend, delays=None, speed_multiplier=1.0, sleep=cancellation.sleep):
+        self.backend = backend
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.configure(delays, speed_multiplier)
+
+    def configure(self, delays=None, speed_multiplier=1.0):
+        """Set the delay profile for the next run, with delays overriding DEFAULT_DELAYS"""
+        self.delays = {**DEFAULT_DELAYS, **(delays or {})}
+        self.speed_multiplier = speed_multiplier
+        self.total = 0.0
+        self.actions = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if name not in ACTIONS:
+            return attribute
+        delay = self.delays[ACTIONS[name]] / self.speed_multiplier
+
+        def action(*args, **kwargs):
+            cancellation.check()
+            result = attribute(*args, **kwargs)
+            if delay > 0:
+                self.sleep(delay)
+            with self._lock:
+                self.total += delay
+                self.actions += 1
+            return result
+        return action
@@ -0,0 +1,70 @@
+import ctypes
+import functools
+from ctypes import wintypes
+
+# SendInput constants
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+VK_TAB = 0x09
+VK_RETURN = 0x0D
+
+# Characters typed as a key press instead of as text, dialogs only move the focus or confirm on
+# the real Tab and Enter keys
+KEYS = {"\t": VK_TAB, "\n": VK_RETURN}
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+class _INPUTUNION(ctypes.Union):
+    # The mouse member is never used, it gives the union the size SendInput expects
+    _fields_ = [("ki", KEYBDINPUT), ("mi", MOUSEINPUT)]
+
+class INPUT(ctypes.Structure):
+    _anonymous_ = ("union",)
+    _fields_ = [("type", wintypes.DWORD), ("union", _INPUTUNION)]
+
+@functools.lru_cache(maxsize=None)
+def load_user32():
+    """user32 with the SendInput prototype, set up once"""
+    user32 = ctypes.windll.user32
+    user32.SendInput.restype = wintypes.UINT
+    user32.SendInput.argtypes = [wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int]
+    return user32
+
+def key_event(virtual_key=0, scan=0, flags=0):
+    return INPUT(type=INPUT_KEYBOARD, ki=KEYBDINPUT(wVk=virtual_key, wScan=scan, dwFlags=flags))
+
+def key_events(text):
+    """Key down and up events that type text whatever the keyboard layout: tab and newline as
+    the Tab and Enter keys, everything else as Unicode characters"""
+    events = []
+    for character in text:
+        if character in KEYS:
+            events += [key_event(KEYS[character]), key_event(KEYS[character], flags=KEYEVENTF_KEYUP)]
+            continue
+        # UTF-16 code units, a character outside the BMP is sent as its surrogate pair
+        encoded = character.encode("utf-16-le")
+        for index in range(0, len(encoded), 2):
+            unit = int.from_bytes(encoded[index:index + 2], "little")
+            events += [key_event(scan=unit, flags=KEYEVENTF_UNICODE),
+                       key_event(scan=unit, flags=KEYEVENTF_UNICODE | KEYEVENTF_KEYUP)]
+    return events
+
+def send_text(text, user32=None):
+    """Type text into the focused window with one SendInput call, so nothing typed in between
+    by the user ends up inside it"""
+    user32 = user32 or load_user32()
+    events = key_events(text)
+    if not events:
+        return
+    inputs = (INPUT * len(events))(*events)
+    sent = user32.SendInput(len(events), inputs, ctypes.sizeof(INPUT))
+    if sent != len(events):
+        raise OSError(f"Only {sent} of {len(events)} key events were typed, "
+                      "the focused window may run as administrator")
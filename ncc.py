@@ -0,0 +1,114 @@
+import threading
+
+import numpy as np
+
+# Summed squared deviation below which a window or template counts as flat, well under one
+# pixel that differs by one gray level
+FLAT_VARIANCE = 1e-3
+
+def next_fast_len(n):
+    """Smallest 2^a * 3^b * 5^c that is at least n, the sizes numpy's FFT handles fastest"""
+    best = 2 * n
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            size = power35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+def window_sums(image, height, width):
+    """Sum of every height x width window of image, through an integral image"""
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    np.cumsum(np.cumsum(image, axis=0), axis=1, out=integral[1:, 1:])
+    return (integral[height:, width:] - integral[:-height, width:]
+            - integral[height:, :-width] + integral[:-height, :-width])
+
+class Correlator:
+    """Normalized cross-correlation (TM_CCOEFF_NORMED) of templates over one screen
+
+    The spectrum and local statistics of the screen are computed once and shared by every
+    template scored against it, also by templates scored from several threads.
+    """
+
+    def __init__(self, screen):
+        # NCC does not change when a constant is subtracted from the screen, and centering it keeps
+        # the FFTs and window sums accurate
+        screen = np.asarray(screen, dtype=np.float64)
+        self.screen = screen - screen.mean()
+        # Only the valid part of the correlation is kept, and wrap-around of a circular correlation
+        # never reaches it, so the FFT only has to cover the screen. Every template size shares it.
+        self.fft_shape = (next_fast_len(self.screen.shape[0]), next_fast_len(self.screen.shape[1]))
+        self._spectra = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def _spectrum(self, name):
+        """FFT of the screen ("screen") or of its square ("squared"), computed on first use"""
+        with self._lock:
+            if name not in self._spectra:
+                image = self.screen if name == "screen" else self.screen ** 2
+                self._spectra[name] = np.fft.rfft2(image, self.fft_shape)
+            return self._spectra[name]
+
+    def _window_sums(self, height, width):
+        """Sums of screen and screen squared over every window of a template size"""
+        with self._lock:
+            if (height, width) not in self._sums:
+                self._sums[height, width] = (window_sums(self.screen, height, width),
+                                             window_sums(self.screen ** 2, height, width))
+            return self._sums[height, width]
+
+    def _correlate(self, name, kernels):
+        """Sliding dot product of kernels (k, h, w) with the screen ("screen") or its square
+        ("squared"), valid part only"""
+        height, width = kernels.shape[1:]
+        kernel_spectra = np.fft.rfft2(kernels[:, ::-1, ::-1], self.fft_shape)
+        full = np.fft.irfft2(self._spectrum(name) * kernel_spectra, self.fft_shape)
+        return full[:, height - 1:self.screen.shape[0], width - 1:self.screen.shape[1]]
+
+    def ncc(self, templates, mask=None):
+        """Correlation maps of same-size templates, shape (k, H - h + 1, W - w + 1)
+
+        With a mask (shared by the batch, nonzero is compared) only the masked pixels of the
+        template and of each screen window take part.
+        """
+        templates = np.asarray(templates, dtype=np.float64)
+        if templates.ndim == 2:
+            templates = templates[np.newaxis]
+        height, width = templates.shape[1:]
+        if height > self.screen.shape[0] or width > self.screen.shape[1]:
+            raise ValueError("Template is larger than the screen")
+
+        if mask is None:
+            weights = np.ones((height, width))
+            count = float(height * width)
+            window_sum, window_square_sum = self._window_sums(height, width)
+        else:
+            weights = (np.asarray(mask) > 0).astype(np.float64)
+            count = weights.sum()
+            window_sum = self._correlate("screen", weights[np.newaxis])[0]
+            window_square_sum = self._correlate("squared", weights[np.newaxis])[0]
+
+        # Zero-mean templates over the compared pixels, so only the window variance is left to divide by
+        means = (templates * weights).sum(axis=(1, 2), keepdims=True) / count
+        kernels = (templates - means) * weights
+        numerators = self._correlate("screen", kernels)
+
+        template_norms = np.sqrt((kernels ** 2).sum(axis=(1, 2)))[:, np.newaxis, np.newaxis]
+        window_variance = np.maximum(window_square_sum - window_sum ** 2 / count, 0.0)
+        denominators = template_norms * np.sqrt(window_variance)
+
+        # Flat windows (or flat templates) have no defined correlation
+        valid = (window_variance > FLAT_VARIANCE) & (template_norms > FLAT_VARIANCE)
+        result = np.zeros(numerators.shape)
+        np.divide(numerators, denominators, out=result, where=valid)
+        return np.clip(result, -1.0, 1.0)
+
+def match_template(screen, template, mask=None):
+    """Correlation map of a single template, like cv2.matchTemplate with TM_CCOEFF_NORMED"""
+    return Correlator(screen).ncc(template, mask)[0]
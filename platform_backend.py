@@ -0,0 +1,106 @@
+import ctypes
+import os
+
+import credential_store
+import display_scale
+import keyboard_input
+import window_discovery
+
+# MessageBoxW styles
+MB_ICONERROR = 0x10
+MB_ICONWARNING = 0x30
+
+class Win32Backend:
+    """Everything the connector does to the desktop: screen capture, mouse and keyboard input,
+    windows, the display scale, starting programs, the browser and the credential store
+
+    The simulator in simulator.py has the same methods, so the login flow also runs headless.
+    """
+
+    def __init__(self):
+        # Screen coordinates, captures and the display scale all have to be in physical pixels.
+        # Importing pyautogui used to do this, now it is only imported on the first input
+        try:
+            ctypes.windll.user32.SetProcessDPIAware()
+        except AttributeError:
+            pass
+        self._pyautogui = None
+        self.windows = window_discovery.Win32Windows()
+        self.display = display_scale.Win32DisplayScale()
+
+    @property
+    def pyautogui(self):
+        """pyautogui, imported on first use since it takes a while and pulls in PIL"""
+        if self._pyautogui is None:
+            import pyautogui
+            # No hidden pause after every action, the connector waits explicitly (input_pacing.py)
+            pyautogui.PAUSE = 0
+            self._pyautogui = pyautogui
+        return self._pyautogui
+
+    def capture(self, bbox=None):
+        """Screenshot of the whole screen, or of bbox (left, top, right, bottom), as a PIL image"""
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=bbox)
+
+    def position(self):
+        return self.pyautogui.position()
+
+    def move_to(self, x, y=None):
+        self.pyautogui.moveTo(x, y)
+
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+
+    def write(self, text):
+        self.pyautogui.write(text)
+
+    def press(self, key):
+        self.pyautogui.press(key)
+
+    def type_text(self, text):
+        """Type text in one go and independent of the keyboard layout, tab and newline press
+        Tab and Enter"""
+        keyboard_input.send_text(text)
+
+    def hotkey(self, *keys):
+        self.pyautogui.hotkey(*keys)
+
+    def launch(self, path):
+        """Start a program or shortcut like a double click would"""
+        os.startfile(path)
+
+    def open_url(self, url):
+        import webbrowser
+        webbrowser.open(url)
+
+    def get_password(self, service, username):
+        import keyring
+        return keyring.get_password(service, username)
+
+    def has_password(self, service, username):
+        """Whether a password is saved, without importing keyring or reading the password"""
+        return credential_store.password_saved(service, username)
+
+    def message_box(self, message, title, style=MB_ICONERROR):
+        ctypes.windll.user32.MessageBoxW(0, message, title, style)
+
+    def listen_for_escape(self, callback):
+        """Call callback from a background thread whenever ESC is pressed"""
+        from pynput import keyboard as kb
+
+        def on_press(key):
+            if key == kb.Key.esc:
+                callback()
+        listener = kb.Listener(on_press=on_press)
+        listener.daemon = True
+        listener.start()
+
+    def listen_for_hotkey(self, hotkey, callback):
+        """Call callback from a background thread whenever hotkey is pressed, hotkey is in
+        pynput's format, for example <ctrl>+<alt>+v"""
+        from pynput import keyboard as kb
+
+        listener = kb.GlobalHotKeys({hotkey: callback})
+        listener.daemon = True
+        listener.start()
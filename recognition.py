@@ -0,0 +1,68 @@
+import chrome_trace
+import image_matcher
+import template_pack
+
+# Masked templates only compare the stable window chrome, so the selected zone does not matter.
+# full_ivanti1 is the same window rendered at a smaller size
+IVANTI_TEMPLATES = ["full_ivanti2.png", "full_ivanti1.png"]
+LOGIN_TEMPLATES = ["login_page_top1.png", "login_page_middle1.png", "login_page_middle2.png", "login_page_bottom2.png"]
+
+# Minimum peak correlation per template, can be overridden with "match_thresholds" in the config
+MATCH_THRESHOLDS = {
+    "full_ivanti1.png": 0.85,
+    "full_ivanti2.png": 0.85,
+    "login_page_top1.png": 0.8,
+    "login_page_middle1.png": 0.8,
+    "login_page_middle2.png": 0.8,
+    "login_page_bottom2.png": 0.8,
+}
+
+def locate_ivanti_window(assets_folder, scales, thresholds=None, ivanti_rect=None, last_match=None, pyramid=4, workers=4):
+    """Find the Ivanti window on screen, trying the last known location before any template search
+
+    scales are the template variants to try, in order. Returns (match, screen, region). When
+    nothing passes its threshold, match is the closest miss (or None) and screen and region are None.
+    """
+    thresholds = MATCH_THRESHOLDS if thresholds is None else thresholds
+    if last_match:
+        scale = last_match.get("scale", 1.0)
+        templates = template_pack.load_templates(assets_folder, IVANTI_TEMPLATES, scale)
+        masks = template_pack.load_masks(assets_folder, IVANTI_TEMPLATES, scale)
+        found = image_matcher.check_last_match(last_match, templates, thresholds=thresholds, masks=masks)
+        if found:
+            return found
+
+    # Only scan around the Ivanti window when we know where it is, else the whole screen
+    regions = [None]
+    if ivanti_rect:
+        region = image_matcher.search_region(ivanti_rect)
+        if region:
+            regions.insert(0, region)
+
+    closest = None
+    for region in regions:
+        screen = image_matcher.grab_screen(region)
+        # The variant for the current display scale usually hits first try
+        for scale in scales:
+            with chrome_trace.span("locate_ivanti_window", "matcher", region=region, scale=scale):
+                templates = template_pack.load_templates(assets_folder, IVANTI_TEMPLATES, scale)
+                masks = template_pack.load_masks(assets_folder, IVANTI_TEMPLATES, scale)
+                matches = image_matcher.score_templates(templates, screen, region, thresholds,
+                                                        pyramid=pyramid, masks=masks, workers=workers)
+            if matches and matches[0].found:
+                return matches[0]._replace(scale=scale), screen, region
+            if matches and (closest is None or matches[0].score > closest.score):
+                closest = matches[0]._replace(scale=scale)
+    return closest, None, None
+
+def preload(assets_folder, scale=1.0):
+    """Load the templates and masks for a display scale now, so the first search does not wait for them"""
+    template_pack.load_templates(assets_folder, IVANTI_TEMPLATES + LOGIN_TEMPLATES, scale)
+    template_pack.load_masks(assets_folder, IVANTI_TEMPLATES, scale)
+
+def find_login_page(assets_folder, scale=1.0, thresholds=None, pyramid=4, workers=4):
+    """Return the Match of the KU Leuven login page on screen, or None when it is not shown"""
+    thresholds = MATCH_THRESHOLDS if thresholds is None else thresholds
+    templates = template_pack.load_templates(assets_folder, LOGIN_TEMPLATES, scale)
+    match = image_matcher.find_best_match(templates, thresholds=thresholds, pyramid=pyramid, workers=workers)
+    return match._replace(scale=scale) if match else None
@@ -0,0 +1,149 @@
+import hmac
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+
+import flight_recorder
+
+HOST = "127.0.0.1"
+# Can be changed with "agent_port" and "agent_hotkey" in the config
+DEFAULT_PORT = 47135
+# Ctrl+Alt+V is Paste Special in Office and other apps, the hotkey would swallow it
+DEFAULT_HOTKEY = "<ctrl>+<alt>+<shift>+k"
+
+# Secret of the running agent, every command starts with it. Any program on this PC can reach
+# the port, also under another user account, but only this user can read the file: %LOCALAPPDATA%
+# is in the user's own profile, elsewhere it is made readable by its owner only
+TOKEN_FILE = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "VPN KUL", "agent_token")
+
+# Commands, one line each after the token, the agent answers with one line
+CONNECT = "connect"
+PING = "ping"
+STOP = "stop"
+
+class Agent:
+    """Keeps the connector loaded and runs connect() for every trigger
+
+    Triggers come from the local socket (see send) or from trigger() itself, which the hotkey
+    listener calls. The runs happen one at a time on the thread that calls run(), the main
+    thread, so ESC can still interrupt them. A trigger while a run is going is turned down.
+    """
+
+    def __init__(self, connect, port=DEFAULT_PORT, host=HOST, token_file=None):
+        self.connect = connect
+        self.runs = 0
+        self._triggers = queue.Queue()
+        self._lock = threading.Lock()
+        self._busy = False
+        self.ready = threading.Event()
+        # Only reachable from this machine. Raises OSError when another agent has the port, before
+        # the token of that agent is replaced
+        self._socket = socket.create_server((host, port))
+        self.port = self._socket.getsockname()[1]
+        try:
+            self.token = write_token(token_file or TOKEN_FILE)
+        except OSError:
+            self._socket.close()
+            raise
+        threading.Thread(target=self._serve, name="agent socket", daemon=True).start()
+
+    def trigger(self, source):
+        """Queue a run, returns the reply for the one who triggered it"""
+        with self._lock:
+            if self._busy:
+                flight_recorder.record("trigger ignored", source)
+                return "busy"
+            self._busy = True
+        self._triggers.put((source, time.perf_counter()))
+        return "started"
+
+    def stop(self):
+        """Let run() return once the current run is done"""
+        self._triggers.put((None, time.perf_counter()))
+        return "stopping"
+
+    def handle(self, line):
+        """Reply to one line from the socket, the token and a command"""
+        token, _, command = line.partition(" ")
+        if not hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8")):
+            flight_recorder.record("command refused", command)
+            return "refused"
+        if command == CONNECT:
+            return self.trigger("socket")
+        if command == PING:
+            return "ready" if self.ready.is_set() else "starting"
+        if command == STOP:
+            return self.stop()
+        return f"unknown command {command!r}"
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return  # Closed
+            with connection:
+                try:
+                    connection.settimeout(1.0)
+                    with connection.makefile("r", encoding="utf-8") as lines:
+                        line = lines.readline().strip()
+                    connection.sendall((self.handle(line) + "\n").encode("utf-8"))
+                except OSError:
+                    pass
+
+    def run(self):
+        """Run a connect for every trigger, until stopped"""
+        self.ready.set()
+        try:
+            while True:
+                source, triggered = self._triggers.get()
+                if source is None:
+                    return
+                # The failure log and trace of a run should only hold that run
+                flight_recorder.clear()
+                flight_recorder.record("trigger", source, waited=round(time.perf_counter() - triggered, 4))
+                try:
+                    self.connect()
+                except SystemExit:
+                    pass  # The error was already shown
+                except Exception as error:
+                    print(f"Run failed: {error!r}")
+                finally:
+                    self.runs += 1
+                    with self._lock:
+                        self._busy = False
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            # Wakes up the accept() of the socket thread, closing alone does not on every OS
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+def write_token(path):
+    """Write a new random token to path, readable by this user only, and return it"""
+    token = secrets.token_hex(16)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(token)
+    # The mode of os.open only applies to a new file
+    os.chmod(path, 0o600)
+    return token
+
+def send(command, port=DEFAULT_PORT, host=HOST, timeout=1.0, token_file=None):
+    """Send a command with the agent's token and return its reply, None when no agent is running"""
+    try:
+        with open(token_file or TOKEN_FILE) as f:
+            token = f.read().strip()
+        with socket.create_connection((host, port), timeout=timeout) as connection:
+            connection.sendall(f"{token} {command}\n".encode("utf-8"))
+            with connection.makefile("r", encoding="utf-8") as lines:
+                return lines.readline().strip() or None
+    except OSError:
+        return None
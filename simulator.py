@@ -0,0 +1,401 @@
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from PIL import Image
+
+import cancellation
+
+CORPUS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "corpus")
+
+# The browser is named after the page it shows, BROWSER_TITLE is the VPN page's
+BROWSER_TITLE = "VPN KU Leuven - Web Browser"
+IVANTI_TITLE = "Ivanti Secure Access Client"
+CREDENTIALS_TITLE = "Connect to: B-Zone"
+CONFIRM_TITLE = "Pre Sign-In Notification"
+DIALOG_COLOR = (240, 240, 240)
+DIALOG_SIZE = (360, 220)
+TASKBAR_HEIGHT = 48
+# Process that owns the windows of each kind, Ivanti shows its dialogs from its own process
+PROCESS_IDS = {"browser": 4120, "ivanti": 7316, "credentials": 7316, "confirm": 7316}
+# Characters type_text presses a key for
+KEYS = {"\t": "tab", "\n": "enter"}
+
+# A scripted login session: the screenshots the screen is built from, the account and how long,
+# in seconds, each program takes to react on a typical laptop
+DEFAULT_SESSION = {
+    "desktop": "desktop_light.png",
+    "vpn_page": "logged_in_light.png",
+    "page_title": "VPN KU Leuven",
+    "ivanti": "ivanti_b_zone_light.png",
+    # B-Zone's connect button, (left, top, right, bottom) relative to the Ivanti window
+    "connect_button": [0.695, 0.404, 0.953, 0.454],
+    "username": "r0123456",
+    "password": "correct horse battery staple",
+    "delays": {
+        "browser_start": 1.5,
+        "new_tab": 0.6,
+        "ivanti_start": 3.0,
+        "activate": 0.05,
+        "credentials_prompt": 0.8,
+        "confirm_prompt": 1.2,
+        "confirm_closed": 0.3,
+        "tunnel": 2.0,
+        "close": 0.3,
+    },
+}
+
+# The user forgot to log into KU Leuven first, so the VPN page shows the login form
+LOGGED_OUT_SESSION = {**DEFAULT_SESSION, "vpn_page": "login_page_light.png", "page_title": "KU Leuven Login"}
+
+def load_manifest(folder=CORPUS_FOLDER):
+    """Manifest entries of the corpus by file name"""
+    with open(os.path.join(folder, "manifest.json")) as f:
+        return {entry["file"]: entry for entry in json.load(f)}
+
+class SimulatedBackend:
+    """Headless stand-in for platform_backend.Win32Backend, so the whole connector runs on any machine
+
+    Replays a scripted login session (see DEFAULT_SESSION) with its delays multiplied by
+    time_scale: the screen is built from the corpus screenshots, and the browser, Ivanti and its
+    dialogs react to the connector's clicks and keys. Nothing runs in the background, every call
+    first applies the reactions that are due. Plays the windows and display backends too.
+    What the connector did is kept in clicks, typed, urls, launched and messages, and
+    connected_at is when the tunnel comes up.
+    """
+
+    def __init__(self, session=DEFAULT_SESSION, time_scale=1.0, corpus_folder=CORPUS_FOLDER, clock=time.monotonic):
+        self.session = session
+        self.time_scale = time_scale
+        self.clock = clock
+        self.windows = self
+        self.display = self
+
+        manifest = load_manifest(corpus_folder)
+        self._frames = {}
+        for part in ["desktop", "vpn_page", "ivanti"]:
+            with Image.open(os.path.join(corpus_folder, session[part])) as image:
+                self._frames[part] = image.convert("RGB")
+        self._ivanti_rect = tuple(manifest[session["ivanti"]]["ivanti"])
+        self._display_scale = manifest[session["ivanti"]]["display_scale"]
+        self.screen_size = self._frames["desktop"].size
+
+        self._lock = threading.RLock()
+        self._events = []
+        self._sequence = itertools.count()
+        self._handles = itertools.count(0x1000, 4)
+        self._windows = {}
+        self._z_order = []
+        self._tabs = []
+        self._fields = None
+        self._screen_key = None
+        self._screen = None
+        self.mouse = (self.screen_size[0] // 2, self.screen_size[1] // 2)
+
+        self.started_at = clock()
+        self.connected_at = None
+        self.clicks = []
+        self.typed = []
+        self.urls = []
+        self.launched = []
+        self.messages = []
+        self.hotkeys = {}
+
+    # Scripted reactions
+
+    def _schedule(self, delay, action, at=None):
+        due = (self.clock() if at is None else at) + self.session["delays"][delay] * self.time_scale
+        heapq.heappush(self._events, (due, next(self._sequence), action))
+        return due
+
+    def _advance(self):
+        """Apply every reaction that is due, each at the time it was due"""
+        while self._events and self._events[0][0] <= self.clock():
+            due, _, action = heapq.heappop(self._events)
+            action(due)
+
+    def _open_window(self, title, rect, kind):
+        hwnd = next(self._handles)
+        self._windows[hwnd] = {"title": title, "rect": rect, "kind": kind}
+        self._z_order.append(hwnd)
+        return hwnd
+
+    def _close_window(self, hwnd):
+        self._windows.pop(hwnd, None)
+        if hwnd in self._z_order:
+            self._z_order.remove(hwnd)
+
+    def _raise(self, hwnd):
+        if hwnd in self._z_order:
+            self._z_order.remove(hwnd)
+            self._z_order.append(hwnd)
+
+    def _top(self, kind=None):
+        """Foreground window, None when it is not of kind"""
+        if not self._z_order:
+            return None
+        hwnd = self._z_order[-1]
+        return hwnd if kind is None or self._windows[hwnd]["kind"] == kind else None
+
+    def _find(self, kind):
+        return next((hwnd for hwnd in self._z_order if self._windows[hwnd]["kind"] == kind), None)
+
+    def _dialog(self, title, kind):
+        left, top, right, bottom = self._ivanti_rect
+        x, y = (left + right - DIALOG_SIZE[0]) // 2, (top + bottom - DIALOG_SIZE[1]) // 2
+        return self._open_window(title, (x, y, x + DIALOG_SIZE[0], y + DIALOG_SIZE[1]), kind)
+
+    def _on_connect(self, due):
+        self._fields = {"username": "", "password": "", "focus": "username"}
+        self._dialog(CREDENTIALS_TITLE, "credentials")
+
+    def _on_credentials(self, due):
+        # Wrong credentials get the prompt again, like Ivanti does
+        if (self._fields["username"], self._fields["password"]) == (self.session["username"], self.session["password"]):
+            self._dialog(CONFIRM_TITLE, "confirm")
+        else:
+            self._on_connect(due)
+
+    def _on_confirm(self, due):
+        self._close_window(self._find("confirm"))
+
+    # Screen
+
+    def capture(self, bbox=None):
+        """The screenshot the windows on screen add up to: the desktop, the full-screen browser
+        page, the Ivanti window cut from its corpus screenshot and plain boxes for the dialogs"""
+        with self._lock:
+            self._advance()
+            key = tuple(self._z_order)
+            if key != self._screen_key:
+                screen = self._frames["desktop"].copy()
+                for hwnd in self._z_order:
+                    window = self._windows[hwnd]
+                    if window["kind"] == "browser":
+                        screen = self._frames["vpn_page"].copy()
+                    elif window["kind"] == "ivanti":
+                        screen.paste(self._frames["ivanti"].crop(window["rect"]), window["rect"][:2])
+                    else:
+                        screen.paste(DIALOG_COLOR, window["rect"])
+                self._screen_key, self._screen = key, screen
+            return self._screen if bbox is None else self._screen.crop(bbox)
+
+    def scale(self):
+        return self._display_scale
+
+    # Windows
+
+    def visible_windows(self):
+        with self._lock:
+            self._advance()
+            return [(hwnd, self._windows[hwnd]["title"]) for hwnd in self._z_order]
+
+    def get_rect(self, hwnd):
+        with self._lock:
+            self._advance()
+            window = self._windows.get(hwnd)
+            return window and window["rect"]
+
+    def title(self, hwnd):
+        with self._lock:
+            self._advance()
+            window = self._windows.get(hwnd)
+            return window["title"] if window else ""
+
+    def process_id(self, hwnd):
+        with self._lock:
+            self._advance()
+            window = self._windows.get(hwnd)
+            return PROCESS_IDS[window["kind"]] if window else 0
+
+    def foreground_window(self):
+        with self._lock:
+            self._advance()
+            return self._top()
+
+    def exists(self, hwnd):
+        with self._lock:
+            self._advance()
+            return hwnd in self._windows
+
+    def visible(self, hwnd):
+        # Simulated windows are never hidden, only closed
+        return self.exists(hwnd)
+
+    def activate(self, hwnd):
+        with self._lock:
+            self._advance()
+            self._schedule("activate", lambda due: self._raise(hwnd))
+
+    def close(self, hwnd):
+        with self._lock:
+            self._advance()
+            self._schedule("close", lambda due: self._close_window(hwnd))
+
+    @contextlib.contextmanager
+    def window_events(self):
+        """Sleep that wakes up when the next scripted reaction is due, like a window event would"""
+        def sleep(seconds):
+            with self._lock:
+                next_due = self._events[0][0] - self.clock() if self._events else seconds
+            cancellation.sleep(min(seconds, next_due))
+        yield sleep
+
+    # Input
+
+    def position(self):
+        with self._lock:
+            return self.mouse
+
+    def move_to(self, x, y=None):
+        with self._lock:
+            self.mouse = tuple(x) if y is None else (x, y)
+
+    def click(self, x, y):
+        with self._lock:
+            self._advance()
+            self.mouse = (x, y)
+            self.clicks.append((x, y))
+            if self._top("ivanti") and not self._find("credentials") and not self._find("confirm"):
+                left, top, right, bottom = self._ivanti_rect
+                width, height = right - left, bottom - top
+                box = self.session["connect_button"]
+                if (left + box[0] * width <= x <= left + box[2] * width
+                        and top + box[1] * height <= y <= top + box[3] * height):
+                    self._schedule("credentials_prompt", self._on_connect)
+
+    def write(self, text):
+        with self._lock:
+            self._advance()
+            self.typed.append(text)
+            if self._top("credentials"):
+                self._fields[self._fields["focus"]] += text
+
+    def press(self, key):
+        with self._lock:
+            self._advance()
+            if self._top("credentials"):
+                if key == "tab":
+                    self._fields["focus"] = "password" if self._fields["focus"] == "username" else "username"
+                elif key == "enter":
+                    self._close_window(self._top())
+                    self._schedule("confirm_prompt", self._on_credentials)
+            elif self._top("confirm") and key == "enter":
+                closed = self._schedule("confirm_closed", self._on_confirm)
+                # The tunnel comes up in the background once the dialog is gone
+                self.connected_at = closed + self.session["delays"]["tunnel"] * self.time_scale
+
+    def type_text(self, text):
+        """Like the batched input of the Win32 backend: all at once, tab and newline as keys"""
+        with self._lock:
+            for part in re.split(r"([\t\n])", text):
+                if part in KEYS:
+                    self.press(KEYS[part])
+                elif part:
+                    self.write(part)
+
+    def hotkey(self, *keys):
+        with self._lock:
+            self._advance()
+            browser = self._top("browser")
+            if browser and [key.lower() for key in keys] == ["ctrl", "w"]:
+                self._tabs.pop()
+                if not self._tabs:
+                    self._close_window(browser)
+
+    # Programs
+
+    def open_url(self, url):
+        with self._lock:
+            self._advance()
+            self.urls.append(url)
+
+            def show_tab(due):
+                browser = self._find("browser")
+                if browser is None:
+                    width, height = self.screen_size
+                    browser = self._open_window(f"{self.session['page_title']} - Web Browser", (0, 0, width, height - TASKBAR_HEIGHT), "browser")
+                self._tabs.append(url)
+                self._raise(browser)
+            self._schedule("new_tab" if self._find("browser") else "browser_start", show_tab)
+
+    def launch(self, path):
+        with self._lock:
+            self._advance()
+            self.launched.append(path)
+
+            def show_ivanti(due):
+                if self._find("ivanti") is None:
+                    self._open_window(IVANTI_TITLE, self._ivanti_rect, "ivanti")
+            self._schedule("ivanti_start", show_ivanti)
+
+    def get_password(self, service, username):
+        return self.session["password"] if username == self.session["username"] else None
+
+    def has_password(self, service, username):
+        return self.get_password(service, username) is not None
+
+    def message_box(self, message, title, style=0):
+        with self._lock:
+            self.messages.append((title, message))
+
+    def listen_for_escape(self, callback):
+        """There is no keyboard to press ESC on"""
+
+    def listen_for_hotkey(self, hotkey, callback):
+        """Nothing presses the hotkey, press_hotkey() stands in for it"""
+        self.hotkeys[hotkey] = callback
+
+    def press_hotkey(self, hotkey):
+        self.hotkeys[hotkey]()
+
+    def tunnel_up(self):
+        with self._lock:
+            return self.connected_at is not None and self.clock() >= self.connected_at
+
+    def connected_after(self):
+        """Seconds from the start of the session until the tunnel came up, None when it did not"""
+        with self._lock:
+            if self.connected_at is None:
+                return None
+            return self.connected_at - self.started_at
+
+class TunnelStandIn:
+    """Port on 127.0.0.1 that only takes connections once the simulated tunnel is up, a stand-in
+    for a host behind the VPN for the "tcp" tunnel probe"""
+
+    def __init__(self, desktop):
+        self.desktop = desktop
+        # Bound but not listening yet, so connecting is refused like an unreachable host
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.target = f"127.0.0.1:{self.port}"
+        self._closed = threading.Event()
+        threading.Thread(target=self._serve, name="tunnel stand-in", daemon=True).start()
+
+    def _serve(self):
+        while not self.desktop.tunnel_up():
+            if self._closed.wait(0.01):
+                return
+        try:
+            self._socket.listen()
+            while True:
+                connection, _ = self._socket.accept()
+                connection.close()
+        except OSError:
+            return  # Closed
+
+    def close(self):
+        self._closed.set()
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
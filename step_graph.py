@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import chrome_trace
+
+class StepError(Exception):
+    """A step failed on its last attempt"""
+
+    def __init__(self, step, error):
+        super().__init__(f"Step {step} failed: {error!r}")
+        self.step = step
+        self.error = error
+
+class Step:
+    """Named unit of work in a step graph
+
+    action is called with the results of the steps that finished so far (name -> value), once
+    every step in after finished. Plain functions run on a worker thread so blocking UI work
+    can overlap, coroutine functions run on the event loop. A step that raises or takes longer
+    than timeout seconds is tried again up to retries times, retry_delay seconds apart.
+
+    A thread can not be stopped from outside: when a plain function times out, its thread is
+    abandoned and finishes on its own, its result dropped. The step is not tried again while
+    that thread still runs, that would run the action twice at the same time.
+    """
+
+    def __init__(self, name, action, after=(), timeout=None, retries=0, retry_delay=0.0):
+        self.name = name
+        self.action = action
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+StepResult = namedtuple("StepResult", ["name", "value", "start", "end", "attempts", "after"])
+
+class Run:
+    """Results of a finished step graph, with times in seconds since the run started"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def value(self, name):
+        return self.results[name].value
+
+    def critical_path(self):
+        """Chain of steps that decided how long the run took: the step that finished last,
+        the dependency it waited on longest, and so on back to a step without dependencies"""
+        if not self.results:
+            return []
+        step = max(self.results.values(), key=lambda result: result.end)
+        path = [step]
+        while step.after:
+            step = max((self.results[name] for name in step.after), key=lambda result: result.end)
+            path.append(step)
+        return path[::-1]
+
+    def report(self):
+        """Readable summary of the critical path"""
+        path = self.critical_path()
+        lines = [f"Critical path {path[-1].end:.2f} s:" if path else "Critical path: no steps"]
+        for step in path:
+            retried = f", {step.attempts} attempts" if step.attempts > 1 else ""
+            lines.append(f"  {step.name:<20} {step.start:7.2f} s -> {step.end:7.2f} s ({step.end - step.start:.2f} s{retried})")
+        return "\n".join(lines)
+
+def check_graph(steps):
+    """Raise ValueError for duplicate names, unknown dependencies and cycles"""
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate step names")
+    by_name = {step.name: step for step in steps}
+    for step in steps:
+        for name in step.after:
+            if name not in by_name:
+                raise ValueError(f"Step {step.name} runs after unknown step {name}")
+
+    done, visiting = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Steps depend on each other in a cycle through {name}")
+        visiting.add(name)
+        for dependency in by_name[name].after:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in names:
+        visit(name)
+
+async def _attempt(step, values, attempt, executor, finished):
+    # The span is opened on the thread that does the work, so overlapping steps get their own track.
+    # finished is set once the action returned, raised or was cancelled
+    if inspect.iscoroutinefunction(step.action):
+        async def traced():
+            try:
+                with chrome_trace.span(step.name, "step", attempt=attempt):
+                    return await step.action(values)
+            finally:
+                finished.set()
+        work = traced()
+    else:
+        def traced():
+            try:
+                with chrome_trace.span(step.name, "step", attempt=attempt):
+                    return step.action(values)
+            finally:
+                finished.set()
+        # Like asyncio.to_thread, but on the run's own executor
+        call = functools.partial(contextvars.copy_context().run, traced)
+        work = asyncio.get_running_loop().run_in_executor(executor, call)
+    return await asyncio.wait_for(work, step.timeout)
+
+class _Stopped(Exception):
+    """Carries a SystemExit or KeyboardInterrupt of a step out of the event loop, so the other
+    steps are cancelled cleanly before it is raised again"""
+
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+async def run_steps(steps, clock=time.perf_counter):
+    """Run a step graph, every step as soon as the steps it runs after finished
+
+    Returns a Run. The first step that fails for good cancels the others and raises StepError;
+    BaseExceptions like SystemExit and KeyboardInterrupt pass through unchanged. Steps still
+    busy on a thread then are not waited for, the actions have to stop those themselves.
+    """
+    check_graph(steps)
+    origin = clock()
+    values = {}
+    results = {}
+    tasks = {}
+    # Not the loop's default executor, asyncio.run would wait for abandoned threads on shutdown
+    executor = ThreadPoolExecutor(thread_name_prefix="step")
+
+    async def run_step(step):
+        await asyncio.gather(*(tasks[name] for name in step.after))
+        start = clock() - origin
+        for attempt in range(1, step.retries + 2):
+            finished = threading.Event()
+            try:
+                value = await _attempt(step, dict(values), attempt, executor, finished)
+                break
+            except (SystemExit, KeyboardInterrupt) as error:
+                raise _Stopped(error)
+            except Exception as error:
+                if attempt > step.retries or not finished.is_set():
+                    raise StepError(step.name, error) from error
+                await asyncio.sleep(step.retry_delay)
+        values[step.name] = value
+        results[step.name] = StepResult(step.name, value, start, clock() - origin, attempt, step.after)
+
+    for step in steps:
+        tasks[step.name] = asyncio.ensure_future(run_step(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except _Stopped as stopped:
+        raise stopped.error from None
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        executor.shutdown(wait=False)
+    return Run(results)
+
+def run(steps):
+    """Run a step graph on a new event loop, see run_steps"""
+    return asyncio.run(run_steps(steps))
@@ -0,0 +1,87 @@
+import ui_wait
+
+# Longest wait in seconds (at speed_multiplier 1) for the UI to get where each step needs it,
+# used until the step has enough history
+DEFAULT_TIMEOUTS = {
+    "browser_window": 10,
+    "login_page": 2,
+    "ivanti_window": 10,
+    "ivanti_foreground": 2,
+    "credentials_prompt": 5,
+    "confirm_prompt": 3,
+    "confirm_closed": 10,
+    "browser_tab": 5,
+    "ivanti_closed": 3,
+    "tunnel_up": 15,
+}
+# The login page only shows up when the user is logged out, its wait says nothing about this PC
+FIXED_STEPS = ["login_page"]
+
+# Runs of each step that are remembered, and how many it needs before its timeout is learned
+HISTORY_LENGTH = 20
+MIN_RUNS = 3
+# Timeouts are a high percentile of the history with headroom, so a run a bit slower than
+# usual still makes it. They never drop below the default: a few runs with Ivanti already open
+# say nothing about how long a cold start takes
+PERCENTILE = 90
+HEADROOM = 1.5
+MAX_TIMEOUT = 60.0
+# A wait that timed out goes on for this part of its timeout more. When the step gets there
+# after all it did not fail, and its real duration is learned, so on a slow PC the timeout grows
+# instead of the step failing on every run
+LATE_GRACE = 0.5
+# A step is checked about this many times within its usual duration
+POLLS_PER_STEP = 10
+MIN_POLL, MAX_POLL = 0.05, 0.5
+
+def clamp(value, low, high):
+    return max(low, min(value, high))
+
+def percentile(values, percent):
+    """Nearest-rank percentile of values"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+def record(history, step, seconds):
+    """Add how long a step took to the history (step -> recent durations), oldest dropped first
+
+    Only record waits that succeeded, also late ones (see late_grace). A timeout says how long
+    was waited and not how long the step takes, so recording it would grow the timeout on every
+    run.
+    """
+    if step in FIXED_STEPS:
+        return
+    durations = history.setdefault(step, [])
+    durations.append(round(seconds, 3))
+    del durations[:-HISTORY_LENGTH]
+
+def learned_duration(history, step):
+    """High percentile of how long the step took, None while it has too little history"""
+    durations = history.get(step, [])
+    if step in FIXED_STEPS or len(durations) < MIN_RUNS:
+        return None
+    return percentile(durations, PERCENTILE)
+
+def step_timeout(history, step, speed_multiplier=1.0):
+    """Timeout of a step: the default adjusted for the speed multiplier, or longer when the step
+    took nearly that long before"""
+    default = DEFAULT_TIMEOUTS[step] / speed_multiplier
+    duration = learned_duration(history, step)
+    if duration is None:
+        return default
+    return clamp(duration * HEADROOM, default, max(default, MAX_TIMEOUT))
+
+def late_grace(step, timeout):
+    """Seconds a wait for step goes on after its timeout, 0 for the fixed steps, which are
+    expected to time out"""
+    if step in FIXED_STEPS:
+        return 0.0
+    return clamp(timeout * LATE_GRACE, 0.0, max(0.0, MAX_TIMEOUT - timeout))
+
+def poll_interval(history, step):
+    """Poll interval of a step, a fraction of its usual duration"""
+    duration = learned_duration(history, step)
+    if duration is None:
+        return ui_wait.DEFAULT_POLL
+    return clamp(duration / POLLS_PER_STEP, MIN_POLL, MAX_POLL)
@@ -0,0 +1,221 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+from PIL import Image
+
+import display_scale
+import image_matcher
+
+PACK_FILE = "templates.pack"
+PACK_MAGIC = b"VPNTPL01"
+PACK_ALIGNMENT = 64
+# Display scales the build step packs, the exe unpacks the whole pack at every start. Another
+# scale gets a pack of its own the first time it is used, see pack_paths
+BUNDLED_SCALES = [1.0]
+# Folder in %LOCALAPPDATA% of the pack the onefile exe adds other scales to
+USER_PACK_FOLDER = "VPN KUL"
+# Files in assets_connector that are not matching templates
+EXCLUDED_FILES = ["programicon.png"]
+
+# Validated packs of this process, pack path -> templates, so the sources are hashed only once
+_loaded_packs = {}
+
+def source_files(folder):
+    """List every PNG in folder the pack is built from, templates and their sidecar masks"""
+    names = [os.path.basename(path) for path in glob.glob(os.path.join(folder, "*.png"))]
+    return sorted(name for name in names if name not in EXCLUDED_FILES)
+
+def template_names(folder):
+    """List every connector template PNG in folder"""
+    return [name for name in source_files(folder) if not name.endswith(image_matcher.MASK_SUFFIX)]
+
+def template_sources(folder, names):
+    """List the PNGs a pack of the templates names is built from, the templates and the sidecar
+    masks they have"""
+    masks = [os.path.basename(image_matcher.mask_path(name)) for name in names]
+    return sorted(list(names) + [mask for mask in masks if os.path.exists(os.path.join(folder, mask))])
+
+def packed_names(templates):
+    """Names of the templates in a pack, without their scale and mask variants"""
+    return {key.split("@")[0].split("#")[0] for key in templates}
+
+def packed_scales(templates):
+    """Display scales of the variants in a pack"""
+    return {float(key.split("#")[0].partition("@")[2] or 1.0) for key in templates}
+
+def pack_file(scale):
+    """File name of the pack built at run time for a display scale, templates@1.5.pack for 150%"""
+    return PACK_FILE if scale == 1.0 else f"templates@{scale:g}.pack"
+
+def pack_paths(folder, scale):
+    """Packs of the templates in folder to load scale from: the bundled pack, then the pack of
+    that scale, the one rebuilt when variants are missing. Each scale has a pack of its own, so
+    adding one never replaces a pack the caller still has views of, which Windows refuses for a
+    mapped file. The pack of a scale is next to the templates, except in the onefile exe: its
+    folder is unpacked again at every start, so it keeps them in %LOCALAPPDATA% instead"""
+    folder_for_scale = folder
+    if getattr(sys, "frozen", False) and os.environ.get("LOCALAPPDATA"):
+        folder_for_scale = os.path.join(os.environ["LOCALAPPDATA"], USER_PACK_FOLDER)
+    paths = [os.path.join(folder, PACK_FILE), os.path.join(folder_for_scale, pack_file(scale))]
+    return paths[:1] if paths[0] == paths[1] else paths
+
+def source_hash(folder, names):
+    """Hash the raw bytes of the source PNGs so a stale pack can be detected"""
+    digest = hashlib.sha256()
+    for name in sorted(names):
+        digest.update(name.encode("utf-8") + b"\0")
+        with open(os.path.join(folder, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def variant_key(name, scale, mask=False):
+    """Pack key of a template (or mask) variant, the plain name for a 100% template"""
+    key = name if scale == 1.0 else f"{name}@{scale:g}"
+    return key + "#mask" if mask else key
+
+def scaled_variant(image, scale, mask=False):
+    """Resize a template the way the UI grows at a higher display scale"""
+    if scale == 1.0:
+        return image
+    height, width = image.shape[:2]
+    if mask:
+        resample = Image.Resampling.NEAREST
+    else:
+        resample = Image.Resampling.BILINEAR if scale > 1.0 else Image.Resampling.BOX
+    return np.asarray(Image.fromarray(image).resize((round(width * scale), round(height * scale)), resample))
+
+def _aligned(offset):
+    return (offset + PACK_ALIGNMENT - 1) // PACK_ALIGNMENT * PACK_ALIGNMENT
+
+def build_pack(folder, pack_path=None, names=None, scales=display_scale.COMMON_SCALES):
+    """Decode the templates names in folder, every template in it for None, to grayscale and
+    write them and their masks, with a variant per display scale, to one indexed pack file"""
+    if pack_path is None:
+        pack_path = os.path.join(folder, PACK_FILE)
+    if names is None:
+        names = template_names(folder)
+
+    images = {}
+    for name in names:
+        image = image_matcher.load_template(os.path.join(folder, name))
+        mask = image_matcher.load_mask(os.path.join(folder, name))
+        for scale in scales:
+            images[variant_key(name, scale)] = scaled_variant(image, scale)
+            if mask is not None:
+                images[variant_key(name, scale, mask=True)] = scaled_variant(mask, scale, mask=True)
+
+    # Offsets are relative to the start of the data section, which starts aligned after the index
+    index = {"source_hash": source_hash(folder, template_sources(folder, names)), "scales": list(scales), "templates": {}}
+    offset = 0
+    for name, image in images.items():
+        index["templates"][name] = {"offset": offset, "shape": list(image.shape)}
+        offset = _aligned(offset + image.nbytes)
+    index_bytes = json.dumps(index).encode("utf-8")
+    header = PACK_MAGIC + struct.pack("<I", len(index_bytes)) + index_bytes
+    data_start = _aligned(len(header))
+
+    temp_path = pack_path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(header.ljust(data_start, b"\0"))
+            for name, image in images.items():
+                f.seek(data_start + index["templates"][name]["offset"])
+                f.write(np.ascontiguousarray(image).tobytes())
+        os.replace(temp_path, pack_path)
+    except OSError:
+        # Like a pack that is still mapped on Windows, the next attempt writes it again
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return pack_path
+
+def open_pack(pack_path):
+    """Memory-map a pack file and return its source hash and zero-copy views of the templates"""
+    with open(pack_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(PACK_MAGIC)] != PACK_MAGIC:
+        raise ValueError(f"Not a template pack: {pack_path}")
+    index_start = len(PACK_MAGIC) + 4
+    (index_length,) = struct.unpack("<I", mapped[len(PACK_MAGIC):index_start])
+    index = json.loads(mapped[index_start:index_start + index_length])
+    data_start = _aligned(index_start + index_length)
+
+    # The arrays keep the mmap alive, so it is never closed explicitly
+    templates = {}
+    for name, entry in index["templates"].items():
+        height, width = entry["shape"]
+        view = np.frombuffer(mapped, dtype=np.uint8, count=height * width, offset=data_start + entry["offset"])
+        templates[name] = view.reshape(height, width)
+    return index["source_hash"], templates
+
+def _open_fresh_pack(folder, pack_path):
+    """Templates of a pack and whether it still matches its source PNGs, no templates when it is
+    missing or not a pack"""
+    try:
+        pack_hash, templates = open_pack(pack_path)
+    except (OSError, ValueError):
+        return {}, False
+    return templates, pack_hash == source_hash(folder, template_sources(folder, packed_names(templates)))
+
+def _load_pack(folder, pack_path, names, scale):
+    """Templates of the first pack of folder that has names at scale, see pack_paths. When none
+    has them, the last pack is rebuilt first with its templates and scales plus names and scale,
+    also when its source PNGs changed. None when the pack can not be written"""
+    keys = [variant_key(name, scale) for name in names]
+    paths = [pack_path] if pack_path else pack_paths(folder, scale)
+    for path in paths:
+        templates = _loaded_packs.get(path)
+        if templates is None:
+            templates, fresh = _open_fresh_pack(folder, path)
+            if not fresh:
+                continue
+            _loaded_packs[path] = templates
+        if all(key in templates for key in keys):
+            return templates
+
+    path = paths[-1]
+    # Drop the cached views first, Windows only lets us replace the file once nothing maps it
+    _loaded_packs.pop(path, None)
+    templates, _ = _open_fresh_pack(folder, path)
+    packed, scales = packed_names(templates), packed_scales(templates)
+    templates = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build_pack(folder, path, sorted(packed | set(names)), sorted(scales | {scale}))
+        _, templates = open_pack(path)
+    except OSError:
+        return None
+    _loaded_packs[path] = templates
+    return templates
+
+def load_templates(folder, names, scale=1.0, pack_path=None):
+    """Load the templates for a display scale from the pack in folder, rebuilding it first when
+    the source PNGs changed"""
+    templates = _load_pack(folder, pack_path, names, scale)
+    if templates is None:
+        # Read-only install, decode the PNGs directly like before
+        return {name: scaled_variant(image, scale) for name, image in image_matcher.load_templates(folder, names).items()}
+    return {name: templates[variant_key(name, scale)] for name in names}
+
+def load_masks(folder, names, scale=1.0, pack_path=None):
+    """Load the masks for a display scale, None for templates without a mask"""
+    templates = _load_pack(folder, pack_path, names, scale)
+    if templates is None:
+        masks = {name: image_matcher.load_mask(os.path.join(folder, name)) for name in names}
+        return {name: None if mask is None else scaled_variant(mask, scale, mask=True) for name, mask in masks.items()}
+    return {name: templates.get(variant_key(name, scale, mask=True)) for name in names}
+
+if __name__ == "__main__":
+    # Build step, run before pyinstaller so the pack is bundled with assets_connector. Only the
+    # templates the connector matches at BUNDLED_SCALES are packed, the exe unpacks the whole
+    # pack at every start
+    import recognition  # Imports this module, so not at the top
+    assets_folder = sys.argv[1] if len(sys.argv) > 1 else "assets_connector"
+    print(f"Wrote {build_pack(assets_folder, names=recognition.IVANTI_TEMPLATES + recognition.LOGIN_TEMPLATES, scales=BUNDLED_SCALES)}")
@@ -0,0 +1,73 @@
+import contextlib
+import time
+
+import pytest
+
+import cancellation
+
+
+class FakeClock:
+    """Clock that only moves when the waiting code sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeWindows:
+    """Window backend with a fixed set of windows, for running without user32."""
+
+    def __init__(self, windows, foreground=None, processes=None):
+        self.windows = windows
+        self.foreground = foreground
+        self.processes = processes or {}
+        self.activated = []
+
+    def visible_windows(self):
+        return [(hwnd, title) for hwnd, (title, _) in self.windows.items()]
+
+    def get_rect(self, hwnd):
+        return self.windows[hwnd][1]
+
+    def title(self, hwnd):
+        return self.windows[hwnd][0]
+
+    def foreground_window(self):
+        return self.foreground
+
+    def exists(self, hwnd):
+        return hwnd in self.windows
+
+    def visible(self, hwnd):
+        return hwnd in self.windows
+
+    def process_id(self, hwnd):
+        # Every window is its own process unless told otherwise
+        return self.processes.get(hwnd, hwnd) if hwnd in self.windows else 0
+
+    def activate(self, hwnd):
+        self.activated.append(hwnd)
+        self.foreground = hwnd
+
+    @contextlib.contextmanager
+    def window_events(self):
+        yield time.sleep
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(autouse=True)
+def reset_cancellation():
+    """A run that failed leaves its steps cancelled, the next test starts without that."""
+    yield
+    cancellation.reset()
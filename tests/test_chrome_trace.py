@@ -0,0 +1,107 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+import chrome_trace
+import image_matcher
+import step_graph
+
+
+@pytest.fixture
+def tracer():
+    """Tracing turned on for one test."""
+    yield chrome_trace.enable()
+    chrome_trace.disable()
+
+
+class TestSpans:
+    """Test recording spans as Chrome trace events."""
+
+    def test_span_records_complete_event_with_attributes(self, tracer):
+        with chrome_trace.span("os.startfile", path="Ivanti.lnk") as attributes:
+            attributes["started"] = True
+
+        (event,) = tracer.events
+        assert event["name"] == "os.startfile"
+        assert event["ph"] == "X"
+        assert event["args"] == {"path": "Ivanti.lnk", "started": True}
+        assert event["dur"] >= 0
+
+    def test_nested_span_lies_within_outer_span(self, tracer):
+        with chrome_trace.span("outer"):
+            with chrome_trace.span("inner"):
+                pass
+
+        inner, outer = tracer.events
+        assert outer["ts"] <= inner["ts"]
+        assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+    def test_span_is_recorded_when_body_raises(self, tracer):
+        with pytest.raises(OSError):
+            with chrome_trace.span("webbrowser.open"):
+                raise OSError("no browser")
+
+        assert [event["name"] for event in tracer.events] == ["webbrowser.open"]
+
+    def test_nothing_is_recorded_while_off(self, tmp_path):
+        with chrome_trace.span("os.startfile") as attributes:
+            attributes["started"] = True
+
+        assert not chrome_trace.enabled()
+        assert chrome_trace.write(tmp_path / "trace.json") is None
+        assert not (tmp_path / "trace.json").exists()
+
+    def test_write_names_threads(self, tracer, tmp_path):
+        with chrome_trace.span("main"):
+            pass
+
+        def work():
+            with chrome_trace.span("match"):
+                pass
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+        trace = json.loads(open(chrome_trace.write(str(tmp_path / "trace.json"))).read())
+
+        names = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+        assert {"MainThread", "worker"} <= names
+        assert {event["name"] for event in trace["traceEvents"] if event["ph"] == "X"} == {"main", "match"}
+
+    def test_annotation_is_written_as_metadata(self, tracer, tmp_path):
+        chrome_trace.annotate("critical_path", ["Critical path 1.00 s:"])
+
+        trace = json.loads(open(chrome_trace.write(str(tmp_path / "trace.json"))).read())
+
+        assert trace["otherData"] == {"critical_path": ["Critical path 1.00 s:"]}
+
+
+class TestInstrumentation:
+    """Test the spans the step graph and the matcher leave behind."""
+
+    def test_every_step_attempt_is_a_span(self, tracer):
+        attempts = []
+
+        def flaky(results):
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise OSError("busy")
+
+        step_graph.run([step_graph.Step("password", flaky, retries=1), step_graph.Step("type", lambda results: None, after=["password"])])
+
+        steps = [(event["name"], event["args"]["attempt"]) for event in tracer.events if event["cat"] == "step"]
+        assert steps == [("password", 1), ("password", 2), ("type", 1)]
+
+    def test_match_span_carries_template_scores_and_thresholds(self, tracer):
+        screen = np.random.default_rng(0).integers(0, 256, size=(240, 320), dtype=np.uint8)
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+
+        image_matcher.score_templates(templates, screen, thresholds={"window.png": 0.85})
+
+        (event,) = [event for event in tracer.events if event["name"] == "match"]
+        (result,) = event["args"]["results"]
+        assert result["template"] == "window.png"
+        assert result["threshold"] == 0.85
+        assert result["found"] and result["score"] == pytest.approx(1.0, abs=1e-3)
+        assert result["at"] == [70, 50]
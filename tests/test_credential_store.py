@@ -0,0 +1,61 @@
+import ctypes
+
+import credential_store
+
+
+class FakeAdvapi32:
+    """CredEnumerateW and CredFree over a list of (type, target, username, secret)."""
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.freed = 0
+        self._kept = []
+
+    def CredEnumerateW(self, filter, flags, count, credentials):
+        prefix = filter[:-1] if filter.endswith("*") else filter
+        found = [credential_store.CREDENTIALW(Type=kind, TargetName=target, UserName=username,
+                                              CredentialBlobSize=len(secret))
+                 for kind, target, username, secret in self.credentials if target.startswith(prefix)]
+        if not found:
+            return False
+        pointers = (credential_store.PCREDENTIALW * len(found))(*[ctypes.pointer(credential) for credential in found])
+        self._kept.append((found, pointers))
+        count._obj.value = len(found)
+        credentials._obj.contents = pointers[0]
+        return True
+
+    def CredFree(self, buffer):
+        self.freed += 1
+
+
+class TestPasswordSaved:
+    """Test looking up a keyring password without reading it."""
+
+    def test_saved_under_service_name(self):
+        advapi32 = FakeAdvapi32([(credential_store.CRED_TYPE_GENERIC, "kuleuvenvpn", "r0123456", "secret")])
+
+        assert credential_store.password_saved("kuleuvenvpn", "r0123456", advapi32)
+        assert advapi32.freed == 1
+
+    def test_saved_under_compound_name(self):
+        advapi32 = FakeAdvapi32([(credential_store.CRED_TYPE_GENERIC, "kuleuvenvpn", "r0000001", "other"),
+                                 (credential_store.CRED_TYPE_GENERIC, "r0123456@kuleuvenvpn", "r0123456", "secret")])
+
+        assert credential_store.password_saved("kuleuvenvpn", "r0123456", advapi32)
+
+    def test_other_user_only(self):
+        advapi32 = FakeAdvapi32([(credential_store.CRED_TYPE_GENERIC, "kuleuvenvpn", "r0000001", "other")])
+
+        assert not credential_store.password_saved("kuleuvenvpn", "r0123456", advapi32)
+
+    def test_longer_names_and_other_types_do_not_count(self):
+        advapi32 = FakeAdvapi32([(credential_store.CRED_TYPE_GENERIC, "kuleuvenvpn-old", "r0123456", "old"),
+                                 (2, "kuleuvenvpn", "r0123456", "domain")])
+
+        assert not credential_store.password_saved("kuleuvenvpn", "r0123456", advapi32)
+
+    def test_nothing_saved(self):
+        advapi32 = FakeAdvapi32([])
+
+        assert not credential_store.password_saved("kuleuvenvpn", "r0123456", advapi32)
+        assert advapi32.freed == 0
@@ -0,0 +1,30 @@
+import display_scale
+
+
+class FakeDisplayScale:
+    """Display scale backend that reports a fixed scale."""
+
+    def __init__(self, scale):
+        self._scale = scale
+
+    def scale(self):
+        return self._scale
+
+
+class TestScaleOrder:
+    """Test which template variants are tried first for a display."""
+
+    def test_detected_scale_comes_first(self):
+        order = display_scale.scale_order(FakeDisplayScale(1.5).scale())
+
+        assert order[0] == 1.5
+        assert sorted(order) == display_scale.COMMON_SCALES
+
+    def test_neighbouring_scales_follow(self):
+        assert display_scale.scale_order(FakeDisplayScale(1.25).scale())[:3] == [1.25, 1.0, 1.5]
+
+    def test_uncommon_scale_starts_at_nearest_variant(self):
+        assert display_scale.scale_order(FakeDisplayScale(1.4).scale())[0] == 1.5
+
+    def test_relative_to_scale_of_reference_images(self):
+        assert display_scale.scale_order(FakeDisplayScale(1.5).scale(), template_scale=1.25)[0] == 1.25
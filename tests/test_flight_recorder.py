@@ -0,0 +1,113 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import chrome_trace
+import flight_recorder
+import image_matcher
+import window_discovery
+from conftest import FakeWindows
+
+
+@pytest.fixture(autouse=True)
+def empty_recorder():
+    flight_recorder.clear()
+    yield
+    flight_recorder.clear()
+
+
+class TestRingBuffer:
+    """Test the in-memory event buffer."""
+
+    def test_keeps_only_the_latest_events(self):
+        for number in range(flight_recorder.CAPACITY + 10):
+            flight_recorder.record("tick", number=number)
+
+        recorded = flight_recorder.events()
+        assert len(recorded) == flight_recorder.CAPACITY
+        assert recorded[0][4] == {"number": 10}
+        assert recorded[-1][4] == {"number": flight_recorder.CAPACITY + 9}
+
+    def test_recording_does_no_io_and_stays_bounded(self, monkeypatch):
+        """Cheap enough to leave on: an event is a tuple in memory, a full buffer does not grow."""
+        def no_io(*args, **kwargs):
+            raise AssertionError("recording an event opened a file")
+        monkeypatch.setattr("builtins.open", no_io)
+        for number in range(flight_recorder.CAPACITY):
+            flight_recorder.record("end", "match", seconds=0.1, score=0.9)
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            for number in range(2 * flight_recorder.CAPACITY):
+                flight_recorder.record("end", "match", seconds=0.1, score=0.9)
+            growth = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        assert len(flight_recorder.events()) == flight_recorder.CAPACITY
+        assert growth < 16 * 1024
+
+
+class TestDump:
+    """Test writing the buffer to the log file."""
+
+    def test_writes_reason_and_every_event(self, tmp_path):
+        flight_recorder.record("start", "click_connect")
+        flight_recorder.record("failure", message="Failed to find the connect button.")
+
+        path = flight_recorder.dump("failure", tmp_path / "failure.log")
+
+        lines = open(path, encoding="utf-8").read().splitlines()
+        assert lines[0] == "VPN KUL connector stopped: failure"
+        assert "[MainThread] start click_connect" in lines[2]
+        assert lines[3].endswith('failure {"message": "Failed to find the connect button."}')
+
+    def test_nothing_is_written_without_dump(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+        flight_recorder.record("start", "click_connect")
+
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestRecordedEvents:
+    """Test what the connector leaves in the recorder."""
+
+    def test_spans_record_start_end_and_timing_while_tracing_is_off(self):
+        with chrome_trace.span("os.startfile", path="Ivanti.lnk"):
+            pass
+
+        (start, end) = flight_recorder.events()
+        assert (start[2], start[3]) == ("start", "os.startfile")
+        assert (end[2], end[3]) == ("end", "os.startfile")
+        assert end[4]["path"] == "Ivanti.lnk" and end[4]["seconds"] >= 0
+
+    def test_failed_span_records_error(self):
+        with pytest.raises(OSError):
+            with chrome_trace.span("webbrowser.open"):
+                raise OSError("no browser")
+
+        assert "OSError" in flight_recorder.events()[-1][4]["error"]
+
+    def test_match_scores_are_recorded(self):
+        screen = np.random.default_rng(0).integers(0, 256, size=(240, 320), dtype=np.uint8)
+
+        image_matcher.score_templates({"window.png": screen[50:110, 70:150].copy()}, screen, thresholds={"window.png": 0.85})
+
+        (end,) = [event for event in flight_recorder.events() if event[2:4] == ("end", "match")]
+        assert end[4]["results"][0]["template"] == "window.png"
+        assert end[4]["results"][0]["found"]
+
+    def test_window_titles_are_recorded_when_they_change(self, monkeypatch):
+        monkeypatch.setattr(window_discovery, "_recorded_titles", None)
+        windows = FakeWindows({1: ("Explorer", None)})
+
+        window_discovery.find_ivanti_window(windows)
+        window_discovery.find_ivanti_window(windows)
+        windows.windows[2] = ("Ivanti Secure Access Client", None)
+        window_discovery.find_ivanti_window(windows)
+
+        titles = [event[4]["titles"] for event in flight_recorder.events() if event[2] == "windows"]
+        assert titles == [["Explorer"], ["Explorer", "Ivanti Secure Access Client"]]
@@ -0,0 +1,302 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_matcher
+
+
+@pytest.fixture
+def screen():
+    """Noisy grayscale 'screen' that templates can be cut out of."""
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, size=(240, 320), dtype=np.uint8)
+
+
+class TestFindBestMatch:
+    """Test matching several templates against one capture."""
+
+    def test_returns_location_and_score_of_best_template(self, screen):
+        templates = {
+            "other.png": np.random.default_rng(1).integers(0, 256, size=(30, 40), dtype=np.uint8),
+            "window.png": screen[50:110, 70:150].copy(),
+        }
+
+        match = image_matcher.find_best_match(templates, screen=screen)
+
+        assert match.template == "window.png"
+        assert (match.left, match.top, match.width, match.height) == (70, 50, 80, 60)
+        assert match.score == pytest.approx(1.0, abs=1e-3)
+
+    def test_returns_none_below_confidence(self, screen):
+        templates = {"other.png": np.random.default_rng(1).integers(0, 256, size=(30, 40), dtype=np.uint8)}
+
+        assert image_matcher.find_best_match(templates, screen=screen, confidence=0.9) is None
+
+    def test_template_larger_than_screen_never_matches(self, screen):
+        templates = {"huge.png": np.zeros((300, 400), dtype=np.uint8)}
+
+        assert image_matcher.find_best_match(templates, screen=screen, confidence=0.0) is None
+
+    def test_captures_screen_only_once(self, screen, monkeypatch):
+        calls = []
+        monkeypatch.setattr(image_matcher, "grab_screen", lambda region=None: calls.append(region) or screen)
+        templates = {name: screen[i:i + 20, i:i + 20].copy() for i, name in enumerate(["a", "b", "c", "d"])}
+
+        image_matcher.find_best_match(templates)
+
+        assert len(calls) == 1
+
+
+def test_load_templates_keeps_order_and_converts_to_gray():
+    templates = image_matcher.load_templates("assets_connector", ["full_ivanti1.png", "A_zone.png"])
+
+    assert list(templates) == ["full_ivanti1.png", "A_zone.png"]
+    assert all(template.ndim == 2 for template in templates.values())
+
+
+class TestScoreTemplates:
+    """Test scoring every template once against a per-template threshold table."""
+
+    def test_exposes_score_and_threshold_of_every_template(self, screen):
+        templates = {
+            "other.png": np.random.default_rng(1).integers(0, 256, size=(30, 40), dtype=np.uint8),
+            "window.png": screen[50:110, 70:150].copy(),
+        }
+
+        matches = image_matcher.score_templates(templates, screen=screen, thresholds={"window.png": 0.99}, confidence=0.5)
+
+        assert [match.template for match in matches] == ["window.png", "other.png"]
+        assert [match.threshold for match in matches] == [0.99, 0.5]
+        assert matches[0].found
+        assert not matches[1].found
+
+    def test_closest_miss_comes_first_when_nothing_passes(self, screen):
+        window = screen[50:110, 70:150].copy()
+        window[::2] = 255 - window[::2]
+        templates = {
+            "other.png": np.random.default_rng(1).integers(0, 256, size=(30, 40), dtype=np.uint8),
+            "window.png": window,
+        }
+
+        matches = image_matcher.score_templates(templates, screen=screen, confidence=0.99)
+
+        assert not matches[0].found
+        assert matches[0].score == max(match.score for match in matches)
+        assert image_matcher.find_best_match(templates, screen=screen, confidence=0.99) is None
+
+    def test_passing_template_beats_higher_scoring_miss(self, screen):
+        templates = {
+            "strict.png": screen[50:110, 70:150].copy(),
+            "loose.png": screen[100:140, 200:260].copy(),
+        }
+
+        match = image_matcher.find_best_match(templates, screen=screen, thresholds={"strict.png": 1.1, "loose.png": 0.5})
+
+        assert match.template == "loose.png"
+
+
+class TestPyramid:
+    """Test the coarse-to-fine search against the full-resolution one."""
+
+    @pytest.fixture
+    def desktop(self):
+        """Smooth 'desktop' with the Ivanti window pasted on it."""
+        ivanti = image_matcher.load_template("assets_connector/full_ivanti2.png")
+        frame = np.full((1080, 1920), 200, dtype=np.uint8)
+        frame[100:300, 200:900] = 90
+        frame[333:333 + ivanti.shape[0], 1011:1011 + ivanti.shape[1]] = ivanti
+        return frame, ivanti
+
+    @pytest.mark.parametrize("factor", [4, 8])
+    def test_finds_same_location_as_full_search(self, desktop, factor):
+        frame, ivanti = desktop
+
+        score, location = image_matcher.pyramid_score_template(frame, ivanti, factor)
+
+        assert location == (1011, 333)
+        assert score == pytest.approx(image_matcher.score_template(frame, ivanti)[0], abs=1e-4)
+
+    def test_small_template_falls_back_to_full_search(self, screen):
+        template = screen[10:30, 10:30].copy()
+
+        assert image_matcher.pyramid_score_template(screen, template, 4) == image_matcher.score_template(screen, template)
+
+    def test_score_templates_uses_pyramid(self, desktop):
+        frame, ivanti = desktop
+
+        match = image_matcher.find_best_match({"full_ivanti2.png": ivanti}, frame, confidence=0.9, pyramid=4)
+
+        assert (match.left, match.top) == (1011, 333)
+
+
+class TestConcurrentSearch:
+    """Test scoring templates on a thread pool, where the first hit cancels the rest."""
+
+    @pytest.fixture
+    def templates(self, screen):
+        """One template cut from the screen and misses of different sizes, so each is its own batch."""
+        rng = np.random.default_rng(1)
+        misses = {f"miss{size}.png": rng.integers(0, 256, size=(size, size), dtype=np.uint8) for size in range(20, 25)}
+        return {"hit.png": screen[50:110, 70:150].copy(), **misses}
+
+    def test_same_scores_as_sequential_search_without_a_hit(self, screen, templates):
+        del templates["hit.png"]
+
+        concurrent = image_matcher.score_templates(templates, screen, confidence=0.9, workers=4)
+
+        assert concurrent == image_matcher.score_templates(templates, screen, confidence=0.9)
+
+    def test_first_hit_cancels_remaining_templates(self, screen, templates, monkeypatch):
+        score_batch = image_matcher.score_batch
+
+        def slow_misses(correlator, batch, mask=None):
+            if batch[0].shape != (60, 80):
+                time.sleep(0.5)
+            return score_batch(correlator, batch, mask)
+        monkeypatch.setattr(image_matcher, "score_batch", slow_misses)
+
+        start = time.perf_counter()
+        matches = image_matcher.score_templates(templates, screen, confidence=0.9, workers=2)
+
+        assert time.perf_counter() - start < 0.5
+        assert matches[0].template == "hit.png" and matches[0].found
+        assert len(matches) < len(templates)
+
+    def test_searches_share_one_thread_pool(self, screen, templates, monkeypatch):
+        pools = []
+        worker_pool = image_matcher.worker_pool
+        monkeypatch.setattr(image_matcher, "worker_pool", lambda workers: pools.append(worker_pool(workers)) or pools[-1])
+
+        for _ in range(3):
+            image_matcher.score_templates(templates, screen, confidence=0.9, workers=2)
+
+        assert len(pools) == 3 and len(set(pools)) == 1
+
+    def test_single_batch_is_scored_without_the_pool(self, screen, monkeypatch):
+        monkeypatch.setattr(image_matcher, "worker_pool", lambda workers: pytest.fail("used the pool"))
+
+        matches = image_matcher.score_templates({"hit.png": screen[50:110, 70:150].copy()}, screen, confidence=0.9, workers=4)
+
+        assert matches[0].found
+
+    def test_cancel_stops_pyramid_refinement(self):
+        ivanti = image_matcher.load_template("assets_connector/full_ivanti2.png")
+        frame = np.full((1080, 1920), 200, dtype=np.uint8)
+        frame[333:333 + ivanti.shape[0], 1011:1011 + ivanti.shape[1]] = ivanti
+        cancel = threading.Event()
+        cancel.set()
+
+        assert image_matcher.pyramid_score_batch(frame, [ivanti], 4, cancel=cancel) == [(-1.0, (0, 0))]
+
+
+class TestMasks:
+    """Test matching that ignores the volatile, masked-out part of a template."""
+
+    def test_masked_region_does_not_lower_score(self, screen):
+        template = screen[50:110, 70:150].copy()
+        changed = screen.copy()
+        changed[70:90, 80:140] = 255 - changed[70:90, 80:140]
+        mask = np.full(template.shape, 255, dtype=np.uint8)
+        mask[20:40, 10:70] = 0
+
+        masked = image_matcher.find_best_match({"window.png": template}, changed, masks={"window.png": mask})
+        plain = image_matcher.find_best_match({"window.png": template}, changed)
+
+        assert masked.score == pytest.approx(1.0, abs=1e-3)
+        assert (masked.left, masked.top) == (70, 50)
+        assert plain.score < 0.9
+
+    def test_load_mask_from_alpha_channel(self, tmp_path):
+        image = np.full((10, 12, 4), 255, dtype=np.uint8)
+        image[2:5, 3:6, 3] = 0
+        Image.fromarray(image).save(tmp_path / "window.png")
+
+        mask = image_matcher.load_mask(str(tmp_path / "window.png"))
+
+        assert mask.shape == (10, 12)
+        assert (mask[2:5, 3:6] == 0).all()
+        assert mask.sum() == 255 * (120 - 9)
+
+    def test_load_sidecar_mask(self, tmp_path):
+        Image.fromarray(np.full((10, 12, 4), 255, dtype=np.uint8)).save(tmp_path / "window.png")
+        sidecar = np.full((10, 12), 255, dtype=np.uint8)
+        sidecar[:5] = 0
+        Image.fromarray(sidecar).save(tmp_path / "window.mask.png")
+
+        mask = image_matcher.load_mask(str(tmp_path / "window.png"))
+
+        assert (mask[:5] == 0).all() and (mask[5:] == 255).all()
+
+    def test_opaque_template_without_sidecar_has_no_mask(self):
+        assert image_matcher.load_mask("assets_connector/A_zone.png") is None
+
+
+class TestLastMatch:
+    """Test the last-known-location fast path."""
+
+    @pytest.fixture
+    def desktop(self, screen, monkeypatch):
+        """Make grab_screen crop regions out of the fixture screen."""
+        captures = []
+
+        def grab_screen(region=None):
+            captures.append(region)
+            if region is None:
+                return screen
+            left, top, width, height = region
+            return screen[top:top + height, left:left + width]
+
+        monkeypatch.setattr(image_matcher, "grab_screen", grab_screen)
+        return captures
+
+    def test_unchanged_pixels_skip_template_search(self, screen, desktop, monkeypatch):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        match = image_matcher.find_best_match(templates, screen=screen)
+        last_match = image_matcher.remember_match(match, screen)
+        monkeypatch.setattr(image_matcher, "find_best_match", lambda *args, **kwargs: pytest.fail("searched"))
+
+        found, _, _ = image_matcher.check_last_match(last_match, templates, confidence=0.9)
+
+        assert (found.left, found.top, found.width, found.height) == (70, 50, 80, 60)
+        assert desktop == [(54, 34, 112, 92)]
+
+    def test_unchanged_pixels_below_a_raised_threshold_fall_back(self, screen, desktop):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        match = image_matcher.find_best_match(templates, screen=screen)
+        last_match = {**image_matcher.remember_match(match, screen), "score": 0.86}
+
+        assert image_matcher.check_last_match(last_match, templates, thresholds={"window.png": 0.9}) is None
+        assert desktop == [(54, 34, 112, 92)]
+
+    def test_moved_window_is_found_by_local_rematch(self, screen, desktop):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        last_match = {"bbox": [64, 58, 80, 60], "template": "window.png", "score": 1.0, "pixel_hash": "stale"}
+
+        found, _, _ = image_matcher.check_last_match(last_match, templates, confidence=0.9)
+
+        assert (found.left, found.top) == (70, 50)
+
+    def test_window_gone_falls_back(self, screen, desktop):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        last_match = {"bbox": [200, 150, 80, 60], "template": "window.png", "score": 1.0, "pixel_hash": "stale"}
+
+        assert image_matcher.check_last_match(last_match, templates, confidence=0.9) is None
+
+    def test_unknown_template_falls_back(self, screen, desktop):
+        last_match = {"bbox": [0, 0, 10, 10], "template": "removed.png", "score": 1.0, "pixel_hash": ""}
+
+        assert image_matcher.check_last_match(last_match, {}, confidence=0.9) is None
+        assert desktop == []
+
+    def test_remembered_scale_is_kept(self, screen, desktop):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        match = image_matcher.find_best_match(templates, screen=screen)._replace(scale=1.5)
+        last_match = image_matcher.remember_match(match, screen)
+
+        found, _, _ = image_matcher.check_last_match(last_match, templates)
+
+        assert last_match["scale"] == 1.5
+        assert found.scale == 1.5
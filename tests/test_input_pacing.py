@@ -0,0 +1,74 @@
+import pytest
+
+import cancellation
+import input_pacing
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.calls = []
+        self.windows = "windows"
+
+    def click(self, x, y):
+        self.calls.append(("click", x, y))
+
+    def hotkey(self, *keys):
+        self.calls.append(("hotkey",) + keys)
+
+    def move_to(self, x, y=None):
+        self.calls.append(("move_to", x, y))
+
+    def position(self):
+        return (5, 5)
+
+
+class TestPacedInput:
+    """Test the explicit delays after input actions."""
+
+    def test_waits_the_delay_of_each_kind(self, clock):
+        backend = input_pacing.PacedInput(RecordingBackend(), sleep=clock.sleep)
+
+        backend.click(1, 2)
+        backend.move_to(0, 1)
+        backend.hotkey("ctrl", "w")
+
+        assert backend.backend.calls == [("click", 1, 2), ("move_to", 0, 1), ("hotkey", "ctrl", "w")]
+        # Moving the mouse has no delay, so it does not sleep at all
+        assert clock.sleeps == pytest.approx([input_pacing.DEFAULT_DELAYS["click"], input_pacing.DEFAULT_DELAYS["hotkey"]])
+        assert backend.total == pytest.approx(sum(clock.sleeps))
+        assert backend.actions == 3
+
+    def test_profile_overrides_and_speed_multiplier(self, clock):
+        backend = input_pacing.PacedInput(RecordingBackend(), {"click": 0.3}, speed_multiplier=2, sleep=clock.sleep)
+
+        backend.click(1, 2)
+        backend.hotkey("ctrl", "w")
+
+        assert clock.sleeps == pytest.approx([0.15, input_pacing.DEFAULT_DELAYS["hotkey"] / 2])
+
+    def test_everything_else_is_passed_on(self, clock):
+        backend = input_pacing.PacedInput(RecordingBackend(), sleep=clock.sleep)
+
+        assert backend.position() == (5, 5)
+        assert backend.windows == "windows"
+        assert clock.sleeps == [] and backend.actions == 0
+
+    def test_configure_starts_a_new_total(self, clock):
+        backend = input_pacing.PacedInput(RecordingBackend(), sleep=clock.sleep)
+        backend.click(1, 2)
+
+        backend.configure({"click": 0})
+        backend.click(1, 2)
+
+        assert backend.total == 0 and backend.actions == 1
+
+    def test_stopped_run_does_no_more_input(self, clock):
+        backend = input_pacing.PacedInput(RecordingBackend(), sleep=clock.sleep)
+        cancellation.cancel()
+        try:
+            with pytest.raises(cancellation.Cancelled):
+                backend.click(1, 2)
+        finally:
+            cancellation.reset()
+
+        assert backend.backend.calls == []
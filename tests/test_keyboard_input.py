@@ -0,0 +1,76 @@
+import ctypes
+
+import pytest
+
+import keyboard_input
+
+
+class FakeUser32:
+    """SendInput that turns the key events back into what a focused text field would receive."""
+
+    def __init__(self, accept=None):
+        self.calls = 0
+        self.received = []
+        self.accept = accept
+
+    def SendInput(self, count, inputs, size):
+        assert size == ctypes.sizeof(keyboard_input.INPUT)
+        self.calls += 1
+        sent = count if self.accept is None else min(count, self.accept)
+        for event in inputs[:sent]:
+            assert event.type == keyboard_input.INPUT_KEYBOARD
+            self.received.append((event.ki.wVk, event.ki.wScan, event.ki.dwFlags))
+        return sent
+
+    def text(self):
+        """Typed text, from the key down events"""
+        units = bytearray()
+        keys = {virtual_key: character for character, virtual_key in keyboard_input.KEYS.items()}
+        for virtual_key, scan, flags in self.received:
+            if flags & keyboard_input.KEYEVENTF_KEYUP:
+                continue
+            if flags & keyboard_input.KEYEVENTF_UNICODE:
+                units += scan.to_bytes(2, "little")
+            else:
+                units += keys[virtual_key].encode("utf-16-le")
+        return units.decode("utf-16-le")
+
+
+class TestSendText:
+    """Test typing text as one batch of Unicode key events."""
+
+    def test_credentials_in_one_call(self):
+        user32 = FakeUser32()
+
+        keyboard_input.send_text("r0123456\tcorrect horse\n", user32)
+
+        assert user32.calls == 1
+        assert user32.text() == "r0123456\tcorrect horse\n"
+
+    def test_tab_and_enter_are_keys(self):
+        user32 = FakeUser32()
+
+        keyboard_input.send_text("\t\n", user32)
+
+        assert user32.received == [(keyboard_input.VK_TAB, 0, 0), (keyboard_input.VK_TAB, 0, keyboard_input.KEYEVENTF_KEYUP),
+                                    (keyboard_input.VK_RETURN, 0, 0), (keyboard_input.VK_RETURN, 0, keyboard_input.KEYEVENTF_KEYUP)]
+
+    def test_characters_every_layout_lacks(self):
+        # é and € need AltGr or dead keys on some layouts, the emoji is a surrogate pair
+        user32 = FakeUser32()
+
+        keyboard_input.send_text("aé€😀", user32)
+
+        assert user32.text() == "aé€😀"
+        assert len(user32.received) == 2 * 5
+
+    def test_nothing_to_type(self):
+        user32 = FakeUser32()
+
+        keyboard_input.send_text("", user32)
+
+        assert user32.calls == 0
+
+    def test_blocked_input_raises(self):
+        with pytest.raises(OSError):
+            keyboard_input.send_text("secret", FakeUser32(accept=3))
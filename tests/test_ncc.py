@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import ncc
+
+
+def brute_force_ncc(screen, template, mask=None):
+    """Reference TM_CCOEFF_NORMED, one window at a time."""
+    screen = screen.astype(np.float64)
+    template = template.astype(np.float64)
+    weights = np.ones(template.shape) if mask is None else (mask > 0).astype(np.float64)
+    count = weights.sum()
+    kernel = (template - (template * weights).sum() / count) * weights
+    height, width = template.shape
+    result = np.zeros((screen.shape[0] - height + 1, screen.shape[1] - width + 1))
+    for y in range(result.shape[0]):
+        for x in range(result.shape[1]):
+            window = screen[y:y + height, x:x + width]
+            centered = (window - (window * weights).sum() / count) * weights
+            denominator = np.sqrt((kernel ** 2).sum() * (centered ** 2).sum())
+            result[y, x] = (kernel * window).sum() / denominator if denominator else 0.0
+    return result
+
+
+@pytest.fixture
+def screen():
+    return np.random.default_rng(0).integers(0, 256, size=(40, 50), dtype=np.uint8)
+
+
+class TestCorrelator:
+    """Test the FFT normalized cross-correlation against a direct computation."""
+
+    def test_matches_brute_force(self, screen):
+        template = screen[5:17, 8:23].copy()
+
+        result = ncc.match_template(screen, template)
+
+        np.testing.assert_allclose(result, brute_force_ncc(screen, template), atol=1e-9)
+        assert np.unravel_index(result.argmax(), result.shape) == (5, 8)
+
+    def test_masked_matches_brute_force(self, screen):
+        template = screen[5:17, 8:23].copy()
+        mask = np.full(template.shape, 255, dtype=np.uint8)
+        mask[3:8, 2:12] = 0
+
+        result = ncc.match_template(screen, template, mask)
+
+        np.testing.assert_allclose(result, brute_force_ncc(screen, template, mask), atol=1e-9)
+
+    def test_batch_equals_one_by_one(self, screen):
+        templates = np.stack([screen[0:10, 0:10], screen[20:30, 30:40], screen[10:20, 5:15]])
+        correlator = ncc.Correlator(screen)
+
+        batch = correlator.ncc(templates)
+
+        for template, result in zip(templates, batch):
+            np.testing.assert_allclose(result, ncc.match_template(screen, template), atol=1e-9)
+
+    def test_templates_of_different_sizes_share_one_correlator(self, screen):
+        correlator = ncc.Correlator(screen)
+
+        small = correlator.ncc(screen[0:5, 0:5])[0]
+        large = correlator.ncc(screen[10:30, 10:30])[0]
+
+        np.testing.assert_allclose(small, brute_force_ncc(screen, screen[0:5, 0:5]), atol=1e-9)
+        np.testing.assert_allclose(large, brute_force_ncc(screen, screen[10:30, 10:30]), atol=1e-9)
+
+    def test_flat_window_scores_zero(self):
+        screen = np.zeros((20, 20), dtype=np.uint8)
+        screen[10:, 10:] = np.random.default_rng(1).integers(0, 256, size=(10, 10))
+
+        result = ncc.match_template(screen, screen[10:15, 10:15].copy())
+
+        assert result[0, 0] == 0.0
+        assert result.max() == pytest.approx(1.0)
+
+    def test_template_larger_than_screen(self, screen):
+        with pytest.raises(ValueError):
+            ncc.match_template(screen, np.zeros((50, 10)))
+
+
+def test_agrees_with_opencv(screen):
+    cv2 = pytest.importorskip("cv2")
+    template = screen[5:17, 8:23].copy()
+    mask = np.full(template.shape, 255, dtype=np.uint8)
+    mask[3:8, 2:12] = 0
+
+    np.testing.assert_allclose(ncc.match_template(screen, template),
+                               cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED), atol=1e-5)
+    np.testing.assert_allclose(ncc.match_template(screen, template, mask),
+                               cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED, mask=mask), atol=1e-5)
+
+
+@pytest.mark.parametrize("n", [1, 7, 97, 1081, 2521])
+def test_next_fast_len(n):
+    size = ncc.next_fast_len(n)
+
+    assert size >= n
+    for prime in (2, 3, 5):
+        while size % prime == 0:
+            size //= prime
+    assert size == 1
@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import display_scale
+import image_matcher
+import recognition
+
+CORPUS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus")
+
+with open(os.path.join(CORPUS_FOLDER, "manifest.json")) as f:
+    CORPUS = json.load(f)
+
+@pytest.fixture
+def screen(request, monkeypatch):
+    """Serve a corpus screenshot to the matcher instead of capturing the screen."""
+    with Image.open(os.path.join(CORPUS_FOLDER, request.param["file"])) as image:
+        pixels = np.asarray(image.convert("L"))
+
+    def grab_screen(region=None):
+        if not region:
+            return pixels
+        left, top, width, height = region
+        return pixels[top:top + height, left:left + width]
+
+    monkeypatch.setattr(image_matcher, "grab_screen", grab_screen)
+    return request.param
+
+
+@pytest.mark.parametrize("screen", CORPUS, ids=[entry["file"] for entry in CORPUS], indirect=True)
+class TestCorpus:
+    """Test the connector's recognition settings on every screenshot of the corpus."""
+
+    def test_ivanti_window_is_found_where_it_is(self, screen):
+        match, _, _ = recognition.locate_ivanti_window("assets_connector", display_scale.scale_order(screen["display_scale"]))
+
+        if screen["ivanti"] is None:
+            assert not match or not match.found
+        else:
+            assert match.found
+            left, top, right, bottom = screen["ivanti"]
+            assert abs(match.left - left) <= 8 and abs(match.top - top) <= 8
+            assert abs(match.width - (right - left)) <= 16 and abs(match.height - (bottom - top)) <= 16
+
+    def test_login_page_is_found_only_when_shown(self, screen):
+        scale = display_scale.scale_order(screen["display_scale"])[0]
+
+        assert bool(recognition.find_login_page("assets_connector", scale)) == screen["login"]
+
+
+def test_window_rect_limits_search_to_the_window(monkeypatch):
+    regions = []
+    grab_screen = image_matcher.grab_screen
+    monkeypatch.setattr(image_matcher, "grab_screen", lambda region=None: regions.append(region) or grab_screen(region))
+    entry = next(entry for entry in CORPUS if entry["file"] == "ivanti_b_zone_light.png")
+    with Image.open(os.path.join(CORPUS_FOLDER, entry["file"])) as image:
+        pixels = np.asarray(image.convert("L"))
+    monkeypatch.setattr(image_matcher.ImageGrab, "grab", lambda bbox=None: Image.fromarray(pixels).crop(bbox))
+
+    match, _, region = recognition.locate_ivanti_window("assets_connector", [1.0], ivanti_rect=entry["ivanti"])
+
+    assert match.found
+    assert regions == [region] and region is not None
@@ -0,0 +1,143 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+import image_matcher
+import resident_agent
+import simulator
+
+
+@pytest.fixture(autouse=True)
+def token_file(tmp_path, monkeypatch):
+    """Keep the agents' tokens out of the user's own folder."""
+    path = str(tmp_path / "token" / "agent_token")
+    monkeypatch.setattr(resident_agent, "TOKEN_FILE", path)
+    return path
+
+
+@pytest.fixture
+def agent():
+    release = threading.Event()
+    agent = resident_agent.Agent(lambda: release.wait(5), port=0)
+    agent.release = release
+    thread = threading.Thread(target=agent.run, daemon=True)
+    thread.start()
+    yield agent
+    release.set()
+    agent.stop()
+    thread.join(5)
+
+
+def wait_for_runs(agent, count):
+    deadline = time.monotonic() + 5
+    while agent.runs < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return agent.runs
+
+
+class TestAgent:
+    """Test triggering runs of a resident agent."""
+
+    def test_socket_trigger_starts_a_run(self, agent):
+        agent.release.set()
+
+        assert resident_agent.send(resident_agent.CONNECT, agent.port) == "started"
+        assert wait_for_runs(agent, 1) == 1
+
+    def test_trigger_during_a_run_is_turned_down(self, agent):
+        assert agent.trigger("hotkey") == "started"
+        assert resident_agent.send(resident_agent.CONNECT, agent.port) == "busy"
+
+        agent.release.set()
+        wait_for_runs(agent, 1)
+        assert agent.trigger("hotkey") == "started"
+        assert wait_for_runs(agent, 2) == 2
+
+    def test_failed_run_keeps_the_agent_running(self):
+        def connect():
+            raise SystemExit(1)
+
+        agent = resident_agent.Agent(connect, port=0)
+        thread = threading.Thread(target=agent.run, daemon=True)
+        thread.start()
+        agent.trigger("hotkey")
+        wait_for_runs(agent, 1)
+
+        assert resident_agent.send(resident_agent.PING, agent.port) == "ready"
+        assert resident_agent.send(resident_agent.STOP, agent.port) == "stopping"
+        thread.join(5)
+        assert not thread.is_alive()
+
+    def test_stopped_agent_frees_its_port(self):
+        agent = resident_agent.Agent(lambda: None, port=0)
+        agent.stop()
+        agent.run()
+
+        assert resident_agent.send(resident_agent.PING, agent.port) is None
+
+    def test_unknown_command(self, agent):
+        assert resident_agent.send("disconnect", agent.port) == "unknown command 'disconnect'"
+
+    def test_command_without_the_token_is_refused(self, agent):
+        with socket.create_connection((resident_agent.HOST, agent.port), timeout=1.0) as connection:
+            connection.sendall(b"0123 connect\n")
+            with connection.makefile("r", encoding="utf-8") as lines:
+                assert lines.readline().strip() == "refused"
+
+        assert agent.trigger("hotkey") == "started"
+
+    def test_no_token_means_no_agent(self, agent, token_file):
+        os.remove(token_file)
+
+        assert resident_agent.send(resident_agent.PING, agent.port) is None
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="%LOCALAPPDATA% is private through its folder's ACL")
+    def test_token_is_readable_by_the_user_only(self, agent, token_file):
+        assert os.stat(token_file).st_mode & 0o777 == 0o600
+
+
+class TestResidentConnector:
+    """Run the connector as a resident agent against the simulated desktop."""
+
+    @pytest.fixture
+    def workdir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / ".env").write_text(f"USERNAME={simulator.DEFAULT_SESSION['username']}\n")
+        yield tmp_path
+        image_matcher.set_capture(None)
+
+    def test_hotkey_connects_right_away(self, workdir):
+        import vpn_kul
+        # A free port, the agent listens on it from the config
+        probe = resident_agent.Agent(lambda: None, port=0)
+        port = probe.port
+        probe.close()
+        config = vpn_kul.load_config()
+        config["agent_port"] = port
+        config["tunnel_wait"] = vpn_kul.TUNNEL_WAIT * 0.1
+        (workdir / vpn_kul.CONFIG_FILE).write_text(json.dumps(config))
+
+        desktop = simulator.SimulatedBackend(time_scale=0.1)
+        first_action = []
+        open_url = desktop.open_url
+        desktop.open_url = lambda url: (first_action.append(time.perf_counter()), open_url(url))
+        thread = threading.Thread(target=vpn_kul.main, args=(["--resident"], desktop), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 30
+        while resident_agent.send(resident_agent.PING, port) != "ready" and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        triggered = time.perf_counter()
+        desktop.press_hotkey(resident_agent.DEFAULT_HOTKEY)
+        assert resident_agent.send(resident_agent.STOP, port) == "stopping"
+        thread.join(60)
+
+        assert not thread.is_alive()
+        assert desktop.connected_after() is not None
+        # Everything is loaded already, the run starts without waiting for imports or templates
+        assert first_action[0] - triggered < 0.5
@@ -0,0 +1,264 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import display_scale
+import image_matcher
+import input_pacing
+import recognition
+import simulator
+
+
+@pytest.fixture
+def desktop(clock):
+    backend = simulator.SimulatedBackend(clock=clock)
+    image_matcher.set_capture(backend.capture)
+    yield backend
+    image_matcher.set_capture(None)
+
+
+def ivanti_on_top(desktop, clock):
+    desktop.open_url("https://vpn.kuleuven.be")
+    desktop.launch("Ivanti Secure Access Client.lnk")
+    clock.sleep(5)
+    return simulator.load_manifest()[simulator.DEFAULT_SESSION["ivanti"]]["ivanti"]
+
+
+def click_connect(desktop, rect):
+    left, top, right, bottom = rect
+    desktop.click(left + int((right - left) * 0.826), top + int((bottom - top) * 0.414))
+
+
+class TestSimulatedBackend:
+    """Test the scripted reactions of the simulated desktop."""
+
+    def test_ivanti_shows_up_after_its_start_delay(self, desktop, clock):
+        desktop.launch("Ivanti Secure Access Client.lnk")
+
+        clock.sleep(2.9)
+        assert desktop.visible_windows() == []
+        clock.sleep(0.2)
+        assert [title for _, title in desktop.visible_windows()] == [simulator.IVANTI_TITLE]
+
+    def test_time_scale_shortens_the_delays(self, clock):
+        desktop = simulator.SimulatedBackend(time_scale=0.1, clock=clock)
+        desktop.launch("Ivanti Secure Access Client.lnk")
+
+        clock.sleep(0.31)
+        assert len(desktop.visible_windows()) == 1
+
+    def test_recognition_finds_ivanti_over_the_browser(self, desktop, clock):
+        rect = ivanti_on_top(desktop, clock)
+
+        match, _, _ = recognition.locate_ivanti_window("assets_connector", display_scale.scale_order(desktop.scale()))
+
+        assert match.found
+        assert (match.left, match.top) == tuple(rect[:2])
+
+    def test_login_page_is_not_shown_when_logged_in(self, desktop, clock):
+        desktop.open_url("https://vpn.kuleuven.be")
+        clock.sleep(2)
+
+        assert recognition.find_login_page("assets_connector") is None
+
+    def test_login_page_is_shown_when_logged_out(self, clock):
+        desktop = simulator.SimulatedBackend(simulator.LOGGED_OUT_SESSION, clock=clock)
+        image_matcher.set_capture(desktop.capture)
+        try:
+            desktop.open_url("https://vpn.kuleuven.be")
+            clock.sleep(2)
+            assert recognition.find_login_page("assets_connector")
+        finally:
+            image_matcher.set_capture(None)
+
+    def test_click_next_to_the_connect_button_does_nothing(self, desktop, clock):
+        left, top, right, bottom = ivanti_on_top(desktop, clock)
+
+        desktop.click(left + 20, top + 20)
+        clock.sleep(5)
+
+        assert [title for _, title in desktop.visible_windows()] == [simulator.BROWSER_TITLE, simulator.IVANTI_TITLE]
+
+    def test_login_dialogs_lead_to_the_tunnel(self, desktop, clock):
+        session = simulator.DEFAULT_SESSION
+        click_connect(desktop, ivanti_on_top(desktop, clock))
+        clock.sleep(1)
+        credentials_prompt = desktop.foreground_window()
+        desktop.write(session["username"])
+        desktop.press("tab")
+        desktop.write(session["password"])
+        desktop.press("enter")
+
+        assert not desktop.exists(credentials_prompt)
+        clock.sleep(1.5)
+        assert desktop.visible_windows()[-1][1] == simulator.CONFIRM_TITLE
+        desktop.press("enter")
+        # Enter at 7.5 s, the dialog closes 0.3 s later and the tunnel is up 2 s after that
+        assert desktop.connected_after() == pytest.approx(9.8)
+
+    def test_wrong_password_asks_again(self, desktop, clock):
+        click_connect(desktop, ivanti_on_top(desktop, clock))
+        clock.sleep(1)
+        desktop.write(simulator.DEFAULT_SESSION["username"])
+        desktop.press("tab")
+        desktop.write("wrong")
+        desktop.press("enter")
+        clock.sleep(1.5)
+
+        assert desktop.visible_windows()[-1][1] == simulator.CREDENTIALS_TITLE
+        assert desktop.connected_after() is None
+
+    def test_closed_window_goes_after_its_close_delay(self, desktop, clock):
+        ivanti_on_top(desktop, clock)
+        hwnd = desktop.visible_windows()[-1][0]
+
+        desktop.close(hwnd)
+
+        assert desktop.exists(hwnd)
+        clock.sleep(0.3)
+        assert not desktop.exists(hwnd)
+
+    def test_ctrl_w_closes_browser_tabs(self, desktop, clock):
+        desktop.open_url("https://vpn.kuleuven.be")
+        clock.sleep(2)
+        desktop.open_url("https://uafw.icts.kuleuven.be")
+        clock.sleep(1)
+
+        desktop.hotkey("ctrl", "w")
+        assert len(desktop.visible_windows()) == 1
+        desktop.hotkey("ctrl", "w")
+        assert desktop.visible_windows() == []
+
+
+class TestConnectorEndToEnd:
+    """Run the whole connector against the simulated desktop."""
+
+    @pytest.fixture
+    def workdir(self, tmp_path, monkeypatch):
+        import vpn_kul
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / ".env").write_text(f"USERNAME={simulator.DEFAULT_SESSION['username']}\n")
+        # The fixed wait for the tunnel without a probe, scaled like the simulated session
+        vpn_kul.save_config({**vpn_kul.load_config(), "tunnel_wait": vpn_kul.TUNNEL_WAIT * 0.1})
+        yield tmp_path
+        image_matcher.set_capture(None)
+
+    def test_connects(self, workdir):
+        import vpn_kul
+        desktop = simulator.SimulatedBackend(time_scale=0.1)
+        tunnel_up_when_opened = []
+        open_url = desktop.open_url
+        desktop.open_url = lambda url: (tunnel_up_when_opened.append(desktop.tunnel_up()), open_url(url))
+
+        run = vpn_kul.main([], desktop)
+
+        assert desktop.connected_after() is not None
+        assert desktop.typed == [simulator.DEFAULT_SESSION["username"], simulator.DEFAULT_SESSION["password"]]
+        assert desktop.urls == ["https://vpn.kuleuven.be", "https://uafw.icts.kuleuven.be"]
+        assert desktop.messages == []
+        # Without a tunnel probe the extra site still waits for the tunnel
+        assert tunnel_up_when_opened == [False, True]
+        assert run.critical_path()[-1].name == "close_ivanti"
+        assert simulator.IVANTI_TITLE not in [title for _, title in desktop.visible_windows()]
+        # Only the clicks and hotkeys wait, pyautogui's pause after every action is gone
+        delays = input_pacing.DEFAULT_DELAYS
+        assert vpn_kul.backend.total == pytest.approx(delays["click"] + 2 * delays["hotkey"])
+        # The windowed exe has no console, the totals go to a file as well
+        run_log = (workdir / vpn_kul.RUN_LOG_FILE).read_text()
+        assert run.report() in run_log
+        assert f"Input delays: {vpn_kul.backend.total:.2f} s" in run_log
+
+    def test_run_does_not_import_opencv(self, workdir):
+        # The exe is built with --exclude-module cv2, a run that still reached for OpenCV would
+        # only break there. A fresh interpreter, other tests may have imported it already
+        code = """if True:
+            import json, sys
+            attempts = []
+            class Spy:
+                def find_spec(self, name, path=None, target=None):
+                    if name.partition(".")[0] == "cv2":
+                        attempts.append(name)
+            sys.meta_path.insert(0, Spy())
+            import simulator, vpn_kul
+            vpn_kul.main([], simulator.SimulatedBackend(time_scale=0.1))
+            print(json.dumps([attempts, "cv2" in sys.modules]))
+        """
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+        result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+        assert json.loads(result.stdout.splitlines()[-1]) == [[], False]
+
+    def test_extra_site_waits_for_the_tunnel(self, workdir):
+        import vpn_kul
+        desktop = simulator.SimulatedBackend(time_scale=0.1)
+        tunnel = simulator.TunnelStandIn(desktop)
+        config = vpn_kul.load_config()
+        config["tunnel_probe"] = {"tcp": tunnel.target}
+        (workdir / vpn_kul.CONFIG_FILE).write_text(json.dumps(config))
+        tunnel_up_when_opened = []
+        open_url = desktop.open_url
+        desktop.open_url = lambda url: (tunnel_up_when_opened.append(desktop.tunnel_up()), open_url(url))
+
+        try:
+            run = vpn_kul.main([], desktop)
+        finally:
+            tunnel.close()
+
+        assert tunnel_up_when_opened == [False, True]
+        assert run.value("tunnel_up") is True
+
+    @pytest.mark.parametrize("browser_start", [2.5, 3.2])
+    def test_late_browser_does_not_get_the_credentials(self, workdir, browser_start):
+        import vpn_kul
+        # Ivanti is up before the browser, which then takes the focus in the middle of the login
+        delays = {**simulator.DEFAULT_SESSION["delays"], "ivanti_start": 1.0, "browser_start": browser_start}
+        desktop = simulator.SimulatedBackend({**simulator.DEFAULT_SESSION, "delays": delays})
+
+        run = vpn_kul.main([], desktop)
+
+        assert desktop.messages == []
+        assert desktop.connected_after() is not None
+        # Ivanti is brought to the front once the browser is up, not before
+        assert run.value("browser_window") is not None
+
+    def test_missing_password_stops_before_touching_the_desktop(self, workdir):
+        import vpn_kul
+        (workdir / ".env").write_text("USERNAME=r0000001\n")
+        desktop = simulator.SimulatedBackend(time_scale=0.1)
+
+        with pytest.raises(SystemExit):
+            vpn_kul.main([], desktop)
+
+        assert "Missing VPN credentials" in desktop.messages[0][1]
+        assert desktop.urls == [] and desktop.launched == []
+
+    def test_esc_stops_the_run_where_it_is(self, workdir):
+        import vpn_kul
+        desktop = simulator.SimulatedBackend()
+        # ESC while the connector waits for Ivanti to start, 3 s in the simulated session
+        threading.Timer(0.5, vpn_kul.stop_run).start()
+
+        start = time.monotonic()
+        with pytest.raises(SystemExit):
+            vpn_kul.main([], desktop)
+
+        assert time.monotonic() - start < 1.5
+        assert desktop.messages == [("VPN KUL Connector", "Execution stopped by user (ESC).")]
+        assert desktop.clicks == [] and desktop.typed == []
+
+    def test_logged_out_user_is_asked_to_log_in(self, workdir):
+        import vpn_kul
+        desktop = simulator.SimulatedBackend(simulator.LOGGED_OUT_SESSION, time_scale=0.1)
+
+        with pytest.raises(SystemExit):
+            vpn_kul.main([], desktop)
+
+        assert "log into toledo" in desktop.messages[0][1]
+        assert desktop.clicks == []
+        assert (workdir / "vpn_kul_failure.log").exists()
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import cancellation
+import step_graph
+import ui_wait
+from step_graph import Step
+
+
+def record(calls, name, value=None, seconds=0.0):
+    """Step action that notes when it ran and returns value"""
+    def action(results):
+        calls.append((name, dict(results)))
+        time.sleep(seconds)
+        return value
+    return action
+
+
+class TestRunSteps:
+    """Test running a graph of steps with fake actions."""
+
+    def test_steps_run_after_their_dependencies_and_see_their_results(self):
+        calls = []
+        steps = [
+            Step("type", record(calls, "type"), after=["click", "password"]),
+            Step("click", record(calls, "click", "clicked"), after=["window"]),
+            Step("window", record(calls, "window", 42)),
+            Step("password", record(calls, "password", "secret")),
+        ]
+
+        run = step_graph.run(steps)
+
+        order = [name for name, _ in calls]
+        assert order.index("window") < order.index("click") < order.index("type")
+        assert order.index("password") < order.index("type")
+        assert dict(calls)["type"] == {"window": 42, "click": "clicked", "password": "secret"}
+        assert run.value("click") == "clicked"
+
+    def test_independent_steps_overlap(self):
+        steps = [Step(name, record([], name, seconds=0.3)) for name in ["page", "password", "ivanti"]]
+
+        start = time.perf_counter()
+        step_graph.run(steps)
+
+        assert time.perf_counter() - start < 0.6
+
+    def test_coroutine_actions_run_on_the_event_loop(self):
+        async def action(results):
+            await asyncio.sleep(0)
+            return threading.current_thread() is threading.main_thread()
+
+        assert step_graph.run([Step("async", action)]).value("async") is True
+
+    def test_failing_step_is_retried(self):
+        attempts = []
+
+        def flaky(results):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OSError("credential store busy")
+            return "secret"
+
+        run = step_graph.run([Step("password", flaky, retries=2)])
+
+        assert run.value("password") == "secret"
+        assert run.results["password"].attempts == 3
+
+    def test_step_fails_after_last_retry_and_dependents_do_not_run(self):
+        calls = []
+
+        def broken(results):
+            raise OSError("no window")
+
+        with pytest.raises(step_graph.StepError) as error:
+            step_graph.run([Step("window", broken, retries=1), Step("click", record(calls, "click"), after=["window"])])
+
+        assert error.value.step == "window"
+        assert isinstance(error.value.error, OSError)
+        assert calls == []
+
+    def test_timeout_counts_as_failure(self):
+        with pytest.raises(step_graph.StepError) as error:
+            step_graph.run([Step("hang", record([], "hang", seconds=0.5), timeout=0.05)])
+
+        assert isinstance(error.value.error, asyncio.TimeoutError)
+
+    def test_timed_out_step_is_not_retried_while_its_thread_runs(self):
+        calls = []
+
+        start = time.perf_counter()
+        with pytest.raises(step_graph.StepError) as error:
+            step_graph.run([Step("password", record(calls, "password", seconds=0.5), timeout=0.05, retries=1)])
+
+        assert isinstance(error.value.error, asyncio.TimeoutError)
+        assert len(calls) == 1
+        # The abandoned thread is not waited for
+        assert time.perf_counter() - start < 0.4
+
+    def test_system_exit_passes_through(self):
+        def give_up(results):
+            raise SystemExit(1)
+
+        with pytest.raises(SystemExit):
+            step_graph.run([Step("check", give_up, retries=3)])
+
+    def test_system_exit_cancels_the_steps_after_it(self):
+        calls = []
+
+        def give_up(results):
+            raise SystemExit(1)
+
+        with pytest.raises(SystemExit):
+            step_graph.run([Step("check", give_up), Step("click", record(calls, "click"), after=["check"])])
+
+        assert calls == []
+
+
+class TestCheckGraph:
+    """Test rejecting graphs that can not run."""
+
+    def test_unknown_dependency(self):
+        with pytest.raises(ValueError, match="unknown"):
+            step_graph.check_graph([Step("click", None, after=["window"])])
+
+    def test_cycle(self):
+        with pytest.raises(ValueError, match="cycle"):
+            step_graph.check_graph([Step("a", None, after=["b"]), Step("b", None, after=["a"])])
+
+    def test_duplicate_names(self):
+        with pytest.raises(ValueError, match="Duplicate"):
+            step_graph.check_graph([Step("a", None), Step("a", None)])
+
+
+class TestCriticalPath:
+    """Test finding the chain of steps that decided the run time."""
+
+    def test_follows_the_dependency_that_finished_last(self):
+        R = step_graph.StepResult
+        run = step_graph.Run({
+            "page": R("page", None, 0.0, 0.5, 1, ()),
+            "check": R("check", None, 0.5, 2.5, 1, ("page",)),
+            "launch": R("launch", None, 0.0, 0.2, 1, ()),
+            "window": R("window", None, 0.2, 1.8, 1, ("launch",)),
+            "activate": R("activate", None, 2.5, 3.0, 1, ("window", "check")),
+            "password": R("password", None, 0.0, 0.1, 1, ()),
+            "type": R("type", None, 3.0, 3.4, 1, ("activate", "password")),
+        })
+
+        assert [step.name for step in run.critical_path()] == ["page", "check", "activate", "type"]
+        assert run.report().splitlines()[0] == "Critical path 3.40 s:"
+
+    def test_report_of_real_run_ends_with_last_step(self):
+        run = step_graph.run([Step("a", record([], "a")), Step("b", record([], "b", seconds=0.05), after=["a"])])
+
+        assert [step.name for step in run.critical_path()] == ["a", "b"]
+        assert "b" in run.report().splitlines()[-1]
+
+
+class TestCancel:
+    """Test stopping a run while a step is busy on its thread."""
+
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        cancellation.reset()
+        yield
+        cancellation.reset()
+
+    def test_cancel_stops_a_waiting_step_at_once(self):
+        def long_wait(results):
+            return ui_wait.wait_until(lambda: None, timeout=2, poll=0.5)
+
+        threading.Timer(0.3, cancellation.cancel).start()
+        start = time.monotonic()
+        with pytest.raises(KeyboardInterrupt):
+            step_graph.run([Step("wait", long_wait, retries=1)])
+
+        assert time.monotonic() - start < 0.6
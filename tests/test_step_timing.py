@@ -0,0 +1,93 @@
+import pytest
+
+import step_timing
+import translations
+import ui_wait
+
+
+class TestRecord:
+    """Test keeping a rolling history of step durations."""
+
+    def test_keeps_only_recent_runs(self):
+        history = {}
+        for run in range(step_timing.HISTORY_LENGTH + 5):
+            step_timing.record(history, "ivanti_window", run)
+
+        assert len(history["ivanti_window"]) == step_timing.HISTORY_LENGTH
+        assert history["ivanti_window"][0] == 5
+
+    def test_fixed_steps_are_not_recorded(self):
+        history = {}
+
+        step_timing.record(history, "login_page", 2.0)
+
+        assert history == {}
+
+
+class TestStepTimeout:
+    """Test deriving timeouts and poll intervals from the history."""
+
+    def test_default_until_enough_runs(self):
+        history = {"ivanti_window": [1.0] * (step_timing.MIN_RUNS - 1)}
+
+        assert step_timing.step_timeout(history, "ivanti_window") == step_timing.DEFAULT_TIMEOUTS["ivanti_window"]
+        assert step_timing.poll_interval(history, "ivanti_window") == ui_wait.DEFAULT_POLL
+
+    def test_default_is_adjusted_for_speed_multiplier(self):
+        assert step_timing.step_timeout({}, "ivanti_window", 2.0) == step_timing.DEFAULT_TIMEOUTS["ivanti_window"] / 2
+
+    def test_fast_runs_never_go_below_default(self):
+        # Runs with Ivanti already open must not cut the timeout of a cold start
+        history = {"ivanti_window": [0.1, 0.2, 0.1, 0.15, 0.1]}
+
+        assert step_timing.step_timeout(history, "ivanti_window") == step_timing.DEFAULT_TIMEOUTS["ivanti_window"]
+        assert step_timing.step_timeout(history, "ivanti_window", 2.0) == step_timing.DEFAULT_TIMEOUTS["ivanti_window"] / 2
+        # The poll still follows the fast runs
+        assert step_timing.poll_interval(history, "ivanti_window") == step_timing.MIN_POLL
+
+    def test_slow_machine_grows_past_default(self):
+        # Steps that succeed close to their timeout get more time
+        history = {"confirm_prompt": [2.5, 2.8, 2.9]}
+
+        assert step_timing.step_timeout(history, "confirm_prompt") == pytest.approx(2.9 * step_timing.HEADROOM)
+
+
+    def test_outlier_does_not_set_timeout(self):
+        history = {"ivanti_window": [8.0] * 19 + [40.0]}
+
+        assert step_timing.step_timeout(history, "ivanti_window") == pytest.approx(8.0 * step_timing.HEADROOM)
+
+    def test_timeout_and_poll_are_clamped(self):
+        history = {"ivanti_foreground": [0.01] * 5, "confirm_closed": [100.0] * 5}
+
+        assert step_timing.step_timeout(history, "ivanti_foreground") == step_timing.DEFAULT_TIMEOUTS["ivanti_foreground"]
+        assert step_timing.poll_interval(history, "ivanti_foreground") == step_timing.MIN_POLL
+        assert step_timing.step_timeout(history, "confirm_closed") == step_timing.MAX_TIMEOUT
+        assert step_timing.poll_interval(history, "confirm_closed") == step_timing.MAX_POLL
+
+    def test_fixed_step_keeps_default(self):
+        history = {"login_page": [0.1] * 10}
+
+        assert step_timing.step_timeout(history, "login_page") == step_timing.DEFAULT_TIMEOUTS["login_page"]
+
+
+def test_percentile_nearest_rank():
+    assert step_timing.percentile([5, 1, 4, 2, 3], 90) == 5
+    assert step_timing.percentile([5, 1, 4, 2, 3], 50) == 3
+    assert step_timing.percentile([7], 90) == 7
+
+
+def test_late_grace():
+    assert step_timing.late_grace("confirm_prompt", 3) == 1.5
+    # The login page is expected to time out when the user is logged in
+    assert step_timing.late_grace("login_page", 2) == 0.0
+    assert step_timing.late_grace("tunnel_up", step_timing.MAX_TIMEOUT) == 0.0
+
+
+@pytest.mark.parametrize("language", sorted(translations.translations))
+def test_every_learned_step_has_a_name(language):
+    # The settings show the learned timing of these steps by name
+    names = translations.translations[language]
+    steps = [step for step in step_timing.DEFAULT_TIMEOUTS if step not in step_timing.FIXED_STEPS]
+
+    assert [step for step in steps if "step_" + step not in names] == []
@@ -0,0 +1,148 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import image_matcher
+import template_pack
+
+
+@pytest.fixture
+def assets(tmp_path):
+    """Copy of a few connector templates in a writable folder."""
+    for name in ["A_zone.png", "full_ivanti1.png", "full_ivanti1.mask.png", "programicon.png"]:
+        shutil.copy(os.path.join("assets_connector", name), tmp_path / name)
+    return str(tmp_path)
+
+
+class TestTemplatePack:
+    """Test building and memory-mapping the pre-decoded template pack."""
+
+    def test_pack_round_trips_grayscale_templates(self, assets):
+        pack_path = template_pack.build_pack(assets)
+
+        pack_hash, templates = template_pack.open_pack(pack_path)
+
+        for name in ["A_zone.png", "full_ivanti1.png"]:
+            np.testing.assert_array_equal(templates[name], image_matcher.load_template(os.path.join(assets, name)))
+        assert "programicon.png" not in templates
+        assert pack_hash == template_pack.source_hash(assets, template_pack.source_files(assets))
+
+    def test_pack_holds_a_variant_per_display_scale(self, assets):
+        _, templates = template_pack.open_pack(template_pack.build_pack(assets))
+
+        assert templates["A_zone.png"].shape == (600, 466)
+        assert templates["A_zone.png@1.25"].shape == (750, 582)
+        assert templates["A_zone.png@1.5"].shape == (900, 699)
+        assert templates["A_zone.png@2"].shape == (1200, 932)
+
+    def test_load_templates_for_scale(self, assets):
+        templates = template_pack.load_templates(assets, ["full_ivanti1.png"], scale=1.5)
+
+        assert list(templates) == ["full_ivanti1.png"]
+        assert templates["full_ivanti1.png"].shape == (645, 477)
+
+    def test_masks_are_packed_with_their_template(self, assets):
+        masks = template_pack.load_masks(assets, ["full_ivanti1.png", "A_zone.png"], scale=1.5)
+
+        assert masks["A_zone.png"] is None
+        assert masks["full_ivanti1.png"].shape == (645, 477)
+        assert set(np.unique(masks["full_ivanti1.png"])) == {0, 255}
+
+    def test_mask_is_not_a_template(self, assets):
+        assert template_pack.template_names(assets) == ["A_zone.png", "full_ivanti1.png"]
+
+    def test_views_are_zero_copy(self, assets):
+        _, templates = template_pack.open_pack(template_pack.build_pack(assets))
+
+        view = templates["A_zone.png"]
+        assert not view.flags.owndata
+        assert not view.flags.writeable
+
+    def test_load_templates_builds_missing_pack(self, assets):
+        templates = template_pack.load_templates(assets, ["full_ivanti1.png"])
+
+        assert list(templates) == ["full_ivanti1.png"]
+        assert os.path.exists(os.path.join(assets, template_pack.PACK_FILE))
+
+    def test_load_templates_rebuilds_when_sources_change(self, assets):
+        template_pack.build_pack(assets)
+        shutil.copy(os.path.join("assets_connector", "I_zone.png"), os.path.join(assets, "A_zone.png"))
+
+        templates = template_pack.load_templates(assets, ["A_zone.png"])
+
+        expected = image_matcher.load_template(os.path.join("assets_connector", "I_zone.png"))
+        np.testing.assert_array_equal(templates["A_zone.png"], expected)
+
+    def test_corrupt_pack_is_rebuilt(self, assets):
+        with open(os.path.join(assets, template_pack.PACK_FILE), "wb") as f:
+            f.write(b"garbage")
+
+        templates = template_pack.load_templates(assets, ["A_zone.png"])
+
+        assert templates["A_zone.png"].shape == (600, 466)
+
+    def test_pack_holds_only_the_named_templates(self, assets):
+        _, templates = template_pack.open_pack(template_pack.build_pack(assets, names=["full_ivanti1.png"]))
+
+        assert template_pack.packed_names(templates) == {"full_ivanti1.png"}
+        assert "full_ivanti1.png#mask" in templates
+
+    def test_rebuild_keeps_the_packed_templates(self, assets):
+        template_pack.build_pack(assets, names=["full_ivanti1.png"])
+
+        template_pack.load_templates(assets, ["A_zone.png"])
+
+        _, templates = template_pack.open_pack(os.path.join(assets, template_pack.PACK_FILE))
+        assert template_pack.packed_names(templates) == {"A_zone.png", "full_ivanti1.png"}
+
+    def test_unpacked_sources_do_not_rebuild_the_pack(self, assets):
+        pack_path = template_pack.build_pack(assets, names=["full_ivanti1.png"])
+        built = os.stat(pack_path).st_mtime_ns
+        shutil.copy(os.path.join("assets_connector", "I_zone.png"), os.path.join(assets, "A_zone.png"))
+
+        template_pack.load_templates(assets, ["full_ivanti1.png"])
+
+        assert os.stat(pack_path).st_mtime_ns == built
+
+    def test_missing_scale_is_added_without_the_others(self, assets):
+        template_pack.build_pack(assets, names=["full_ivanti1.png"], scales=template_pack.BUNDLED_SCALES)
+
+        template_pack.load_templates(assets, ["full_ivanti1.png"], scale=1.5)
+
+        _, templates = template_pack.open_pack(os.path.join(assets, template_pack.PACK_FILE))
+        assert template_pack.packed_scales(templates) == {1.0}
+        _, templates = template_pack.open_pack(os.path.join(assets, "templates@1.5.pack"))
+        assert template_pack.packed_scales(templates) == {1.5}
+
+    def test_bundled_scales_are_loaded_from_the_bundled_pack(self, assets):
+        template_pack.build_pack(assets, names=["full_ivanti1.png"], scales=[1.0, 1.5])
+
+        template_pack.load_templates(assets, ["full_ivanti1.png"], scale=1.5)
+
+        assert not os.path.exists(os.path.join(assets, "templates@1.5.pack"))
+
+    def test_failed_replace_leaves_no_temp_file(self, assets, monkeypatch):
+        def locked(source, target):
+            raise PermissionError("mapped by another view")
+        monkeypatch.setattr(template_pack.os, "replace", locked)
+
+        templates = template_pack.load_templates(assets, ["full_ivanti1.png"])
+
+        assert templates["full_ivanti1.png"].shape == (430, 318)
+        assert not any(name.endswith(".tmp") for name in os.listdir(assets))
+
+    def test_onefile_exe_adds_scales_to_a_user_pack(self, assets, tmp_path, monkeypatch):
+        bundled = template_pack.build_pack(assets, names=["full_ivanti1.png"], scales=template_pack.BUNDLED_SCALES)
+        built = os.stat(bundled).st_mtime_ns
+        monkeypatch.setattr(template_pack.sys, "frozen", True, raising=False)
+        monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "appdata"))
+
+        assert template_pack.load_templates(assets, ["full_ivanti1.png"])["full_ivanti1.png"].shape == (430, 318)
+        templates = template_pack.load_templates(assets, ["full_ivanti1.png"], scale=1.5)
+
+        assert templates["full_ivanti1.png"].shape == (645, 477)
+        assert os.stat(bundled).st_mtime_ns == built
+        user_pack = tmp_path / "appdata" / template_pack.USER_PACK_FOLDER / "templates@1.5.pack"
+        assert template_pack.packed_scales(template_pack.open_pack(str(user_pack))[1]) == {1.5}
@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import tunnel_probe
+import ui_wait
+
+
+@pytest.fixture
+def unreachable():
+    """Port that refuses connections until listen() is called on the socket"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    yield server
+    server.close()
+
+
+class TestProbes:
+    """Test the tunnel probes against local stand-ins."""
+
+    def test_tcp_connects_once_the_host_listens(self, unreachable):
+        condition = tunnel_probe.tcp_connects(*unreachable.getsockname())
+
+        assert not condition()
+        unreachable.listen()
+        assert condition()
+
+    def test_wait_ends_soon_after_the_host_comes_up(self, unreachable):
+        threading.Timer(0.3, unreachable.listen).start()
+
+        start = time.monotonic()
+        up = ui_wait.wait_until(tunnel_probe.tcp_connects(*unreachable.getsockname()), timeout=5, poll=0.05,
+                                backoff=tunnel_probe.BACKOFF, max_poll=tunnel_probe.MAX_POLL)
+
+        assert up
+        # The poll grew from 0.05 s to at most 0.17 s by the time the host listened
+        assert time.monotonic() - start < 0.6
+
+    def test_dns_resolves(self):
+        assert tunnel_probe.dns_resolves("localhost")()
+        assert not tunnel_probe.dns_resolves("vpn-probe.invalid")()
+
+    def test_route_unchanged_is_not_up(self):
+        condition = tunnel_probe.route_changed("127.0.0.1")
+
+        assert tunnel_probe.source_address("127.0.0.1") == "127.0.0.1"
+        assert not condition()
+
+
+class TestFromConfig:
+    """Test building the tunnel condition from the config."""
+
+    def test_no_probe(self):
+        assert tunnel_probe.from_config(None) is None
+        assert tunnel_probe.from_config({}) is None
+
+    def test_any_probe_is_enough(self, unreachable):
+        host, port = unreachable.getsockname()
+        condition = tunnel_probe.from_config({"dns": "vpn-probe.invalid", "tcp": f"{host}:{port}"})
+
+        assert not condition()
+        unreachable.listen()
+        assert condition()
+
+    @pytest.mark.parametrize("spec", [{"ping": "10.0.0.1"}, {"tcp": "intranet.kuleuven.be"}, {"tcp": ":443"},
+                                      "intranet.kuleuven.be:443", {"tcp": 443}, {"dns": None}])
+    def test_invalid_probe(self, spec):
+        with pytest.raises(ValueError):
+            tunnel_probe.from_config(spec)
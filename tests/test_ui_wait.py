@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+import image_matcher
+import ui_wait
+from conftest import FakeWindows
+
+
+class TestWaitUntil:
+    """Test polling a condition until it holds or the timeout passes."""
+
+    def test_returns_as_soon_as_condition_holds(self, clock):
+        results = iter([None, None, "ready"])
+
+        assert ui_wait.wait_until(lambda: next(results), timeout=5, poll=0.1, clock=clock, sleep=clock.sleep) == "ready"
+        assert clock.now == pytest.approx(0.2)
+
+    def test_no_sleep_when_condition_already_holds(self, clock):
+        assert ui_wait.wait_until(lambda: True, timeout=5, clock=clock, sleep=clock.sleep) is True
+        assert clock.sleeps == []
+
+    def test_returns_none_after_timeout(self, clock):
+        calls = []
+
+        assert ui_wait.wait_until(lambda: calls.append(clock.now), timeout=1, poll=0.3, clock=clock, sleep=clock.sleep) is None
+        assert clock.now == pytest.approx(1.0)
+        # Checked once more at the deadline, the last sleep is cut short to reach it
+        assert calls[-1] == pytest.approx(1.0)
+        assert clock.sleeps[-1] == pytest.approx(0.1)
+
+    def test_backoff_grows_the_poll_up_to_max_poll(self, clock):
+        ui_wait.wait_until(lambda: None, timeout=2, poll=0.2, clock=clock, sleep=clock.sleep, backoff=2, max_poll=0.5)
+
+        assert clock.sleeps[:4] == pytest.approx([0.2, 0.4, 0.5, 0.5])
+
+
+
+class TestWindowConditions:
+    """Test the window conditions against a fake window backend."""
+
+    def test_window_exists_returns_hwnd_once_it_opens(self, clock):
+        windows = FakeWindows({1: ("Explorer", (0, 0, 100, 100))})
+
+        def open_ivanti_later(seconds):
+            clock.sleep(seconds)
+            if clock.now >= 0.5:
+                windows.windows[7] = ("Ivanti Secure Access Client", (0, 0, 470, 600))
+
+        condition = ui_wait.window_exists(windows, ["ivanti"])
+
+        assert ui_wait.wait_until(condition, timeout=5, poll=0.1, clock=clock, sleep=open_ivanti_later) == 7
+        assert clock.now == pytest.approx(0.5)
+
+    def test_window_is_foreground(self):
+        windows = FakeWindows({1: ("Explorer", None), 2: ("Ivanti", None)}, foreground=1)
+        condition = ui_wait.window_is_foreground(windows, 2)
+
+        assert not condition()
+        windows.activate(2)
+        assert condition()
+
+    def test_foreground_changed_returns_new_foreground(self):
+        windows = FakeWindows({1: ("Ivanti", None), 3: ("Connect to: KU Leuven", None)}, foreground=1)
+        condition = ui_wait.foreground_changed(windows, 1)
+
+        assert condition() is None
+        windows.foreground = 3
+        assert condition() == 3
+
+    def test_foreground_changed_ignores_every_given_window(self):
+        windows = FakeWindows({1: ("Ivanti", None), 3: ("Connect to: KU Leuven", None), 4: ("Pre Sign-In Notification", None)},
+                              foreground=3)
+        condition = ui_wait.foreground_changed(windows, 3, 1)
+
+        windows.foreground = 1
+        assert condition() is None
+        windows.foreground = 4
+        assert condition() == 4
+
+    def test_page_shown_in_a_new_browser_window(self):
+        windows = FakeWindows({1: ("Explorer", None), 2: ("Ivanti Secure Access Client", None)}, foreground=1)
+        condition = ui_wait.page_shown(windows, 1, "Explorer")
+
+        windows.foreground = 2
+        assert condition() is None
+        windows.windows[5] = ("VPN KU Leuven - Web Browser", None)
+        windows.foreground = 5
+        assert condition() == 5
+
+    def test_page_shown_in_a_running_browser(self):
+        windows = FakeWindows({5: ("Toledo - Web Browser", None)}, foreground=5)
+        condition = ui_wait.page_shown(windows, 5, "Toledo - Web Browser")
+
+        assert condition() is None
+        windows.windows[5] = ("VPN KU Leuven - Web Browser", None)
+        assert condition() == 5
+
+    def test_ivanti_dialog_belongs_to_ivanti(self):
+        windows = FakeWindows({1: ("Ivanti Secure Access Client", None), 5: ("VPN KU Leuven - Web Browser", None)},
+                              foreground=1, processes={1: 70, 3: 70})
+        condition = ui_wait.ivanti_dialog(windows, 1)
+
+        windows.foreground = 5
+        assert condition() is None
+        windows.windows[3] = ("Connect to: B-Zone", None)
+        # Found behind the browser too, the caller brings it to the front
+        assert condition() == 3
+
+    def test_window_closed(self):
+        windows = FakeWindows({3: ("Connect to: KU Leuven", None)})
+        condition = ui_wait.window_closed(windows, 3)
+
+        assert not condition()
+        del windows.windows[3]
+        assert condition()
+
+    def test_title_contains(self):
+        windows = FakeWindows({1: ("vpn.kuleuven.be - Web Browser", None)})
+        condition = ui_wait.title_contains(windows, 1, "VPN KU Leuven")
+
+        assert not condition()
+        windows.windows[1] = ("VPN KU Leuven - Web Browser", None)
+        assert condition()
+
+
+class TestTemplateConditions:
+    """Test the template conditions against a changing screen."""
+
+    @pytest.fixture
+    def screen(self):
+        return np.random.default_rng(0).integers(0, 256, size=(240, 320), dtype=np.uint8)
+
+    def test_template_visible_returns_match(self, screen):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+
+        match = ui_wait.template_visible(templates, screen=screen, confidence=0.9)()
+
+        assert (match.left, match.top) == (70, 50)
+
+    def test_template_gone(self, screen, monkeypatch):
+        templates = {"window.png": screen[50:110, 70:150].copy()}
+        blank = np.full_like(screen, 128)
+        screens = iter([screen, screen, blank])
+        monkeypatch.setattr(image_matcher, "grab_screen", lambda region=None: next(screens))
+        condition = ui_wait.template_gone(templates, confidence=0.9)
+
+        assert [condition(), condition(), condition()] == [False, False, True]
@@ -1,7 +1,8 @@
 import unittest
-from unittest.mock import patch, mock_open, MagicMock, call
+from unittest.mock import patch, mock_open, MagicMock
 import json
 import os
+import subprocess
 import sys
 
 """
@@ -127,111 +128,101 @@ class TestVpnKul(unittest.TestCase):
             result = load_username()
             
         self.assertIsNone(result)
-    
-    @patch('vpn_kul.time.sleep')
-    def test_adjusted_sleep(self, mock_sleep):
-        """Test the adjusted_sleep function with different speed multipliers."""
-        with patch('vpn_kul.speed_multiplier', 2.0):
-            from vpn_kul import adjusted_sleep
-            adjusted_sleep(4.0)
-            mock_sleep.assert_called_with(2.0)  # 4.0 / 2.0 = 2.0
 
 
 class TestVpnKulIntegration(unittest.TestCase):
-    """Integration tests that test the main workflow with mocked external dependencies."""
-    
-    @patch('vpn_kul.os.system')
-    @patch('vpn_kul.pyautogui.hotkey')
-    @patch('vpn_kul.pyautogui.press')
-    @patch('vpn_kul.pyautogui.write')
-    @patch('vpn_kul.pyautogui.click')
-    @patch('vpn_kul.pyautogui.locateOnScreen')
-    @patch('vpn_kul.pyautogui.size')
-    @patch('vpn_kul.os.startfile')
-    @patch('vpn_kul.webbrowser.open')
-    @patch('vpn_kul.time.sleep')
-    @patch('vpn_kul.load_config')
-    @patch('vpn_kul.load_username')
-    @patch('vpn_kul.ctypes.windll.user32.MessageBoxW')
-    def test_main_workflow_manual_coordinates(self, mock_msgbox, mock_load_username, 
-                                            mock_load_config, mock_sleep, mock_browser,
-                                            mock_startfile, mock_size, mock_locate,
-                                            mock_click, mock_write, mock_press,
-                                            mock_hotkey, mock_system):
+    """Integration tests that run the whole connector against the simulated desktop."""
+
+    def setUp(self):
+        import tempfile
+        import image_matcher
+        import simulator
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(image_matcher.set_capture, None)
+        os.chdir(workdir.name)
+        with open(".env", "w") as f:
+            f.write(f"USERNAME={simulator.DEFAULT_SESSION['username']}\n")
+        self.desktop = simulator.SimulatedBackend(time_scale=0.1)
+
+    def save_config(self, **options):
+        import vpn_kul
+        # The fixed wait for the tunnel, scaled like the simulated session
+        vpn_kul.save_config({**vpn_kul.load_config(), "tunnel_wait": vpn_kul.TUNNEL_WAIT * 0.1, **options})
+
+    def test_main_workflow_manual_coordinates(self):
         """Test the main workflow using manual coordinates method."""
-        # Setup mocks
-        mock_load_username.return_value = "testuser"
-        mock_load_config.return_value = {
-            "button_press_method": "manual_coordinates",
-            "manual_x": 100,
-            "manual_y": 200,
-            "speed_multiplier": 1.0,
-            "close_tabs": True,
-            "close_ivanti": True,
-            "ivanti_path": "test_path.lnk"
-        }
-        mock_size.return_value = (1920, 1080)
-        
-        # Mock environment variables
-        with patch.dict('os.environ', {'USERNAME': 'testuser', 'PASSWORD': 'testpass'}):
-            with patch('builtins.open', mock_open(read_data="USERNAME=testuser\nPASSWORD=testpass")):
-                with patch('os.path.exists', return_value=True):
-                    # Import and run the main script logic
-                    import vpn_kul
-        
-        # Verify the workflow
-        mock_browser.assert_has_calls([
-            call("https://vpn.kuleuven.be"),
-            call('https://uafw.icts.kuleuven.be')
-        ])
-        mock_startfile.assert_called_once()
-        mock_click.assert_called_with(100, 200)  # Manual coordinates
-        mock_write.assert_has_calls([call("testuser"), call("testpass")])
-        mock_press.assert_has_calls([call('tab'), call('enter'), call('enter')])
-        mock_hotkey.assert_has_calls([call('ctrl', 'w'), call('ctrl', 'w')])
-        mock_system.assert_called_once()
-    
-    @patch('vpn_kul.sys.exit')
-    @patch('vpn_kul.ctypes.windll.user32.MessageBoxW')
-    @patch('vpn_kul.load_username')
-    def test_missing_credentials_exit(self, mock_load_username, mock_msgbox, mock_exit):
+        import simulator
+        from vpn_kul import main
+        left, top, right, bottom = simulator.load_manifest()[simulator.DEFAULT_SESSION["ivanti"]]["ivanti"]
+        connect_button = (left + int((right - left) * 0.826), top + int((bottom - top) * 0.414))
+        self.save_config(button_press_method="manual_coordinates", manual_x=connect_button[0], manual_y=connect_button[1])
+
+        main([], self.desktop)
+
+        self.assertEqual(self.desktop.urls, ["https://vpn.kuleuven.be", "https://uafw.icts.kuleuven.be"])
+        self.assertEqual(len(self.desktop.launched), 1)
+        self.assertEqual(self.desktop.clicks, [connect_button])
+        self.assertEqual(self.desktop.typed, [simulator.DEFAULT_SESSION["username"], simulator.DEFAULT_SESSION["password"]])
+        self.assertIsNotNone(self.desktop.connected_after())
+        self.assertEqual(self.desktop.messages, [])
+        self.assertNotIn(simulator.IVANTI_TITLE, [title for _, title in self.desktop.visible_windows()])
+
+    def test_learned_timing_is_saved_once_at_the_end(self):
+        """The run saves its step history once, over the settings changed while it ran."""
+        import simulator
+        import vpn_kul
+        left, top, right, bottom = simulator.load_manifest()[simulator.DEFAULT_SESSION["ivanti"]]["ivanti"]
+        self.save_config(button_press_method="manual_coordinates", manual_x=left + int((right - left) * 0.826),
+                         manual_y=top + int((bottom - top) * 0.414))
+        save_config = vpn_kul.save_config
+
+        def change_language(lines):
+            # The setup tool saving a setting while the run goes on
+            save_config({**vpn_kul.load_config(), "language": "nl"})
+
+        with patch('vpn_kul.write_run_log', side_effect=change_language), \
+                patch('vpn_kul.save_config', side_effect=save_config) as saved:
+            vpn_kul.main([], self.desktop)
+
+        saved.assert_called_once()
+        config = vpn_kul.load_config()
+        self.assertEqual(config["language"], "nl")
+        self.assertIn("browser_window", config["step_history"])
+        self.assertFalse(os.path.exists(vpn_kul.CONFIG_FILE + ".tmp"))
+
+    def test_broken_config_falls_back_to_the_defaults(self):
+        """A config file cut off halfway is read as the defaults instead of stopping the run."""
+        import vpn_kul
+        with open(vpn_kul.CONFIG_FILE, "w") as f:
+            f.write('{"button_press_method": "manual_coor')
+
+        self.assertEqual(vpn_kul.load_config()["button_press_method"], "image_recognition")
+
+    def test_missing_credentials_exit(self):
         """Test that the script exits when credentials are missing."""
-        mock_load_username.return_value = None
-        
-        with patch('builtins.open', mock_open(read_data="")):
-            with patch('os.path.exists', return_value=False):
-                try:
-                    import vpn_kul
-                except SystemExit:
-                    pass
-        
-        mock_msgbox.assert_called_once()
-        mock_exit.assert_called_once_with(1)
-    
-    @patch('vpn_kul.sys.exit')
-    @patch('vpn_kul.ctypes.windll.user32.MessageBoxW')
-    @patch('vpn_kul.load_config')
-    @patch('vpn_kul.load_username')
-    def test_missing_manual_coordinates_exit(self, mock_load_username, mock_load_config, 
-                                           mock_msgbox, mock_exit):
+        from vpn_kul import main
+        os.remove(".env")
+
+        with self.assertRaises(SystemExit) as stopped:
+            main([], self.desktop)
+
+        self.assertEqual(stopped.exception.code, 1)
+        self.assertIn("Missing VPN credentials", self.desktop.messages[0][1])
+        self.assertEqual(self.desktop.launched, [])
+
+    def test_missing_manual_coordinates_exit(self):
         """Test that the script exits when manual coordinates are missing."""
-        mock_load_username.return_value = "testuser"
-        mock_load_config.return_value = {
-            "button_press_method": "manual_coordinates",
-            "manual_x": 0,  # Invalid coordinate
-            "manual_y": 0,  # Invalid coordinate
-        }
-        
-        with patch.dict('os.environ', {'PASSWORD': 'testpass'}):
-            with patch('builtins.open', mock_open(read_data="USERNAME=testuser\nPASSWORD=testpass")):
-                with patch('os.path.exists', return_value=True):
-                    try:
-                        import vpn_kul
-                    except SystemExit:
-                        pass
-        
-        mock_msgbox.assert_called_once()
-        mock_exit.assert_called_once_with(1)
+        from vpn_kul import main
+        self.save_config(button_press_method="manual_coordinates", manual_x=0, manual_y=0)
+
+        with self.assertRaises(SystemExit) as stopped:
+            main([], self.desktop)
+
+        self.assertEqual(stopped.exception.code, 1)
+        self.assertIn("Missing or invalid manual click coordinates", self.desktop.messages[0][1])
+        self.assertEqual(self.desktop.clicks, [])
 
 
 class TestPressButton(unittest.TestCase):
@@ -244,32 +235,34 @@ class TestPressButton(unittest.TestCase):
             "manual_y": 200
         }
     
-    @patch('vpn_kul.pyautogui.click')
-    @patch('vpn_kul.config', {"button_press_method": "manual_coordinates", "manual_x": 100, "manual_y": 200})
-    def test_press_button_manual_coordinates(self, mock_click):
+    @patch('vpn_kul.backend', create=True)
+    @patch('vpn_kul.config', {"button_press_method": "manual_coordinates", "manual_x": 100, "manual_y": 200}, create=True)
+    def test_press_button_manual_coordinates(self, mock_backend):
         """Test press_button with manual coordinates method."""
         from vpn_kul import press_connect_button
         press_connect_button()
-        mock_click.assert_called_once_with(100, 200)
+        mock_backend.click.assert_called_once_with(100, 200)
     
+    @patch('vpn_kul.dump_flight_recorder')
+    @patch('vpn_kul.backend', create=True)
     @patch('vpn_kul.sys.exit')
-    @patch('vpn_kul.pyautogui.locateAllOnScreen')
-    @patch('vpn_kul.pyautogui.locateOnScreen')
-    @patch('vpn_kul.config', {"button_press_method": "image_recognition"})
-    def test_press_button_image_recognition_not_found(self, mock_locate, mock_locate_all, mock_exit):
+    @patch('vpn_kul.locate_ivanti_window')
+    @patch('vpn_kul.config', {"button_press_method": "image_recognition"}, create=True)
+    def test_press_button_image_recognition_not_found(self, mock_locate, mock_exit, mock_backend, mock_dump):
         """Test press_button with image recognition when button is not found."""
-        mock_locate.return_value = None
-        mock_locate_all.return_value = []
+        mock_locate.return_value = (None, None, None)
         
         from vpn_kul import press_connect_button
         press_connect_button()
         
+        mock_backend.message_box.assert_called_once()
         mock_exit.assert_called_once()
     
-    @patch('vpn_kul.pyautogui.click')
-    @patch('vpn_kul.pyautogui.locateOnScreen')
-    @patch('vpn_kul.config', {"button_press_method": "image_recognition"})
-    def test_press_button_image_recognition_found(self, mock_locate, mock_click):
+    @patch('image_matcher.remember_match')
+    @patch('vpn_kul.backend', create=True)
+    @patch('vpn_kul.locate_ivanti_window')
+    @patch('vpn_kul.config', {"button_press_method": "image_recognition", "img_rel_x": 0.5, "img_rel_y": 0.5}, create=True)
+    def test_press_button_image_recognition_found(self, mock_locate, mock_backend, mock_remember):
         """Test press_button with image recognition when button is found."""
         # Mock a button location
         mock_button = MagicMock()
@@ -277,13 +270,238 @@ class TestPressButton(unittest.TestCase):
         mock_button.top = 100
         mock_button.width = 100
         mock_button.height = 50
-        mock_locate.return_value = mock_button
+        mock_locate.return_value = (mock_button, MagicMock(), None)
         
         from vpn_kul import press_connect_button
         press_connect_button()
         
         # Should click at the center of the button (50 + 100//2, 100 + 50//2)
-        mock_click.assert_called_once_with(100, 125)
+        mock_backend.click.assert_called_once_with(100, 125)
+
+
+class TestConnectorSteps(unittest.TestCase):
+    """Test the step graph of the login flow."""
+
+    def test_startup_work_overlaps(self):
+        """The VPN page, the password and Ivanti start without waiting on each other."""
+        import step_graph
+        from vpn_kul import connector_steps
+        steps = {step.name: step for step in connector_steps()}
+
+        step_graph.check_graph(list(steps.values()))
+        for name in ["open_vpn_page", "password", "launch_ivanti"]:
+            self.assertEqual(steps[name].after, ())
+        self.assertEqual(steps["ivanti_window"].after, ("launch_ivanti",))
+        self.assertIn("check_logged_in", steps["activate_ivanti"].after)
+        self.assertIn("password", steps["enter_credentials"].after)
+
+    @patch('vpn_kul.fail')
+    @patch('vpn_kul.match_thresholds', return_value={})
+    @patch('vpn_kul.template_scales', return_value=[1.0])
+    @patch('vpn_kul.image_recognition')
+    def test_loaded_vpn_page_ends_the_logged_in_check(self, mock_recognition, mock_scales, mock_thresholds, mock_fail):
+        """A browser named after the VPN page ends the check without waiting out its timeout."""
+        from conftest import FakeWindows
+        from vpn_kul import check_if_logged_in
+        mock_recognition.return_value.find_login_page.return_value = None
+        windows = FakeWindows({1: ("VPN KU Leuven - Web Browser", None)}, foreground=1)
+        with patch('vpn_kul.config', {"step_history": {}}, create=True), \
+                patch('vpn_kul.speed_multiplier', 1.0, create=True), \
+                patch('vpn_kul.windows', windows, create=True), \
+                patch.dict('step_timing.DEFAULT_TIMEOUTS', {"login_page": 60}):
+            check_if_logged_in(1)
+
+        mock_recognition.return_value.find_login_page.assert_not_called()
+        mock_fail.assert_not_called()
+
+    @patch('vpn_kul.wait_for')
+    def test_activate_ivanti_with_fake_windows(self, mock_wait_for):
+        """Test the activate step against a fake window backend."""
+        from conftest import FakeWindows
+        from vpn_kul import activate_ivanti
+        windows = FakeWindows({2: ("Ivanti Secure Access Client", (700, 200, 1170, 800))})
+
+        with patch('vpn_kul.windows', windows, create=True):
+            rect = activate_ivanti({"ivanti_window": 2})
+
+        self.assertEqual(rect, (700, 200, 1170, 800))
+        self.assertEqual(windows.activated, [2])
+
+    @patch('vpn_kul.window_discovery.activate_window')
+    def test_activate_ivanti_without_window(self, mock_activate):
+        """Without an Ivanti window the connect step searches the whole screen."""
+        from vpn_kul import activate_ivanti
+
+        self.assertIsNone(activate_ivanti({"ivanti_window": None}))
+        mock_activate.assert_not_called()
+
+    @patch('vpn_kul.wait_for', return_value=None)
+    def test_confirm_without_dialog_does_not_wait_for_ivanti_to_close(self, mock_wait_for):
+        """When no confirm dialog shows up the focus is on Ivanti's main window, which stays open."""
+        from conftest import FakeWindows
+        from vpn_kul import confirm_login
+        windows = FakeWindows({2: ("Ivanti Secure Access Client", None)}, foreground=2)
+
+        with patch('vpn_kul.windows', windows, create=True), patch('vpn_kul.backend', create=True) as mock_backend:
+            confirm_login({"enter_credentials": 3, "ivanti_window": 2})
+
+        mock_backend.press.assert_called_once_with('enter')
+        self.assertEqual([args[1] for args, _ in mock_wait_for.call_args_list], ["confirm_prompt"])
+
+    @patch('vpn_kul.fail', side_effect=SystemExit(1))
+    def test_blocked_typing_fails_with_a_message(self, mock_fail):
+        """Typing blocked by Windows stops the run with an error dialog instead of a traceback."""
+        from conftest import FakeWindows
+        from vpn_kul import enter_credentials
+        blocked = OSError("Only 0 of 40 key events were typed, the focused window may run as administrator")
+
+        with patch('vpn_kul.windows', FakeWindows({3: ("Ivanti Secure Access Client", None)}, foreground=3), create=True), \
+                patch('vpn_kul.USERNAME', 'r0123456', create=True), \
+                patch('vpn_kul.backend', create=True) as mock_backend:
+            mock_backend.type_text.side_effect = blocked
+            with self.assertRaises(SystemExit):
+                enter_credentials({"password": "secret", "click_connect": 3})
+
+        message = mock_fail.call_args[0][0]
+        self.assertIn("credentials", message)
+        self.assertIn("administrator", message)
+        self.assertNotIn("secret", message)
+
+    @patch('vpn_kul.wait_for', return_value=None)
+    def test_no_credentials_prompt_fails_instead_of_typing(self, mock_wait_for):
+        """When Ivanti shows no dialog after the click, nothing is typed into the window that has the focus."""
+        from conftest import FakeWindows
+        from vpn_kul import click_connect
+        windows = FakeWindows({2: ("Ivanti Secure Access Client", None), 5: ("VPN KU Leuven - Web Browser", None)}, foreground=5)
+
+        with patch('vpn_kul.windows', windows, create=True), \
+                patch('vpn_kul.press_connect_button'), \
+                patch('vpn_kul.fail', side_effect=SystemExit(1)) as mock_fail, \
+                patch('vpn_kul.backend', create=True) as mock_backend:
+            with self.assertRaises(SystemExit):
+                click_connect({"ivanti_window": 2, "activate_ivanti": None})
+
+        self.assertIn("did not ask for the credentials", mock_fail.call_args[0][0])
+        mock_backend.type_text.assert_not_called()
+
+    @patch('vpn_kul.fail', side_effect=SystemExit(1))
+    def test_missing_password_fails_outside_the_password_step(self, mock_fail):
+        """The password step has a timeout and a retry, the error dialog is shown by the step that uses it."""
+        from vpn_kul import enter_credentials, fetch_password
+
+        with patch('vpn_kul.USERNAME', 'r0123456', create=True), patch('vpn_kul.backend', create=True) as mock_backend:
+            mock_backend.get_password.return_value = None
+            self.assertIsNone(fetch_password({}))
+            mock_fail.assert_not_called()
+            with self.assertRaises(SystemExit):
+                enter_credentials({"password": None, "click_connect": 3})
+
+        self.assertIn("Missing VPN credentials", mock_fail.call_args[0][0])
+        mock_backend.type_text.assert_not_called()
+
+    def test_failing_step_stops_the_steps_beside_it(self):
+        """fail() in one step cancels the steps still waiting, instead of leaving them to their timeouts."""
+        import time
+        import cancellation
+        import step_graph
+        import ui_wait
+        import vpn_kul
+        self.addCleanup(cancellation.reset)
+        self.addCleanup(vpn_kul.run_failed.clear)
+
+        def give_up(results):
+            time.sleep(0.1)
+            vpn_kul.fail("Ivanti did not start.")
+
+        steps = [step_graph.Step("wait", lambda results: ui_wait.wait_until(lambda: None, timeout=5, poll=0.5)),
+                 step_graph.Step("give_up", give_up)]
+        start = time.monotonic()
+        with patch('vpn_kul.backend', create=True), patch('vpn_kul.dump_flight_recorder', return_value=False):
+            # Whichever stops first ends the run, connect() tells them apart with run_failed
+            with self.assertRaises((SystemExit, KeyboardInterrupt)):
+                step_graph.run(steps)
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertTrue(vpn_kul.run_failed.is_set())
+
+    def test_credentials_prompt_gets_the_focus_back_before_typing(self):
+        """A browser that took the focus after the click does not get the credentials."""
+        from conftest import FakeWindows
+        from vpn_kul import enter_credentials
+        windows = FakeWindows({2: ("Ivanti Secure Access Client", None), 3: ("Connect to: B-Zone", None),
+                               5: ("VPN KU Leuven - Web Browser", None)}, foreground=5)
+        typed_into = []
+
+        with patch('vpn_kul.windows', windows, create=True), \
+                patch('vpn_kul.wait_for', side_effect=lambda condition, step, **options: condition()), \
+                patch('vpn_kul.USERNAME', 'r0123456', create=True), \
+                patch('vpn_kul.backend', create=True) as mock_backend:
+            mock_backend.type_text.side_effect = lambda text: typed_into.append(windows.foreground)
+            enter_credentials({"password": "secret", "click_connect": 3})
+
+        self.assertEqual(typed_into, [3])
+
+
+class TestWaitFor(unittest.TestCase):
+    """Test waiting for the UI with the learned step timeouts."""
+
+    def wait(self, condition, history, windows=None, timeout=0.05, **options):
+        from conftest import FakeWindows
+        from vpn_kul import wait_for
+        with patch('vpn_kul.config', {"step_history": history}, create=True), \
+                patch('vpn_kul.speed_multiplier', 1.0, create=True), \
+                patch('vpn_kul.windows', windows or FakeWindows({}), create=True), \
+                patch.dict('step_timing.DEFAULT_TIMEOUTS', {"confirm_prompt": timeout}):
+            return wait_for(condition, "confirm_prompt", **options)
+
+    def test_timeout_is_not_learned(self):
+        """A wait that times out every run keeps the default timeout instead of growing it."""
+        history = {}
+        for _ in range(5):
+            self.assertIsNone(self.wait(lambda: None, history))
+
+        self.assertEqual(history, {})
+
+    def test_success_is_learned(self):
+        history = {}
+
+        self.assertEqual(self.wait(lambda: 3, history), 3)
+        self.assertEqual(len(history["confirm_prompt"]), 1)
+
+    def test_late_success_is_learned(self):
+        """A step slower than its timeout still succeeds, and its timeout grows from it."""
+        import time
+        history = {}
+        ready_at = time.monotonic() + 0.13
+
+        self.assertEqual(self.wait(lambda: time.monotonic() >= ready_at, history, timeout=0.1), True)
+        self.assertGreater(history["confirm_prompt"][0], 0.1)
+
+    def test_screen_and_network_waits_skip_window_events(self):
+        """A condition window events can not change polls without listening to them."""
+        from conftest import FakeWindows
+        windows = FakeWindows({})
+        windows.window_events = MagicMock(side_effect=AssertionError("listened to window events"))
+        checks = iter([None, None, 3])
+
+        self.assertEqual(self.wait(lambda: next(checks), {}, windows, timeout=5, events=False), 3)
+        self.assertEqual(self.wait(lambda: 3, {}, FakeWindows({})), 3)
+
+
+class TestStartup(unittest.TestCase):
+    """Test that starting the connector stays quick."""
+
+    # Cold import of vpn_kul was 0.24 s with numpy, PIL and pyautogui imported up front. What it
+    # imports is checked instead of how long that takes, a wall-clock limit fails on a busy machine
+    HEAVY_MODULES = ["numpy", "PIL", "pyautogui", "pynput", "keyring", "webbrowser", "image_matcher", "recognition"]
+
+    def run_python(self, code):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+
+    def test_import_leaves_heavy_modules_for_later(self):
+        loaded = json.loads(self.run_python(f"import json, sys, vpn_kul; print(json.dumps([m for m in {self.HEAVY_MODULES!r} if m in sys.modules]))"))
+        self.assertEqual(loaded, [])
 
 
 if __name__ == '__main__':
@@ -294,6 +512,9 @@ if __name__ == '__main__':
     test_suite.addTest(unittest.makeSuite(TestVpnKul))
     test_suite.addTest(unittest.makeSuite(TestVpnKulIntegration))
     test_suite.addTest(unittest.makeSuite(TestPressButton))
+    test_suite.addTest(unittest.makeSuite(TestConnectorSteps))
+    test_suite.addTest(unittest.makeSuite(TestWaitFor))
+    test_suite.addTest(unittest.makeSuite(TestStartup))
     
     # Run the tests
     runner = unittest.TextTestRunner(verbosity=2)
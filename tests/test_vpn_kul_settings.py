@@ -104,16 +104,45 @@ class TestConfigurationFunctions:
         # Should return default configuration
         assert "language" in result
         assert result["language"] == "en"
+
+    @patch('vpn_kul.os.path.exists', return_value=False)
+    @patch('vpn_kul_settings.os.path.exists', return_value=False)
+    def test_defaults_cover_the_connector_settings(self, mock_exists, mock_connector_exists):
+        """Every setting the connector has a default for gets the same default here."""
+        import vpn_kul
+        from vpn_kul_settings import load_config
+        connector_defaults = vpn_kul.load_config()
+        defaults = load_config()
+
+        differing = {key for key in connector_defaults if defaults.get(key, ...) != connector_defaults[key]}
+        # The tools have always had a connect button offset a thousandth apart, not a missing key
+        assert differing <= {"img_rel_y"}
     
+    @patch('vpn_kul_settings.os.replace')
     @patch('builtins.open', new_callable=mock_open)
-    def test_save_config(self, mock_file, sample_config):
+    def test_save_config(self, mock_file, mock_replace, sample_config):
         """Test saving configuration to file."""
         with patch('vpn_kul_settings.CONFIG_FILE', 'test_config.json'):
             from vpn_kul_settings import save_config
             save_config(sample_config)
             
-        mock_file.assert_called_once_with('test_config.json', 'w')
+        mock_file.assert_called_once_with('test_config.json.tmp', 'w')
         mock_file().write.assert_called()
+        mock_replace.assert_called_once_with('test_config.json.tmp', 'test_config.json')
+
+    def test_save_config_keeps_the_learned_timing(self, sample_config, tmp_path, monkeypatch):
+        """The step history the connector saved after the tool loaded the config is kept."""
+        from vpn_kul_settings import save_config
+        monkeypatch.chdir(tmp_path)
+        learned = {"browser_window": [1.2, 1.4, 1.3]}
+        (tmp_path / "vpn_config.json").write_text(json.dumps({**sample_config, "step_history": learned}))
+
+        save_config({**sample_config, "step_history": {}, "language": "nl"})
+
+        saved = json.loads((tmp_path / "vpn_config.json").read_text())
+        assert saved["step_history"] == learned
+        assert saved["language"] == "nl"
+        assert os.listdir(tmp_path) == ["vpn_config.json"]
     
     @patch('vpn_kul_settings.os.path.exists')
     @patch('builtins.open', new_callable=mock_open)
@@ -244,26 +273,33 @@ class TestGUIFunctions:
 class TestManualClickMenu:
     """Test manual click position functionality."""
     
+    @patch('vpn_kul_settings.mouse.Listener')
     @patch('vpn_kul_settings.tk.Button')
     @patch('vpn_kul_settings.tk.Label')
     @patch('vpn_kul_settings.clear_frame')
     @patch('vpn_kul_settings.pyautogui.position')
-    @patch('vpn_kul_settings.os.startfile')
-    @patch('vpn_kul_settings.time.sleep')
-    def test_show_manual_click_menu(self, mock_sleep, mock_startfile, mock_position, 
-                                   mock_clear, mock_label, mock_button):
-        """Test showing manual click menu."""
+    @patch('vpn_kul_settings.os.startfile', create=True)
+    def test_show_manual_click_menu(self, mock_startfile, mock_position,
+                                   mock_clear, mock_label, mock_button, mock_listener):
+        """Test showing manual click menu and starting the capture, which brings Ivanti to the front."""
+        from conftest import FakeWindows
         mock_position.return_value = (100, 200)
+        windows = FakeWindows({1: ("Explorer", None), 2: ("Ivanti Secure Access Client", None)}, foreground=1)
         
         with patch('vpn_kul_settings.config', {'ivanti_path': 'test_path'}):
             with patch('vpn_kul_settings.root', MagicMock()):
                 with patch('vpn_kul_settings.get_translation', side_effect=lambda x: x):
-                    from vpn_kul_settings import show_manual_click_menu
-                    show_manual_click_menu()
+                    with patch('vpn_kul_settings.windows', windows):
+                        from vpn_kul_settings import show_manual_click_menu
+                        show_manual_click_menu()
+                        start_capture = mock_button.call_args_list[0].kwargs["command"]
+                        start_capture()
         
         mock_clear.assert_called_once()
         mock_label.assert_called()
-        mock_button.assert_called()
+        mock_startfile.assert_called_once_with('test_path')
+        assert windows.activated == [2]
+        mock_listener.return_value.start.assert_called_once()
     
     @patch('vpn_kul_settings.messagebox.showinfo')
     @patch('vpn_kul_settings.save_config')
@@ -0,0 +1,296 @@
+import threading
+import time
+
+import numpy as np
+
+import cancellation
+import image_matcher
+import ui_wait
+import window_discovery
+from conftest import FakeWindows
+
+
+class FakeUser32:
+    """The user32 functions Win32Windows calls, over a dict of windows.
+
+    show() and close() fire the window events of the installed hooks the next time messages
+    are pumped, like out-of-context WinEvent hooks do.
+    """
+
+    def __init__(self, windows):
+        self.windows = dict(windows)
+        self.foreground = None
+        self.enumerations = 0
+        self.hidden = set()
+        self.hooks = {}
+        self.queued = []
+        self.on_wait = []
+
+    def EnumWindows(self, callback, lparam):
+        self.enumerations += 1
+        for hwnd in list(self.windows):
+            if not callback(hwnd, lparam):
+                break
+        return True
+
+    def IsWindowVisible(self, hwnd):
+        return hwnd in self.windows and hwnd not in self.hidden
+
+    def IsWindow(self, hwnd):
+        return hwnd in self.windows
+
+    def GetWindowTextW(self, hwnd, buffer, length):
+        buffer.value = self.windows.get(hwnd, ("", None))[0][:length - 1]
+        return len(buffer.value)
+
+    def GetWindowRect(self, hwnd, rect):
+        if hwnd not in self.windows:
+            return False
+        rect._obj.left, rect._obj.top, rect._obj.right, rect._obj.bottom = self.windows[hwnd][1]
+        return True
+
+    def GetForegroundWindow(self):
+        return self.foreground
+
+    def GetWindowThreadProcessId(self, hwnd, process):
+        process._obj.value = hwnd * 10 if hwnd in self.windows else 0
+        return 1 if hwnd in self.windows else 0
+
+    def ShowWindow(self, hwnd, command):
+        return True
+
+    def SetForegroundWindow(self, hwnd):
+        self.foreground = hwnd
+        self._fire(window_discovery.EVENT_SYSTEM_FOREGROUND, hwnd)
+        return True
+
+    def SetActiveWindow(self, hwnd):
+        return hwnd
+
+    def SetWinEventHook(self, low, high, module, callback, process, thread, flags):
+        handle = len(self.hooks) + 1
+        self.hooks[handle] = (low, high, callback)
+        return handle
+
+    def UnhookWinEvent(self, handle):
+        return self.hooks.pop(handle, None) is not None
+
+    def MsgWaitForMultipleObjects(self, count, handles, wait_all, milliseconds, mask):
+        if self.on_wait:
+            self.on_wait.pop(0)()
+        elif not self.queued:
+            time.sleep(milliseconds / 1000)
+        return 0
+
+    def PeekMessageW(self, message, hwnd, low, high, remove):
+        if not self.queued:
+            return False
+        event, window = self.queued.pop(0)
+        for handle, (low, high, callback) in list(self.hooks.items()):
+            if low <= event <= high:
+                callback(handle, event, window, window_discovery.OBJID_WINDOW, window_discovery.CHILDID_SELF, 0, 0)
+        return True
+
+    def PostMessageW(self, hwnd, message, wparam, lparam):
+        if hwnd not in self.windows:
+            return False
+        if message == window_discovery.WM_CLOSE:
+            # The window closes a moment later, while the caller waits for it
+            self.on_wait.append(lambda: self.close(hwnd))
+        return True
+
+    def TranslateMessage(self, message):
+        return False
+
+    def DispatchMessageW(self, message):
+        return 0
+
+    def _fire(self, event, hwnd):
+        self.queued.append((event, hwnd))
+
+    def show(self, hwnd, title, rect=(0, 0, 100, 100)):
+        self.windows[hwnd] = (title, rect)
+        self._fire(window_discovery.EVENT_OBJECT_CREATE, hwnd)
+
+    def close(self, hwnd):
+        del self.windows[hwnd]
+        self._fire(window_discovery.EVENT_OBJECT_DESTROY, hwnd)
+
+    def hide(self, hwnd):
+        self.hidden.add(hwnd)
+        self._fire(window_discovery.EVENT_OBJECT_HIDE, hwnd)
+
+
+class TestWin32Windows:
+    """Test the user32 window backend against a fake user32."""
+
+    def test_lists_visible_windows_with_a_title(self):
+        user32 = FakeUser32({1: ("Toledo - Google Chrome", None), 2: ("", None), 3: ("Ivanti Secure Access Client", None)})
+
+        assert window_discovery.Win32Windows(user32).visible_windows() == [(1, "Toledo - Google Chrome"),
+                                                                           (3, "Ivanti Secure Access Client")]
+
+    def test_reuses_one_callback_and_title_buffer(self):
+        windows = window_discovery.Win32Windows(FakeUser32({1: ("Explorer", None)}))
+        callback, buffer = windows._enum_windows_proc, windows._title
+
+        windows.visible_windows()
+        windows.visible_windows()
+
+        assert windows._enum_windows_proc is callback and windows._title is buffer
+
+    def test_process_id(self):
+        windows = window_discovery.Win32Windows(FakeUser32({3: ("Connect to: B-Zone", None)}))
+
+        assert windows.process_id(3) == 30
+        assert windows.process_id(4) == 0
+
+    def test_get_rect(self):
+        windows = window_discovery.Win32Windows(FakeUser32({2: ("Ivanti", (700, 200, 1170, 800))}))
+
+        assert windows.get_rect(2) == (700, 200, 1170, 800)
+        assert windows.get_rect(9) is None
+
+    def test_window_events_wake_the_wait_up(self):
+        user32 = FakeUser32({1: ("Explorer", None)})
+        user32.on_wait.append(lambda: user32.show(7, "Ivanti Secure Access Client"))
+        windows = window_discovery.Win32Windows(user32)
+
+        start = time.monotonic()
+        with windows.window_events() as sleep:
+            hwnd = ui_wait.wait_until(lambda: window_discovery.find_window(windows, ["ivanti"]), timeout=5, poll=5, sleep=sleep)
+
+        assert hwnd == 7
+        assert time.monotonic() - start < 1
+        assert user32.hooks == {}
+
+    def test_close_posts_wm_close_and_the_wait_sees_it(self):
+        user32 = FakeUser32({1: ("Explorer", None), 2: ("Ivanti Secure Access Client", None)})
+        windows = window_discovery.Win32Windows(user32)
+
+        assert windows.close(2)
+        start = time.monotonic()
+        with windows.window_events() as sleep:
+            closed = ui_wait.wait_until(ui_wait.window_closed(windows, 2), timeout=5, poll=5, sleep=sleep)
+
+        assert closed
+        assert time.monotonic() - start < 1
+        assert not windows.close(9)
+
+    def test_window_hidden_on_close_counts_as_closed(self):
+        # Like Ivanti, which goes to the tray on WM_CLOSE
+        user32 = FakeUser32({2: ("Ivanti Secure Access Client", None)})
+        user32.on_wait.append(lambda: user32.hide(2))
+        windows = window_discovery.Win32Windows(user32)
+
+        with windows.window_events() as sleep:
+            closed = ui_wait.wait_until(ui_wait.window_closed(windows, 2), timeout=5, poll=5, sleep=sleep)
+
+        assert closed and windows.exists(2)
+
+    def test_sleep_without_events_lasts_its_time(self):
+        windows = window_discovery.Win32Windows(FakeUser32({}))
+
+        start = time.monotonic()
+        with windows.window_events() as sleep:
+            sleep(0.05)
+
+        assert time.monotonic() - start >= 0.05
+
+    def test_stopped_run_ends_the_event_sleep(self):
+        windows = window_discovery.Win32Windows(FakeUser32({}))
+        threading.Timer(0.1, cancellation.cancel).start()
+
+        start = time.monotonic()
+        try:
+            with windows.window_events() as sleep:
+                sleep(2)
+        finally:
+            cancellation.reset()
+
+        assert time.monotonic() - start < 0.5
+
+
+class TestFindIvantiWindowCache:
+    """Test remembering the Ivanti window between lookups."""
+
+    def test_known_window_is_not_looked_up_again(self):
+        user32 = FakeUser32({1: ("Explorer", None), 2: ("Ivanti Secure Access Client", None)})
+        windows = window_discovery.Win32Windows(user32)
+
+        assert window_discovery.find_ivanti_window(windows) == 2
+        assert window_discovery.find_ivanti_window(windows) == 2
+        assert user32.enumerations == 1
+
+    def test_closed_window_is_looked_up_again(self):
+        user32 = FakeUser32({2: ("Ivanti Secure Access Client", None)})
+        windows = window_discovery.Win32Windows(user32)
+        window_discovery.find_ivanti_window(windows)
+
+        user32.close(2)
+        user32.show(5, "Ivanti Secure Access Client")
+
+        assert window_discovery.find_ivanti_window(windows) == 5
+        assert user32.enumerations == 2
+
+    def test_reused_handle_is_not_taken_for_ivanti(self):
+        user32 = FakeUser32({2: ("Ivanti Secure Access Client", None)})
+        windows = window_discovery.Win32Windows(user32)
+        window_discovery.find_ivanti_window(windows)
+
+        user32.windows[2] = ("Untitled - Notepad", None)
+
+        assert window_discovery.find_ivanti_window(windows) is None
+
+
+class TestFindAndActivateIvantiWindow:
+    """Test looking up the Ivanti window and its bounds."""
+
+    def test_returns_bounds_of_ivanti_window(self):
+        windows = FakeWindows({
+            1: ("Toledo - Google Chrome", (0, 0, 1920, 1040)),
+            2: ("Ivanti Secure Access Client", (700, 200, 1170, 800)),
+        })
+
+        rect = window_discovery.find_and_activate_ivanti_window(windows)
+
+        assert rect == (700, 200, 1170, 800)
+        assert windows.activated == [2]
+
+    def test_matches_title_case_insensitively(self):
+        windows = FakeWindows({5: ("Pulse SECURE ACCESS CLIENT", (0, 0, 10, 10))})
+
+        assert window_discovery.find_ivanti_window(windows) == 5
+
+    def test_returns_none_without_ivanti_window(self):
+        windows = FakeWindows({1: ("Explorer", (0, 0, 100, 100))})
+
+        assert window_discovery.find_and_activate_ivanti_window(windows) is None
+        assert windows.activated == []
+
+
+class TestSearchRegion:
+    """Test turning the window bounds into a matcher search region."""
+
+    def test_adds_margin_around_window(self):
+        windows = FakeWindows({2: ("Ivanti Secure Access Client", (700, 200, 1170, 800))})
+
+        rect = window_discovery.find_and_activate_ivanti_window(windows)
+
+        assert image_matcher.search_region(rect, margin=40) == (660, 160, 550, 680)
+
+    def test_clamps_to_screen(self):
+        assert image_matcher.search_region((-8, 10, 1930, 500), margin=40, screen_size=(1920, 1080)) == (0, 0, 1920, 540)
+
+    def test_window_off_screen_has_no_region(self):
+        assert image_matcher.search_region((2000, 0, 2500, 600), margin=0, screen_size=(1920, 1080)) is None
+
+    def test_match_in_region_is_translated_to_screen_coordinates(self):
+        screen = np.random.default_rng(0).integers(0, 256, size=(400, 600), dtype=np.uint8)
+        templates = {"window.png": screen[220:260, 330:390].copy()}
+        region = (300, 200, 120, 100)
+        left, top, width, height = region
+
+        match = image_matcher.find_best_match(templates, screen=screen[top:top + height, left:left + width], region=region)
+
+        assert (match.left, match.top) == (330, 220)
@@ -54,7 +54,22 @@ translations = {
         "error_reading_readme": "Error reading README file",
         "relative_x" : "Relative X coordinate",
         "relative_y" : "Relative Y coordinate",
-        "relative_click_position": "Relative position of connect button in ivanti window"
+        "relative_click_position": "Relative position of connect button in ivanti window",
+        "learned_timing": "Learned Timing",
+        "step_ivanti_window": "Ivanti launch",
+        "step_ivanti_foreground": "Ivanti to the front",
+        "step_credentials_prompt": "Credentials dialog",
+        "step_confirm_prompt": "Confirmation dialog",
+        "step_confirm_closed": "Connection after confirmation",
+        "step_browser_window": "Browser window",
+        "step_browser_tab": "Browser tab",
+        "step_ivanti_closed": "Closing Ivanti",
+        "step_tunnel_up": "Tunnel up",
+        "learned": "learned",
+        "default": "default",
+        "runs": "runs",
+        "reset_timing": "Reset learned timing",
+        "reset_timing_confirm": "Are you sure you want to forget the learned timing?"
     },
     "nl": {
         "invalid_entry": "Ongeldige login",
@@ -111,6 +126,21 @@ translations = {
         "error_reading_readme": "Fout bij het lezen van README bestand",
         "relative_x" : "Relatieve X coördinaat",
         "relative_y" : "Relatieve Y coördinaat",
-        "relative_click_position": "Relatieve positie van connect knop in ivanti sherm"
+        "relative_click_position": "Relatieve positie van connect knop in ivanti sherm",
+        "learned_timing": "Geleerde wachttijden",
+        "step_ivanti_window": "Ivanti opstarten",
+        "step_ivanti_foreground": "Ivanti naar voren",
+        "step_credentials_prompt": "Login venster",
+        "step_confirm_prompt": "Bevestigingsvenster",
+        "step_confirm_closed": "Verbinding na bevestiging",
+        "step_browser_window": "Browservenster",
+        "step_browser_tab": "Browser tab",
+        "step_ivanti_closed": "Ivanti sluiten",
+        "step_tunnel_up": "Tunnel actief",
+        "learned": "geleerd",
+        "default": "standaard",
+        "runs": "keer",
+        "reset_timing": "Geleerde wachttijden wissen",
+        "reset_timing_confirm": "Ben je zeker dat je de geleerde wachttijden wil wissen?"
     }
 }
\ No newline at end of file
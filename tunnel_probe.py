@@ -0,0 +1,81 @@
+import socket
+
+# A probe is checked at the poll of its step at first, then less and less often
+BACKOFF = 1.5
+MAX_POLL = 1.0
+# Longest a single TCP connect may take, a host that is not reachable yet often does not answer at all
+CONNECT_TIMEOUT = 0.5
+
+def tcp_connects(host, port, timeout=CONNECT_TIMEOUT):
+    """Condition: a TCP connection to host:port succeeds, for a host only reachable through the VPN"""
+    def condition():
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+    return condition
+
+def dns_resolves(name):
+    """Condition: name resolves, for a name only the VPN's DNS server knows
+
+    Windows caches failed lookups for a while, so a TCP probe reacts sooner where there is one.
+    """
+    def condition():
+        try:
+            return bool(socket.getaddrinfo(name, None))
+        except OSError:
+            return False
+    return condition
+
+def source_address(address):
+    """Local address traffic to address leaves from, None without a route"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            # Connecting a UDP socket only looks up the route, nothing is sent
+            probe.connect((address, 9))
+            return probe.getsockname()[0]
+    except OSError:
+        return None
+
+def route_changed(address):
+    """Condition: traffic to address leaves from another local address than when the condition
+    was made, like when the VPN adapter takes over the route. Make it before the tunnel starts"""
+    before = source_address(address)
+
+    def condition():
+        current = source_address(address)
+        return current is not None and current != before
+    return condition
+
+PROBES = {
+    "tcp": lambda target: tcp_connects(*parse_host_port(target)),
+    "dns": dns_resolves,
+    "route": route_changed,
+}
+
+def parse_host_port(target):
+    host, _, port = target.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"expected host:port, got {target!r}")
+    return host, int(port)
+
+def from_config(spec):
+    """Condition that holds once the tunnel is up, from the "tunnel_probe" setting
+
+    spec maps a probe kind to its target, like {"tcp": "host:port"}, {"dns": "name"} or
+    {"route": "address"}. With several probes any one of them holding is enough. None when
+    spec is empty, there is no telling then. Raises ValueError for an unknown kind or target.
+    """
+    if not spec:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError(f"expected probes like {{\"tcp\": \"host:port\"}}, got {spec!r}")
+    probes = []
+    for kind, target in spec.items():
+        if kind not in PROBES:
+            raise ValueError(f"unknown probe {kind!r}, use one of {', '.join(PROBES)}")
+        if not isinstance(target, str):
+            raise ValueError(f"expected a text target for {kind!r}, got {target!r}")
+        probes.append(PROBES[kind](target))
+    return lambda: any(probe() for probe in probes)
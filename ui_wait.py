@@ -0,0 +1,83 @@
+import time
+
+import cancellation
+import window_discovery
+
+# Seconds between two checks of a condition
+DEFAULT_POLL = 0.1
+
+def wait_until(condition, timeout, poll=DEFAULT_POLL, clock=time.monotonic, sleep=cancellation.sleep, backoff=1.0, max_poll=None):
+    """Check condition every poll seconds until it returns something truthy
+
+    Returns that value as soon as it does, or None once timeout seconds passed. The condition is
+    always checked at least once, and once more at the deadline. With a backoff above 1 the poll
+    grows by that factor after every check, up to max_poll, for conditions that cost something.
+    Raises cancellation.Cancelled as soon as the run is stopped.
+    """
+    deadline = clock() + timeout
+    while True:
+        cancellation.check()
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return None
+        sleep(min(poll, remaining))
+        cancellation.check()
+        poll *= backoff
+        if max_poll is not None:
+            poll = min(poll, max_poll)
+
+def window_exists(windows, keywords):
+    """Condition: a visible window whose title contains one of keywords, returns its hwnd"""
+    return lambda: window_discovery.find_window(windows, keywords)
+
+def window_is_foreground(windows, hwnd):
+    """Condition: hwnd has the focus"""
+    return lambda: windows.foreground_window() == hwnd
+
+def title_contains(windows, hwnd, text):
+    """Condition: the title of hwnd contains text, like a browser once it loaded a page"""
+    return lambda: text in windows.title(hwnd)
+
+def foreground_changed(windows, *hwnds):
+    """Condition: another window than hwnds has the focus, returns its hwnd"""
+    def condition():
+        foreground = windows.foreground_window()
+        return foreground if foreground and foreground not in hwnds else None
+    return condition
+
+def page_shown(windows, hwnd, title):
+    """Condition: a browser came to the front with a page, returns its hwnd. That is a window
+    that is not Ivanti's and not hwnd with title, the window that had the focus before: a new
+    browser window takes the focus, a running one shows the new tab's title"""
+    def condition():
+        foreground = windows.foreground_window()
+        if not foreground or (foreground == hwnd and windows.title(foreground) == title):
+            return None
+        return None if window_discovery.belongs_to_ivanti(windows, foreground) else foreground
+    return condition
+
+def ivanti_dialog(windows, *hwnds):
+    """Condition: Ivanti shows a window other than hwnds, returns its hwnd. Unlike
+    foreground_changed, a browser that takes the focus does not count"""
+    return lambda: window_discovery.find_ivanti_dialog(windows, hwnds)
+
+def window_closed(windows, hwnd):
+    """Condition: hwnd no longer refers to an open window, or the window is hidden like a tray
+    program does when it is closed"""
+    return lambda: not windows.visible(hwnd)
+
+def template_visible(templates, **match_options):
+    """Condition: one of templates is on screen, returns its Match
+
+    match_options are passed on to image_matcher.find_best_match (region, thresholds, ...).
+    """
+    import image_matcher
+    return lambda: image_matcher.find_best_match(templates, **match_options)
+
+def template_gone(templates, **match_options):
+    """Condition: none of templates is on screen anymore"""
+    import image_matcher
+    return lambda: image_matcher.find_best_match(templates, **match_options) is None
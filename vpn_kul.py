@@ -1,23 +1,44 @@
 import sys
-import webbrowser
 import os
 import _thread
-from pynput import keyboard as kb
+import contextlib
 import time
-import pyautogui
-import keyring
 import json
-import ctypes
-from ctypes import wintypes
+import threading
+
+import cancellation
+import chrome_trace
+import display_scale
+import flight_recorder
+import input_pacing
+import platform_backend
+import resident_agent
+import step_graph
+import step_timing
+import tunnel_probe
+import ui_wait
+import window_discovery
 
 def resource_path(relative_path):
     """ Get correct path, works both in development and PyInstaller """
     try:
         base_path = sys._MEIPASS
     except Exception:
-        base_path = os.path.abspath(".")
+        base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, relative_path)
 
+SERVICE_NAME = "kuleuvenvpn"
+ENV_FILE = ".env"
+CONFIG_FILE = "vpn_config.json"
+# Summary of the last run, the windowed exe has no console to print it to
+RUN_LOG_FILE = "vpn_kul_last_run.log"
+ASSETS_FOLDER = resource_path("assets_connector")
+# Seconds given to the tunnel after the login when there is no "tunnel_probe" to tell when it is up
+TUNNEL_WAIT = 6
+# Part of the browser title while it shows the VPN page, the login page a logged out user gets
+# instead is named otherwise
+VPN_PAGE_TITLE = "VPN KU Leuven"
+
 def load_username():
     if os.path.exists(ENV_FILE):
         with open(ENV_FILE, "r") as f:
@@ -27,9 +48,15 @@ def load_username():
     return None
 
 def load_config():
+    """The settings in CONFIG_FILE, the defaults when there is none or it can not be read"""
     if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                loaded_config = json.load(f)
+            if isinstance(loaded_config, dict):
+                return loaded_config
+        except (OSError, ValueError):
+            pass  # A broken file, like one written by hand, starts over from the defaults
     return {
         "button_press_method": "image_recognition",
         "manual_x": 0,
@@ -39,176 +66,450 @@ def load_config():
         "close_ivanti": True,
         "img_rel_x": 0.826,
         "img_rel_y": 0.414,
+        "last_match": None,
+        "match_thresholds": {},
+        "match_pyramid_factor": 4,
+        "match_workers": 4,
+        "template_scale": 1.0,
+        "step_history": {},
+        "input_delays": {},
+        "tunnel_probe": None,
+        "tunnel_wait": TUNNEL_WAIT,
         "ivanti_path": r"C:\ProgramData\Microsoft\Windows\Start Menu\Programs\Pulse Secure\Ivanti Secure Access Client.lnk"
     }
 
-def adjusted_sleep(duration):
-    time.sleep(duration / speed_multiplier)
-
-def find_and_activate_ivanti_window():
-    """Find Ivanti window and bring it to the front"""
-    def enum_windows_proc(hwnd, lParam):
-        if user32.IsWindowVisible(hwnd):
-            length = user32.GetWindowTextLengthW(hwnd)
-            if length > 0:
-                buffer = ctypes.create_unicode_buffer(length + 1)
-                user32.GetWindowTextW(hwnd, buffer, length + 1)
-                window_title = buffer.value.lower()
-                
-                # Check for Ivanti-related window titles
-                if any(keyword in window_title for keyword in ['ivanti', 'secure access client']):
-                    # Restore window if minimized
-                    user32.ShowWindow(hwnd, SW_RESTORE)
-                    # Bring to front
-                    user32.SetForegroundWindow(hwnd)
-                    # Activate the window
-                    user32.SetActiveWindow(hwnd)
-                    return False  # Stop enumeration
+# Steps run side by side and several of them update the config
+config_lock = threading.RLock()
+# What a run learns, kept in config while it runs and saved once at its end
+LEARNED_KEYS = ["step_history", "last_match"]
+
+def save_config(config_data):
+    """Write config_data to CONFIG_FILE through a temporary file, so a run stopped halfway never
+    leaves a broken one"""
+    temp_path = CONFIG_FILE + ".tmp"
+    with config_lock:
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(config_data, f)
+            os.replace(temp_path, CONFIG_FILE)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+def save_learned():
+    """Save what the run learned into the config as it is in the file now, so settings changed
+    by the setup tool while the run went on are kept"""
+    with config_lock:
+        learned = {key: config[key] for key in LEARNED_KEYS if key in config}
+    try:
+        save_config({**load_config(), **learned})
+    except OSError:
+        pass  # A read-only folder only loses what was learned
+
+def dump_flight_recorder(reason):
+    """Write the flight recorder to its log file, True when that worked"""
+    try:
+        flight_recorder.dump(reason)
         return True
+    except OSError:
+        return False
+
+def write_run_log(lines):
+    """Print the summary of a finished run and write it to RUN_LOG_FILE, replacing the previous
+    one"""
+    text = "\n".join(lines)
+    print(text)
+    try:
+        with open(RUN_LOG_FILE, "w", encoding="utf-8") as f:
+            f.write(time.strftime("VPN KUL connector run of %Y-%m-%d %H:%M:%S\n") + text + "\n")
+    except OSError:
+        pass  # A read-only folder only loses the summary
+
+def fail(message):
+    """Show an error dialog and stop, leaving the recorded events of the run in a log file"""
+    # The other steps stop where they are, instead of working on the desktop behind the dialog
+    run_failed.set()
+    cancellation.cancel()
+    flight_recorder.record("failure", message=message)
+    if dump_flight_recorder("failure: " + message.splitlines()[0]):
+        message += f"\n\nDetails were written to {os.path.abspath(flight_recorder.LOG_FILE)}."
+    backend.message_box(message, "VPN Login Error")
+    sys.exit(1)
+
+def wait_for(condition, step, events=True, **options):
+    """Wait until condition holds, at most the timeout learned for step, and add how long it
+    took to the step history. events is whether window events can change the condition, other
+    options are passed on to ui_wait.wait_until"""
+    with config_lock:
+        history = config.setdefault("step_history", {})
+        timeout, poll = step_timing.step_timeout(history, step, speed_multiplier), step_timing.poll_interval(history, step)
+    start = time.monotonic()
+    with chrome_trace.span(f"wait {step}", "wait", timeout=round(timeout, 3), poll=round(poll, 3)) as attributes:
+        # Window events wake the wait up early, the poll is the fallback for what they miss. A
+        # condition on the screen or the network only polls, every window event would be a
+        # wasted check
+        with windows.window_events() if events else contextlib.nullcontext(cancellation.sleep) as sleep:
+            result = ui_wait.wait_until(condition, timeout, poll, sleep=sleep, **options)
+            grace = step_timing.late_grace(step, timeout)
+            if not result and grace:
+                # Slower than the timeout allows for, give it a bit longer and learn how long it took
+                result = ui_wait.wait_until(condition, grace, poll, sleep=sleep, **options)
+                attributes["late"] = bool(result)
+                flight_recorder.record("late wait", step, ready=bool(result))
+        attributes["ready"] = bool(result)
+    # Only successful waits are learned from, also late ones, see step_timing.record
+    if result:
+        with config_lock:
+            step_timing.record(history, step, time.monotonic() - start)
+    return result
+
+def image_recognition():
+    """The recognition module, imported on first use
 
-    # Define the callback function type
-    EnumWindowsProc = ctypes.WINFUNCTYPE(ctypes.c_bool, wintypes.HWND, wintypes.LPARAM)
-    
-    # Enumerate all windows
-    user32.EnumWindows(EnumWindowsProc(enum_windows_proc), 0)
+    numpy and PIL are the slowest part of the startup, and the login flow only needs them once
+    the browser is already opening.
+    """
+    import image_matcher
+    import recognition
+    image_matcher.set_capture(backend.capture)
+    return recognition
 
-def press_connect_button():
+def match_thresholds():
+    """Threshold table with the user's overrides from the config applied"""
+    return {**image_recognition().MATCH_THRESHOLDS, **config.get("match_thresholds", {})}
+
+def template_scales():
+    """Scales of the template variants to try, the one for the current display first"""
+    return display_scale.scale_order(display.scale(), config.get("template_scale", 1.0))
+
+def locate_ivanti_window(ivanti_rect=None):
+    """Find the Ivanti window on screen, trying the last known location before any template search
+
+    Returns (match, screen, region). When nothing passes its threshold, match is the closest
+    miss (or None) and screen and region are None.
+    """
+    return image_recognition().locate_ivanti_window(ASSETS_FOLDER, template_scales(), match_thresholds(), ivanti_rect,
+                                                    config.get("last_match"), pyramid=config.get("match_pyramid_factor", 4),
+                                                    workers=config.get("match_workers", 4))
+
+def press_connect_button(ivanti_rect=None):
     method = config["button_press_method"]
 
     if method in ("image_recognition", "both_image_first"):
-        ivanti_window = None
-    
-        # Start with highest confidence and work down
-        for image in ["full_ivanti1.png","full_ivanti2.png","A_zone.png","I_zone.png"]:
-            for confidence in [0.99, 0.85, 0.7, 0.55]:
-                try:
-                    ivanti_window = pyautogui.locateOnScreen(os.path.join(ASSETS_FOLDER, image), confidence=confidence)
-                    if ivanti_window:
-                        break
-                except pyautogui.ImageNotFoundException:
-                    continue
-                except Exception:
-                    pass
-
-            # If we found a button, click it
-            if ivanti_window:
-                rel_x = config.get("img_rel_x")
-                rel_y = config.get("img_rel_y")
-                connect_button_x = ivanti_window.left + int(ivanti_window.width * rel_x)
-                connect_button_y = ivanti_window.top + int(ivanti_window.height * rel_y)
-                pyautogui.click(connect_button_x, connect_button_y)
-                return
-            
+        # Every template is scored once against one capture and held to its own threshold,
+        # concurrently, and the first one that passes stops the search
+        ivanti_window, screen, region = locate_ivanti_window(ivanti_rect)
+        if ivanti_window and ivanti_window.found:
+            # Remember where Ivanti was, so next run can click without searching
+            import image_matcher
+            last_match = image_matcher.remember_match(ivanti_window, screen, region)
+            config["last_match"] = last_match
+
+        # If we found a button, click it
+        if ivanti_window and ivanti_window.found:
+            rel_x = config.get("img_rel_x")
+            rel_y = config.get("img_rel_y")
+            connect_button_x = ivanti_window.left + int(ivanti_window.width * rel_x)
+            connect_button_y = ivanti_window.top + int(ivanti_window.height * rel_y)
+            backend.click(connect_button_x, connect_button_y)
+            return
+
         if method == "both_image_first":
-            pyautogui.click(config["manual_x"], config["manual_y"])
+            backend.click(config["manual_x"], config["manual_y"])
             return
         else:
-            ctypes.windll.user32.MessageBoxW(0,"Failed to find the connect button.\nMake sure the whole window is visible and B-zone is selected." , "VPN Login Error", 0x10)
-            sys.exit(1)
+            closest = ""
+            if ivanti_window:
+                closest = f"\n\nClosest match: {ivanti_window.template} at {ivanti_window.scale:.0%} scored {ivanti_window.score:.2f} (needs {ivanti_window.threshold:.2f})."
+            fail("Failed to find the connect button.\nMake sure the whole window is visible and B-zone is selected." + closest)
                 
     elif method == "manual_coordinates":
-        pyautogui.click(config["manual_x"], config["manual_y"])
+        backend.click(config["manual_x"], config["manual_y"])
 
-def check_if_logged_in():
+def check_if_logged_in(browser=None):
     '''Check if when the vpn page is loaded, the user is logged in.'''
-    login = None
-    for login_image in ["login_page_top1.png","login_page_middle1.png","login_page_middle2.png","login_page_bottom2.png"]:
+    recognition = image_recognition()
+    thresholds, scale = match_thresholds(), template_scales()[0]
+    # A logged out user gets the login page instead of the VPN page. The wait ends as soon as
+    # browser is named after the VPN page, without that title a logged in user waits it out
+    vpn_page_loaded = ui_wait.title_contains(windows, browser, VPN_PAGE_TITLE) if browser else lambda: False
+
+    def login_or_vpn_page():
+        if vpn_page_loaded():
+            return "vpn_page"
+        return recognition.find_login_page(ASSETS_FOLDER, scale, thresholds, pyramid=config.get("match_pyramid_factor", 4),
+                                           workers=config.get("match_workers", 4))
+
+    page = wait_for(login_or_vpn_page, "login_page", events=False)
+    if page and page != "vpn_page":
+        fail("Please log into toledo or KUL services and try again.")
+
+# Steps of the login flow, each called with the results of the steps before it
+
+def open_vpn_page(results):
+    """Open the VPN page and return the window that had the focus before, with its title"""
+    before = windows.foreground_window()
+    before_title = windows.title(before) if before else ""
+    with chrome_trace.span("open_url", url="https://vpn.kuleuven.be"):
+        backend.open_url("https://vpn.kuleuven.be")
+    return before, before_title
+
+def wait_for_browser(results):
+    """Wait until the browser shows the VPN page. A cold browser takes seconds to start and
+    would take the focus from Ivanti when it shows up after Ivanti was brought to the front"""
+    return wait_for(ui_wait.page_shown(windows, *results["open_vpn_page"]), "browser_window")
+
+def fetch_password(results):
+    """The password, None when it is missing. The step has a timeout and a retry, so it shows no
+    dialog itself: enter_credentials does"""
+    return backend.get_password(SERVICE_NAME, USERNAME)
+
+def launch_ivanti(results):
+    with chrome_trace.span("launch", path=ivanti_path):
+        backend.launch(ivanti_path)
+
+def wait_for_ivanti_window(results):
+    return wait_for(lambda: window_discovery.find_ivanti_window(windows), "ivanti_window")
+
+def activate_ivanti(results):
+    """Bring Ivanti to the front and return its bounds, None when its window never showed up"""
+    hwnd = results["ivanti_window"]
+    if not hwnd:
+        return None
+    ivanti_rect = window_discovery.activate_window(windows, hwnd)
+    wait_for(ui_wait.window_is_foreground(windows, hwnd), "ivanti_foreground")
+    return ivanti_rect
+
+def focus_ivanti(hwnd):
+    """Give the Ivanti window hwnd the focus before keys are sent to it, a program that started
+    late (like a cold browser) can have taken it"""
+    if windows.foreground_window() == hwnd:
+        return
+    window_discovery.activate_window(windows, hwnd)
+    if not wait_for(ui_wait.window_is_foreground(windows, hwnd), "ivanti_foreground"):
+        fail("Could not bring Ivanti's dialog to the front.\nPlease close the windows on top of it and try again.")
+
+def click_connect(results):
+    """Click Ivanti's connect button and return the dialog it asks the credentials in"""
+    original_pos = backend.position()
+    backend.move_to(0, 1)   # Move out of the way, to not interfere with image recognition
+    press_connect_button(results["activate_ivanti"])
+    backend.move_to(original_pos)
+    # Ivanti asks for the credentials in a dialog of its own. Any other window that takes the
+    # focus is not it, and the credentials are never typed into one
+    credentials_prompt = wait_for(ui_wait.ivanti_dialog(windows, results["ivanti_window"]), "credentials_prompt")
+    if not credentials_prompt:
+        fail("Ivanti did not ask for the credentials after clicking connect.\nMake sure the whole window is visible and B-zone is selected.")
+    return credentials_prompt
+
+def enter_credentials(results):
+    """Type the credentials into Ivanti's credentials prompt and return that dialog"""
+    if not results["password"]:
+        fail("Missing VPN credentials.\nPlease run the setup tool to configure them.")
+    credentials_prompt = results["click_connect"]
+    focus_ivanti(credentials_prompt)
+    # Only the lengths are traced, a trace file gets passed around
+    with chrome_trace.span("type credentials", username=len(USERNAME), password=len(results["password"])):
         try:
-            login = pyautogui.locateOnScreen(os.path.join(ASSETS_FOLDER, login_image), confidence=0.8)
-        except Exception:
-            continue
-        if login:
-            ctypes.windll.user32.MessageBoxW(0, "Please log into toledo or KUL services and try again.", "VPN Login Error", 0x10)
-            sys.exit(1)
+            backend.type_text(f"{USERNAME}\t{results['password']}\n")
+        except OSError as error:
+            # Windows drops typed keys when the dialog runs with more rights than the connector
+            fail(f"Could not type the credentials into the Ivanti dialog.\n{error}")
+    return credentials_prompt
 
-def start_esc_interrupt():
-    def on_press(key):
-        if key == kb.Key.esc:
-            _thread.interrupt_main()
-    listener = kb.Listener(on_press=on_press)
-    listener.daemon = True
-    listener.start()
+def confirm_login(results):
+    # Closing the credentials prompt hands the focus back to Ivanti's main window first
+    confirm_prompt = wait_for(ui_wait.ivanti_dialog(windows, results["enter_credentials"], results["ivanti_window"]),
+                              "confirm_prompt") or results["ivanti_window"]
+    if not confirm_prompt:
+        fail("Ivanti did not ask to confirm the login.\nPlease try again.")
+    focus_ivanti(confirm_prompt)
+    backend.press('enter')  # Confirm login
+    # The dialog closes once the tunnel is being set up. Without a dialog Ivanti's main window
+    # has the focus, which stays open
+    if confirm_prompt != results["ivanti_window"]:
+        wait_for(ui_wait.window_closed(windows, confirm_prompt), "confirm_closed")
 
+def wait_for_tunnel(results):
+    """Wait until the tunnel is up and return whether it is. Without a probe in the config the
+    tunnel gets a fixed time, and None is returned"""
+    if tunnel_up is None:
+        # The confirm dialog closes before the tunnel carries traffic
+        cancellation.sleep(config.get("tunnel_wait", TUNNEL_WAIT) / speed_multiplier)
+        return None
+    return bool(wait_for(tunnel_up, "tunnel_up", events=False, backoff=tunnel_probe.BACKOFF, max_poll=tunnel_probe.MAX_POLL))
 
-if __name__ == "__main__":
+def open_extra_site(results):
+    before_browser = windows.foreground_window()
+    with chrome_trace.span("open_url", url='https://uafw.icts.kuleuven.be'):
+        backend.open_url('https://uafw.icts.kuleuven.be')
+    wait_for(ui_wait.foreground_changed(windows, before_browser), "browser_tab")
 
-    start_esc_interrupt()
-    try:
-        SERVICE_NAME = "kuleuvenvpn"
-        ENV_FILE = ".env"
-        CONFIG_FILE = "vpn_config.json"
-        ASSETS_FOLDER = resource_path("assets_connector")
+def close_tabs(results):
+    if config.get("close_tabs", True):
+        backend.hotkey('ctrl', 'w')
+        backend.hotkey('ctrl', 'w')
+
+def close_ivanti(results):
+    if config.get("close_ivanti", True):
+        # The window found earlier, unless it was replaced since
+        hwnd = window_discovery.find_ivanti_window(windows)
+        if hwnd:
+            with chrome_trace.span("close ivanti"):
+                windows.close(hwnd)
+                wait_for(ui_wait.window_closed(windows, hwnd), "ivanti_closed")
+
+def connector_steps():
+    """Step graph of the login flow
+
+    The VPN page, the password and Ivanti start side by side. Ivanti is only brought to the
+    front once the browser window is up and its page is checked, so the browser does not cover
+    it again.
+    """
+    Step = step_graph.Step
+    return [
+        Step("open_vpn_page", open_vpn_page),
+        Step("password", fetch_password, timeout=10, retries=1, retry_delay=0.5),
+        Step("launch_ivanti", launch_ivanti),
+        Step("browser_window", wait_for_browser, after=["open_vpn_page"]),
+        Step("check_logged_in", lambda results: check_if_logged_in(results["browser_window"]), after=["browser_window"]),
+        Step("ivanti_window", wait_for_ivanti_window, after=["launch_ivanti"]),
+        Step("activate_ivanti", activate_ivanti, after=["ivanti_window", "check_logged_in"]),
+        Step("click_connect", click_connect, after=["activate_ivanti"]),
+        Step("enter_credentials", enter_credentials, after=["click_connect", "password"]),
+        Step("confirm_login", confirm_login, after=["enter_credentials"]),
+        Step("tunnel_up", wait_for_tunnel, after=["confirm_login"]),
+        Step("open_extra_site", open_extra_site, after=["tunnel_up"]),
+        Step("close_tabs", close_tabs, after=["open_extra_site"]),
+        Step("close_ivanti", close_ivanti, after=["close_tabs"]),
+    ]
+
+# Set while a run is going, ESC only interrupts runs and not a resident agent waiting for one
+run_active = threading.Event()
+# Set when fail() stopped the run, the steps it cancelled then did not stop for ESC
+run_failed = threading.Event()
+
+def stop_run():
+    """ESC: stop the steps where they are, their waits and input actions check for it, and
+    interrupt the main thread that waits for them"""
+    if run_active.is_set():
+        cancellation.cancel()
+        _thread.interrupt_main()
 
-        config = load_config()
+def start(platform=None):
+    """Set up platform, the Windows desktop unless another backend is given, once per process"""
+    global backend, windows, display
+    backend = input_pacing.PacedInput(platform or platform_backend.Win32Backend())
+    windows, display = backend.windows, backend.display
+    backend.listen_for_escape(stop_run)
 
-        # Windows API constants
-        SW_RESTORE = 9
-        SW_SHOW = 5
+def warm_up():
+    """Load what a run needs before it is triggered: the input library and the image
+    recognition with the templates for this display"""
+    backend.position()
+    image_recognition().preload(ASSETS_FOLDER, template_scales()[0])
 
-        # Windows API functions
-        user32 = ctypes.windll.user32
-        kernel32 = ctypes.windll.kernel32
+def connect(argv):
+    """Log into the VPN once and return the finished step_graph.Run"""
+    global config, USERNAME, ivanti_path, speed_multiplier, tunnel_up
 
+    # --trace or --trace=<file> writes a Chrome trace of the run, for chrome://tracing or ui.perfetto.dev
+    trace_path = None
+    for arg in argv:
+        if arg == "--trace" or arg.startswith("--trace="):
+            trace_path = arg.partition("=")[2] or time.strftime("vpn_kul_trace_%Y%m%d_%H%M%S.json")
+            chrome_trace.enable()
+
+    cancellation.reset()
+    run_failed.clear()
+    config = load_config()
+    run_active.set()
+    try:
         USERNAME = load_username()
         ivanti_path = config.get("ivanti_path", r"C:\ProgramData\Microsoft\Windows\Start Menu\Programs\Pulse Secure\Ivanti Secure Access Client.lnk")
         speed_multiplier = config.get("speed_multiplier", 1.0)
+        backend.configure(config.get("input_delays"), speed_multiplier)
+        flight_recorder.record("run", method=config["button_press_method"], speed_multiplier=speed_multiplier,
+                               argv=argv)
 
-        # Check if nessecary information is available
-        if USERNAME:
-            PASSWORD = keyring.get_password(SERVICE_NAME, USERNAME)
-        else:
-            PASSWORD = None
-
-        if not USERNAME or not PASSWORD:
-            ctypes.windll.user32.MessageBoxW(0, "Missing VPN credentials.\nPlease run the setup tool to configure them.", "VPN Login Error", 0x10)
-            sys.exit(1)
+        # Check if nessecary information is available before touching the desktop. This only
+        # looks the password up, it is fetched by a step while the browser and Ivanti start
+        if not USERNAME or not backend.has_password(SERVICE_NAME, USERNAME):
+            fail("Missing VPN credentials.\nPlease run the setup tool to configure them.")
 
         # Check for valid manual coordinates when required
         if config["button_press_method"] in ["manual_coordinates", "both_image_first"]:
             if not config["manual_x"] or not config["manual_y"]:
-                ctypes.windll.user32.MessageBoxW(0, "Missing or invalid manual click coordinates.\nPlease run the setup tool to configure the click coordinates.", "VPN Login Error", 0x10)
-                sys.exit(1)
+                fail("Missing or invalid manual click coordinates.\nPlease run the setup tool to configure the click coordinates.")
+
+        # Made before the login, a route probe compares with how traffic went before the tunnel
+        try:
+            tunnel_up = tunnel_probe.from_config(config.get("tunnel_probe"))
+        except ValueError as error:
+            fail(f"Invalid \"tunnel_probe\" in {CONFIG_FILE}: {error}.")
 
         # Start up actual login process
-        # Open KU Leuven VPN page and Ivanti
-        webbrowser.open("https://vpn.kuleuven.be")
-        adjusted_sleep(1)
-        check_if_logged_in()
-        os.startfile(ivanti_path)
-        time.sleep(1)
-        find_and_activate_ivanti_window()
-        adjusted_sleep(0.5)
-        
-        original_pos = pyautogui.position()
-        pyautogui.moveTo(0, 1)   # Move out of the way, to not interfere with image recognition
-        press_connect_button()
-        pyautogui.moveTo(original_pos)
-        adjusted_sleep(2)
-        
-
-        # Fill in credentials
-        pyautogui.write(USERNAME)
-        pyautogui.press('tab')
-        pyautogui.write(PASSWORD)
-        pyautogui.press('enter')
-        adjusted_sleep(1.5)
-        pyautogui.press('enter')  # Confirm login
-        adjusted_sleep(6)
-
-        # Open extra site
-        webbrowser.open('https://uafw.icts.kuleuven.be')
-        adjusted_sleep(3)
-
-        # Close tabs and Ivanti if requested
-        if config.get("close_tabs", True):
-            pyautogui.hotkey('ctrl', 'w')
-            pyautogui.hotkey('ctrl', 'w')
-
-        if config.get("close_ivanti", True):
-            os.system('powershell -command "(Get-Process | Where-Object {$_.MainWindowTitle -like \'*Ivanti*\'}) | ForEach-Object { $_.CloseMainWindow() }"')
+        run = step_graph.run(connector_steps())
+        flight_recorder.record("input delays", seconds=round(backend.total, 3), actions=backend.actions)
+        report = run.report()
+        chrome_trace.annotate("critical_path", report.splitlines())
+        write_run_log([report, f"Input delays: {backend.total:.2f} s over {backend.actions} input actions"])
+        return run
     except(KeyboardInterrupt):
+            if run_failed.is_set():
+                sys.exit(1)  # A cancelled step stopped first, the failing one shows the error
+            dump_flight_recorder("stopped by user (ESC)")
             try:
-                ctypes.windll.user32.MessageBoxW(0, "Execution stopped by user (ESC).", "VPN KUL Connector", 0x30)
+                backend.message_box("Execution stopped by user (ESC).", "VPN KUL Connector", platform_backend.MB_ICONWARNING)
             except Exception:
                 pass
-            sys.exit(1)
\ No newline at end of file
+            sys.exit(1)
+    except Exception as error:
+        cancellation.cancel()
+        dump_flight_recorder(f"unexpected error: {error!r}")
+        raise
+    finally:
+        # Also what failed runs learned, their successful waits took as long as in any other run
+        save_learned()
+        run_active.clear()
+        # Also when the run failed or was stopped, those are the runs worth looking at
+        if trace_path:
+            chrome_trace.write(trace_path)
+
+def run_resident(argv):
+    """Stay loaded and connect whenever the hotkey is pressed or vpn_kul --trigger is run,
+    until vpn_kul --stop. Returns the stopped agent"""
+    global config
+    config = load_config()
+    try:
+        agent = resident_agent.Agent(lambda: connect(argv), config.get("agent_port", resident_agent.DEFAULT_PORT))
+    except OSError:
+        fail("The connector is already running in the background.\nPress its hotkey or run vpn_kul --trigger to connect.")
+    backend.listen_for_hotkey(config.get("agent_hotkey", resident_agent.DEFAULT_HOTKEY), lambda: agent.trigger("hotkey"))
+    warm_up()
+    agent.run()
+    return agent
+
+def main(argv, platform=None):
+    """Log into the VPN on platform, the Windows desktop unless another backend is given, and
+    return the finished step_graph.Run
+
+    --resident keeps the connector loaded instead, see run_resident. --trigger hands the login
+    to that resident connector and only logs in itself when none is running, --stop ends it.
+    """
+    for arg, command in [("--trigger", resident_agent.CONNECT), ("--stop", resident_agent.STOP)]:
+        if arg in argv:
+            port = load_config().get("agent_port", resident_agent.DEFAULT_PORT)
+            reply = resident_agent.send(command, port)
+            if reply or command == resident_agent.STOP:
+                print(reply or "No connector is running in the background")
+                return None
+
+    start(platform)
+    if "--resident" in argv:
+        return run_resident(argv)
+    return connect(argv)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -8,22 +8,17 @@ from pynput import mouse
 
 import os
 import json
-import time
 import sys
 
-import ctypes
-from ctypes import wintypes
 import re
 
+import step_timing
+import ui_wait
+import window_discovery
 from translations import translations
 
-# Windows API constants
-SW_RESTORE = 9
-SW_SHOW = 5
-
-# Windows API functions
-user32 = ctypes.windll.user32
-kernel32 = ctypes.windll.kernel32
+# Seconds Ivanti gets to open its window when setting the manual click position
+IVANTI_START_TIMEOUT = 10
 
 def resource_path(relative_path):
     """Get correct path, works both in development and PyInstaller"""
@@ -36,6 +31,8 @@ def resource_path(relative_path):
 ENV_FILE = ".env"
 SERVICE_NAME = "kuleuvenvpn"
 CONFIG_FILE = "vpn_config.json"
+# Settings the connector learns by itself, see save_config
+LEARNED_KEYS = ["step_history", "last_match"]
 ASSETS_FOLDER = resource_path("assets_settings")
 
 def load_config():
@@ -50,12 +47,20 @@ def load_config():
         "ivanti_path": r"C:\ProgramData\Microsoft\Windows\Start Menu\Programs\Pulse Secure\Ivanti Secure Access Client.lnk",
         "img_rel_x": 0.826,
         "img_rel_y": 0.415,
+        "last_match": None,
+        "match_thresholds": {},
+        "match_pyramid_factor": 4,
+        "match_workers": 4,
+        "template_scale": 1.0,
+        "step_history": {},
+        "input_delays": {},
+        "tunnel_probe": None,
+        "tunnel_wait": 6,
         "language": "en"
     }
     
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            loaded_config = json.load(f)
+    loaded_config = read_config_file()
+    if loaded_config is not None:
         # Update loaded config with any missing keys from default config
         for key, value in default_config.items():
             if key not in loaded_config:
@@ -63,10 +68,33 @@ def load_config():
         return loaded_config
     return default_config
 
-def save_config(config_data):
-    """Save configuration to file"""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config_data, f)
+def read_config_file():
+    """The configuration in the file, None when there is none or it can not be read"""
+    if not os.path.exists(CONFIG_FILE):
+        return None
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            loaded_config = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return loaded_config if isinstance(loaded_config, dict) else None
+
+def save_config(config_data, keep=LEARNED_KEYS):
+    """Save configuration to file through a temporary file
+
+    The connector learns the step history and last match while it runs, for the keys in keep
+    the values in the file win over ours, which may be from before those runs.
+    """
+    config_data.update({key: value for key, value in (read_config_file() or {}).items() if key in keep})
+    temp_path = CONFIG_FILE + ".tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(config_data, f)
+        os.replace(temp_path, CONFIG_FILE)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 # Load initial configuration
 config = load_config()
@@ -128,26 +156,6 @@ def delete_credentials():
         os.remove(ENV_FILE)
     messagebox.showinfo(get_translation("deleted"), get_translation("login_deleted"))
 
-def find_and_activate_ivanti_window():
-    """Find Ivanti window and bring it to the front"""
-    def enum_windows_proc(hwnd, lParam):
-        if user32.IsWindowVisible(hwnd):
-            length = user32.GetWindowTextLengthW(hwnd)
-            if length > 0:
-                buffer = ctypes.create_unicode_buffer(length + 1)
-                user32.GetWindowTextW(hwnd, buffer, length + 1)
-                window_title = buffer.value.lower()
-                
-                if any(keyword in window_title for keyword in ['ivanti', 'secure access client']):
-                    user32.ShowWindow(hwnd, SW_RESTORE)
-                    user32.SetForegroundWindow(hwnd)
-                    user32.SetActiveWindow(hwnd)
-                    return False
-        return True
-
-    EnumWindowsProc = ctypes.WINFUNCTYPE(ctypes.c_bool, wintypes.HWND, wintypes.LPARAM)
-    user32.EnumWindows(EnumWindowsProc(enum_windows_proc), 0)
-
 def toggle_password_visibility(event):
     """Toggle password visibility"""
     if password_entry.cget('show') == '':
@@ -419,6 +427,34 @@ def show_options_menu():
 
     speed_slider.bind("<Motion>", update_speed_label)
 
+    # Learned timing per step
+    timing_frame = ttk.LabelFrame(scrollable_frame, text=get_translation("learned_timing"), padding=10, style= "Custom.TLabelframe")
+    timing_frame.pack(fill="x", padx=10, pady=10)
+
+    timing_labels = {}
+    for step in step_timing.DEFAULT_TIMEOUTS:
+        if step in step_timing.FIXED_STEPS:
+            continue
+        timing_labels[step] = ttk.Label(timing_frame)
+        timing_labels[step].pack(anchor="w")
+
+    def update_timing_labels():
+        history = config.get("step_history", {})
+        for step, label in timing_labels.items():
+            runs = len(history.get(step, []))
+            timeout = step_timing.step_timeout(history, step, config["speed_multiplier"])
+            learned = get_translation("learned") if step_timing.learned_duration(history, step) is not None else get_translation("default")
+            label.config(text=f"{get_translation('step_' + step)}: {timeout:.1f} s ({learned}, {runs} {get_translation('runs')})")
+
+    def reset_timing():
+        if messagebox.askyesno(get_translation("confirmation"), get_translation("reset_timing_confirm")):
+            config["step_history"] = {}
+            save_config(config, keep=["last_match"])
+            update_timing_labels()
+
+    update_timing_labels()
+    ttk.Button(timing_frame, text=get_translation("reset_timing"), command=reset_timing).pack(anchor="w", pady=(5, 0))
+
     # Closing Options
     closing_frame = ttk.LabelFrame(scrollable_frame, text=get_translation("closing_options"), padding=10, style= "Custom.TLabelframe")
     closing_frame.pack(fill="x", padx=10, pady=10)
@@ -550,11 +586,13 @@ def show_manual_click_menu():
         # Open Ivanti Secure Access
         ivanti_path = config.get("ivanti_path", r"C:\ProgramData\Microsoft\Windows\Start Menu\Programs\Pulse Secure\Ivanti Secure Access Client.lnk")
         os.startfile(ivanti_path)
-        time.sleep(1.2)  # Wait for Ivanti to open
         
-        # Find and activate Ivanti window
-        find_and_activate_ivanti_window()
-        time.sleep(0.5)  # Give it a moment to come to front
+        # Wait for the Ivanti window and bring it to the front
+        with windows.window_events() as sleep:
+            hwnd = ui_wait.wait_until(lambda: window_discovery.find_ivanti_window(windows), IVANTI_START_TIMEOUT, sleep=sleep)
+            if hwnd:
+                window_discovery.activate_window(windows, hwnd)
+                ui_wait.wait_until(ui_wait.window_is_foreground(windows, hwnd), 1, sleep=sleep)
         
         start_button.config(state=tk.DISABLED)
         position_label.config(text=get_translation("click_desired_position"))
@@ -593,40 +631,7 @@ def load_username():
                     return line.strip().split("=", 1)[1]
     return ""
 
-# Windows API constants
-SW_RESTORE = 9
-SW_SHOW = 5
-
-# Windows API functions
-user32 = ctypes.windll.user32
-kernel32 = ctypes.windll.kernel32
-
-def find_and_activate_ivanti_window():
-    """Find Ivanti window and bring it to the front"""
-    def enum_windows_proc(hwnd, lParam):
-        if user32.IsWindowVisible(hwnd):
-            length = user32.GetWindowTextLengthW(hwnd)
-            if length > 0:
-                buffer = ctypes.create_unicode_buffer(length + 1)
-                user32.GetWindowTextW(hwnd, buffer, length + 1)
-                window_title = buffer.value.lower()
-                
-                # Check for Ivanti-related window titles
-                if any(keyword in window_title for keyword in ['ivanti', 'secure access client']):
-                    # Restore window if minimized
-                    user32.ShowWindow(hwnd, SW_RESTORE)
-                    # Bring to front
-                    user32.SetForegroundWindow(hwnd)
-                    # Activate the window
-                    user32.SetActiveWindow(hwnd)
-                    return False  # Stop enumeration
-        return True
-
-    # Define the callback function type
-    EnumWindowsProc = ctypes.WINFUNCTYPE(ctypes.c_bool, wintypes.HWND, wintypes.LPARAM)
-    
-    # Enumerate all windows
-    user32.EnumWindows(EnumWindowsProc(enum_windows_proc), 0)
+windows = window_discovery.Win32Windows()
 
 # Setup window
 screen_width,screen_height = pyautogui.size()
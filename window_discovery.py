@@ -0,0 +1,232 @@
+import contextlib
+import ctypes
+import functools
+import threading
+import time
+from ctypes import wintypes
+
+import cancellation
+import flight_recorder
+
+# Windows API constants
+SW_RESTORE = 9
+WM_CLOSE = 0x0010
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_OBJECT_CREATE = 0x8000
+EVENT_OBJECT_DESTROY = 0x8001
+EVENT_OBJECT_HIDE = 0x8003
+EVENT_OBJECT_NAMECHANGE = 0x800C
+OBJID_WINDOW = 0
+CHILDID_SELF = 0
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+QS_ALLINPUT = 0x04FF
+PM_REMOVE = 0x0001
+
+IVANTI_KEYWORDS = ['ivanti', 'secure access client']
+
+# Window events that can make a wait condition hold: a window created, destroyed, shown or hidden
+# (one range), renamed or brought to the front
+WINDOW_EVENTS = [(EVENT_OBJECT_CREATE, EVENT_OBJECT_HIDE), (EVENT_OBJECT_NAMECHANGE, EVENT_OBJECT_NAMECHANGE),
+                 (EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND)]
+# Longest title read, longer ones are cut off
+TITLE_LENGTH = 512
+# Seconds an event wait goes without checking whether the run was stopped
+STOP_CHECK = 0.05
+
+# The callback prototypes are built once. Only Windows has WINFUNCTYPE, elsewhere a fake user32
+# calls CFUNCTYPE callbacks
+_FUNCTYPE = getattr(ctypes, "WINFUNCTYPE", ctypes.CFUNCTYPE)
+EnumWindowsProc = _FUNCTYPE(ctypes.c_bool, wintypes.HWND, wintypes.LPARAM)
+WinEventProc = _FUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG, wintypes.LONG,
+                         wintypes.DWORD, wintypes.DWORD)
+
+# Titles last written to the flight recorder, so polling only records changes
+_recorded_titles = None
+# (windows backend, hwnd) of the Ivanti window found last
+_ivanti_window = (None, None)
+
+@functools.lru_cache(maxsize=None)
+def load_user32():
+    """user32 with the function prototypes ctypes can not guess, set up once"""
+    user32 = ctypes.windll.user32
+    user32.SetWinEventHook.restype = wintypes.HANDLE
+    user32.SetWinEventHook.argtypes = [wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WinEventProc,
+                                       wintypes.DWORD, wintypes.DWORD, wintypes.DWORD]
+    user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+    return user32
+
+class Win32Windows:
+    """Window backend on top of user32, or on top of a fake with the same functions"""
+
+    def __init__(self, user32=None):
+        self.user32 = user32 or load_user32()
+        # One callback and one title buffer for every enumeration, guarded by a lock because
+        # steps enumerate from several threads
+        self._lock = threading.Lock()
+        self._found = []
+        self._title = ctypes.create_unicode_buffer(TITLE_LENGTH)
+        self._enum_windows_proc = EnumWindowsProc(self._collect)
+
+    def _collect(self, hwnd, lParam):
+        if self.user32.IsWindowVisible(hwnd):
+            title = self._read_title(hwnd)
+            if title:
+                self._found.append((hwnd, title))
+        return True
+
+    def _read_title(self, hwnd):
+        self.user32.GetWindowTextW(hwnd, self._title, TITLE_LENGTH)
+        return self._title.value
+
+    def visible_windows(self):
+        """Return (hwnd, title) for every visible top-level window with a title"""
+        with self._lock:
+            self._found = []
+            self.user32.EnumWindows(self._enum_windows_proc, 0)
+            return self._found
+
+    def title(self, hwnd):
+        """Return the title of one window"""
+        with self._lock:
+            return self._read_title(hwnd)
+
+    def get_rect(self, hwnd):
+        """Return the window bounds as (left, top, right, bottom) in screen coordinates"""
+        rect = wintypes.RECT()
+        if not self.user32.GetWindowRect(hwnd, ctypes.byref(rect)):
+            return None
+        return rect.left, rect.top, rect.right, rect.bottom
+
+    def foreground_window(self):
+        """Return the hwnd of the window that has the focus"""
+        return self.user32.GetForegroundWindow()
+
+    def exists(self, hwnd):
+        """Whether hwnd still refers to an open window"""
+        return bool(self.user32.IsWindow(hwnd))
+
+    def visible(self, hwnd):
+        """Whether hwnd is an open window that is shown, a tray program hides its window on close"""
+        return bool(self.user32.IsWindowVisible(hwnd))
+
+    def process_id(self, hwnd):
+        """Return the id of the process that owns the window, 0 when it is gone"""
+        process = wintypes.DWORD()
+        self.user32.GetWindowThreadProcessId(hwnd, ctypes.byref(process))
+        return process.value
+
+    def activate(self, hwnd):
+        """Restore the window if minimized and bring it to the front"""
+        self.user32.ShowWindow(hwnd, SW_RESTORE)
+        self.user32.SetForegroundWindow(hwnd)
+        self.user32.SetActiveWindow(hwnd)
+
+    def close(self, hwnd):
+        """Ask a window to close like its close button does, without waiting for it"""
+        return bool(self.user32.PostMessageW(hwnd, WM_CLOSE, 0, 0))
+
+    @contextlib.contextmanager
+    def window_events(self):
+        """Hook WINDOW_EVENTS for the calling thread and yield a sleep(seconds) that returns as
+        soon as one of them happens, so a wait reacts to a window right away instead of at its
+        next poll"""
+        changed = []
+
+        def on_event(hook, event, hwnd, id_object, id_child, thread, event_time):
+            if id_object == OBJID_WINDOW and id_child == CHILDID_SELF:
+                changed.append(event)
+
+        # The callback object has to outlive the hooks
+        callback = WinEventProc(on_event)
+        hooks = [self.user32.SetWinEventHook(low, high, None, callback, 0, 0, WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS)
+                 for low, high in WINDOW_EVENTS]
+
+        def sleep(seconds):
+            # Out-of-context events are delivered while this thread pumps its messages
+            deadline = time.monotonic() + seconds
+            changed.clear()
+            message = wintypes.MSG()
+            while not changed and not cancellation.cancelled():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # In short slices, so a stopped run is noticed quickly
+                remaining = min(remaining, STOP_CHECK)
+                self.user32.MsgWaitForMultipleObjects(0, None, False, max(1, int(remaining * 1000)), QS_ALLINPUT)
+                while self.user32.PeekMessageW(ctypes.byref(message), None, 0, 0, PM_REMOVE):
+                    self.user32.TranslateMessage(ctypes.byref(message))
+                    self.user32.DispatchMessageW(ctypes.byref(message))
+
+        try:
+            yield sleep
+        finally:
+            for hook in hooks:
+                if hook:
+                    self.user32.UnhookWinEvent(hook)
+
+def matches(title, keywords):
+    return any(keyword in title.lower() for keyword in keywords)
+
+def find_window(windows, keywords):
+    """Return the hwnd of the first visible window whose title contains one of keywords, or None"""
+    global _recorded_titles
+    visible = windows.visible_windows()
+    titles = [title for _, title in visible]
+    if titles != _recorded_titles:
+        _recorded_titles = titles
+        flight_recorder.record("windows", titles=titles)
+    for hwnd, title in visible:
+        if matches(title, keywords):
+            return hwnd
+    return None
+
+def find_ivanti_window(windows):
+    """Return the hwnd of the first window with an Ivanti-related title, or None
+
+    The window found last is checked first and only when it is gone or hidden (or its handle now
+    belongs to another window) are all windows walked again.
+    """
+    global _ivanti_window
+    cached_windows, hwnd = _ivanti_window
+    if cached_windows is windows and windows.visible(hwnd) and matches(windows.title(hwnd), IVANTI_KEYWORDS):
+        return hwnd
+    hwnd = find_window(windows, IVANTI_KEYWORDS)
+    _ivanti_window = (windows, hwnd) if hwnd else (None, None)
+    return hwnd
+
+def find_ivanti_dialog(windows, hwnds=()):
+    """Return the hwnd of a visible window other than hwnds that belongs to Ivanti's process, like
+    its credentials prompt, the one with the focus first. None when Ivanti shows none
+
+    Dialogs have titles of their own ("Connect to: ..."), so they are told apart from a browser
+    or any other program that takes the focus by the process that owns them.
+    """
+    ivanti = find_ivanti_window(windows)
+    process = ivanti and windows.process_id(ivanti)
+    if not process:
+        return None
+    dialogs = [hwnd for hwnd, _ in windows.visible_windows() if hwnd not in hwnds and windows.process_id(hwnd) == process]
+    foreground = windows.foreground_window()
+    if foreground in dialogs:
+        return foreground
+    return dialogs[0] if dialogs else None
+
+def belongs_to_ivanti(windows, hwnd):
+    """Whether hwnd is Ivanti's: it has an Ivanti title or the same process as Ivanti's window"""
+    if matches(windows.title(hwnd), IVANTI_KEYWORDS):
+        return True
+    ivanti = find_ivanti_window(windows)
+    return bool(ivanti) and windows.process_id(hwnd) == windows.process_id(ivanti)
+
+def activate_window(windows, hwnd):
+    """Bring a window to the front and return its bounds"""
+    windows.activate(hwnd)
+    return windows.get_rect(hwnd)
+
+def find_and_activate_ivanti_window(windows):
+    """Find Ivanti window, bring it to the front and return its bounds (None when not found)"""
+    hwnd = find_ivanti_window(windows)
+    if hwnd is None:
+        return None
+    return activate_window(windows, hwnd)